@@ -0,0 +1,51 @@
+"""Startup latency of the dorsal-ronflex command.
+
+Times `--help` (argument parsing only) and, when an ABF file is given,
+the analysis of that single file, each in a fresh interpreter.
+
+    python benchmarks/startup.py [ABF_FILE] [--runs N]
+"""
+
+import json
+import subprocess
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List
+
+_COMMAND = [sys.executable, "-m", "dorsal_ronflex.main"]
+
+
+def time_command(arguments: List[str], runs: int) -> Dict[str, float]:
+    """Median and best wall time of a dorsal-ronflex call, in seconds."""
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([*_COMMAND, *arguments], check=True, capture_output=True)
+        timings.append(perf_counter() - start)
+    return {"median": median(timings), "best": min(timings)}
+
+
+def measure_startup(abf_file: Path | None, runs: int) -> Dict[str, Dict[str, float]]:
+    """Latency of --help and of a single file analysis."""
+    report = {"help": time_command(["--help"], runs)}
+    if abf_file is not None:
+        with TemporaryDirectory() as output:
+            report["single_file"] = time_command([str(abf_file), "-o", output], runs)
+    return report
+
+
+def main() -> None:
+    """Prints the startup report as JSON."""
+    parser = ArgumentParser(description="dorsal-ronflex startup benchmark")
+    parser.add_argument("abf_file", nargs="?", type=Path, default=None)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(measure_startup(args.abf_file, args.runs), indent=4))
+
+
+if __name__ == "__main__":
+    main()
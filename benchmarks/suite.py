@@ -0,0 +1,279 @@
+"""Per-stage throughput and peak memory of the analysis.
+
+Synthetic studies of 10, 100 and 1000 sweeps are written as ABF files,
+then every stage of the pipeline is timed (best of --repeats runs) and
+measured with tracemalloc (in a separate run, after a warm-up). Times are also divided
+by the time of a fixed calibration workload run before each study, and
+against the committed baseline the suite fails when a stage is slower,
+relative to the calibration, or has a higher peak memory by more than
+--tolerance.
+
+    python -m benchmarks.suite [--sizes 10 100 1000] [--baseline FILE] [--ci]
+    python -m benchmarks.suite --save-baseline
+"""
+
+import json
+import os
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from loguru import logger
+from numpy import cumsum, floating, sort
+from numpy.random import default_rng
+from numpy.typing import NDArray
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, load_abf
+from dorsal_ronflex.settings import (
+    DEFAULT_ABS_TOLERANCE_STR,
+    DEFAULT_TOLERANCE_STR,
+    config_interval,
+)
+from dorsal_ronflex.signals.create_signals import create_abs_signal, create_signal
+from dorsal_ronflex.signals.detection import detect_spikes
+from dorsal_ronflex.signals.signal import Signal
+from dorsal_ronflex.sweep.create_sweep import create_sweep, create_sweep_results
+from dorsal_ronflex.sweep.sweep import calc_area_under_curve
+
+from .synthetic import SyntheticSpec, write_synthetic_abf
+
+_DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+_CALIBRATION_SIZE = 1_000_000
+_CALIBRATION_LOOP = 100_000
+# Slowdowns below this many calibrations are timer noise on the small studies
+_NOISE_FLOOR = 0.05
+# Peak memory growths below this many MiB are allocator noise
+_MEMORY_NOISE_FLOOR = 1.0
+
+Stage = Callable[[], Any]
+Measures = Dict[str, Dict[str, float]]
+Report = Dict[str, Measures]
+RawSweep = Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]
+
+# Unit and noise floor of the measures checked against the baseline
+_GATED_METRICS = {
+    "relative": ("calibrations", _NOISE_FLOOR),
+    "peak_mib": ("MiB", _MEMORY_NOISE_FLOOR),
+}
+
+
+def calibrate(repeats: int) -> float:
+    """Best time of a fixed numpy and Python workload, the unit the stages are
+    compared in, so that a baseline recorded on another machine still applies.
+    """
+    values = default_rng(0).normal(size=_CALIBRATION_SIZE)
+
+    def workload() -> None:
+        sort(values)
+        cumsum(values)
+        sum(float(value) for value in values[:_CALIBRATION_LOOP])
+
+    seconds = []
+    for _ in range(repeats):
+        start = perf_counter()
+        workload()
+        seconds.append(perf_counter() - start)
+    return min(seconds)
+
+
+def _read_sweeps(study: AbfStudy) -> None:
+    """Reads every sweep of the study."""
+    for sweep_number in range(study.sweep_count):
+        study.read_sweep(sweep_number)
+
+
+def _signal_stages(study: AbfStudy, raw_sweeps: List[RawSweep]) -> Dict[str, Stage]:
+    """Stages of the analysis of the signals, on sweeps already read."""
+    config = study.config
+    interval = config_interval(config)
+    tolerance = config[DEFAULT_TOLERANCE_STR]
+    signals = [
+        create_signal(times, amps, interval, tolerance) for times, amps in raw_sweeps
+    ]
+
+    def create_signals() -> None:
+        for times, amps in raw_sweeps:
+            signal = create_signal(times, amps, interval, tolerance)
+            create_abs_signal(signal, config[DEFAULT_ABS_TOLERANCE_STR])
+
+    return {
+        "create_signal": create_signals,
+        "detect_spikes": lambda: _detect(signals),
+        "calc_area_under_curve": lambda: _areas(study, raw_sweeps),
+        "matrix": lambda: create_sweep_results(*study.read_matrix(), config),
+    }
+
+
+def _detect(signals: List[Signal]) -> None:
+    """Detects the spikes of every signal."""
+    for signal in signals:
+        detect_spikes(signal.times, signal.amps, signal.spike_tolerence)
+
+
+def _areas(study: AbfStudy, raw_sweeps: List[RawSweep]) -> None:
+    """Creates every sweep and computes the area of its event."""
+    for sweep_number, (times, amps) in enumerate(raw_sweeps):
+        sweep = create_sweep(sweep_number, times, amps, study.config)
+        calc_area_under_curve(sweep, *sweep.event_bondaries)
+
+
+def _study_stages(study: AbfStudy, output: Path) -> Dict[str, Stage]:
+    """Every timed stage of the analysis of the study after its loading, in
+    pipeline order.
+    """
+    raw_sweeps: List[RawSweep] = [
+        (times.copy(), amps.copy())
+        for times, amps in map(study.read_sweep, range(study.sweep_count))
+    ]
+    return {
+        "set_sweep": lambda: _read_sweeps(study),
+        **_signal_stages(study, raw_sweeps),
+        "to_df": study.to_df,
+        "to_txt": study.to_txt,
+        "save": lambda: study.save(output),
+    }
+
+
+def _measure(
+    stage: Stage, sweep_count: int, repeats: int, calibration: float
+) -> Dict[str, float]:
+    """Best wall time, time relative to the calibration, throughput and
+    tracemalloc peak of a stage.
+    A warm-up run comes first, so that lazy imports are neither timed nor
+    counted in the peak memory.
+    """
+    stage()
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = []
+    for _ in range(repeats):
+        start = perf_counter()
+        stage()
+        seconds.append(perf_counter() - start)
+    best = min(seconds)
+    return {
+        "seconds": best,
+        "relative": best / calibration,
+        "sweeps_per_second": sweep_count / best if best else float("inf"),
+        "peak_mib": peak / 2**20,
+    }
+
+
+def _measure_size(sweep_count: int, repeats: int, directory: Path) -> Measures:
+    """Measures of every stage on a study of sweep_count sweeps, relative to a
+    calibration run just before them. The study is freed once measured, so
+    that the largest one does not run beside the others.
+    """
+    calibration = calibrate(repeats)
+    filepath = directory / f"synthetic_{sweep_count}.abf"
+    write_synthetic_abf(SyntheticSpec(sweep_count=sweep_count), filepath)
+    # Before the study is opened, not to hold two loaded copies of the file
+    measures = {
+        "calibration": {"seconds": calibration, "relative": 1.0},
+        "load_abf": _measure(
+            lambda: load_abf(filepath).setSweep(0), sweep_count, repeats, calibration
+        ),
+    }
+    study = AbfStudy(filepath)
+    study.analyse()
+    output = directory / f"output_{sweep_count}"
+    output.mkdir()
+    for name, stage in _study_stages(study, output).items():
+        measures[name] = _measure(stage, sweep_count, repeats, calibration)
+    return measures
+
+
+def run_suite(sizes: List[int], repeats: int, directory: Path) -> Report:
+    """Report of every stage for every study size."""
+    report: Report = {}
+    for sweep_count in sizes:
+        report[str(sweep_count)] = _measure_size(sweep_count, repeats, directory)
+        logger.info(f"Measured {sweep_count} sweeps.")
+    return report
+
+
+def _stage_regressions(
+    label: str, measure: Dict[str, float], reference: Dict[str, float], tolerance: float
+) -> List[str]:
+    """Measures of a stage beyond their baseline by more than the tolerance."""
+    regressions = []
+    for metric, (unit, noise_floor) in _GATED_METRICS.items():
+        if metric not in measure or metric not in reference:
+            continue
+        limit = reference[metric] + max(reference[metric] * tolerance, noise_floor)
+        if measure[metric] > limit:
+            regressions.append(
+                f"{label}: {measure[metric]:.2f} {unit} "
+                f"(baseline {reference[metric]:.2f})"
+            )
+    return regressions
+
+
+def find_regressions(report: Report, baseline: Report, tolerance: float) -> List[str]:
+    """Stages slower, or holding more memory, than their baseline by more than
+    the tolerance, times being relative to the calibration of their machine.
+    """
+    regressions = []
+    for size, stages in report.items():
+        for name, measure in stages.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is not None:
+                regressions += _stage_regressions(
+                    f"{name} on {size} sweeps", measure, reference, tolerance
+                )
+    return regressions
+
+
+def check_baseline(report: Report, baseline: Path, tolerance: float, ci: bool) -> int:
+    """Exit status of the comparison of the report with the baseline. Without
+    a baseline, the check fails in CI and only warns otherwise.
+    """
+    if not baseline.is_file():
+        message = f"No baseline at {baseline}, use --save-baseline."
+        if ci:
+            logger.error(message)
+            return 1
+        logger.warning(message)
+        return 0
+    regressions = find_regressions(report, json.loads(baseline.read_text()), tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    """Runs the suite, prints the report and checks it against the baseline."""
+    parser = ArgumentParser(description="dorsal-ronflex benchmark suite")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=_DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--ci",
+        action="store_true",
+        default=bool(os.environ.get("CI")),
+        help="Fail without a baseline (default when the CI variable is set).",
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    with TemporaryDirectory() as directory:
+        report = run_suite(args.sizes, args.repeats, Path(directory))
+    print(json.dumps(report, indent=4))
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=4) + "\n")
+        return
+    sys.exit(check_baseline(report, args.baseline, args.tolerance, args.ci))
+
+
+if __name__ == "__main__":
+    main()
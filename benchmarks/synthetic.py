@@ -0,0 +1,127 @@
+"""Synthetic ABF-like recordings for the benchmarks.
+
+Sweeps hold gaussian noise, stimulation artefacts and spikes inside the
+analysed segment, and can be written as real ABF1 files (int16 samples,
+interleaved channels) so the whole `load_abf` path gets exercised.
+"""
+
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple
+
+from numpy import arange, exp, float64, full, rint, sort
+from numpy.random import default_rng
+from numpy.typing import NDArray
+
+_BLOCK_SIZE = 512
+_HEADER_BLOCKS = 4
+_ADC_RESOLUTION = 2**15
+_INT16_MAX = 2**15 - 1
+_ADC_RANGE = 10.0
+_MAX_CHANNELS = 16
+
+
+@dataclass(frozen=True)
+class SyntheticSpec:
+    """Shape and content of a synthetic recording."""
+
+    sweep_count: int = 10
+    channel_count: int = 2
+    sample_rate: int = 20000
+    sweep_seconds: float = 5.8
+    noise: float = 0.02
+    stim_count: int = 1
+    spike_count: int = 4
+    stim_amp: float = 2.0
+    spike_amp: float = 0.4
+    first_stim_ms: float = 5580.0
+    spikes_ms: Tuple[float, float] = (5588.0, 5630.0)
+    seed: int = 0
+
+
+def _add_gaussians(
+    sweep: NDArray[float64],
+    sample_rate: int,
+    centers_ms: NDArray[float64],
+    amps: NDArray[float64],
+    width_ms: float,
+) -> None:
+    """Adds gaussian bumps to the sweep, only computed around their centers."""
+    half_width = int(6 * width_ms * sample_rate / 1000) + 1
+    for center_ms, amp in zip(centers_ms, amps):
+        center = int(center_ms * sample_rate / 1000)
+        start, stop = max(0, center - half_width), min(len(sweep), center + half_width)
+        times_ms = arange(start, stop) * 1000 / sample_rate
+        sweep[start:stop] += amp * exp(-(((times_ms - center_ms) / width_ms) ** 2))
+
+
+def generate_sweeps(spec: SyntheticSpec) -> NDArray[float64]:
+    """Sweeps of every channel, shaped (channels, sweeps, samples)."""
+    rng = default_rng(spec.seed)
+    sample_count = int(spec.sweep_seconds * spec.sample_rate)
+    shape = (spec.channel_count, spec.sweep_count, sample_count)
+    sweeps = rng.normal(0.0, spec.noise, shape)
+    for sweep in sweeps.reshape(-1, sample_count):
+        stims = spec.first_stim_ms + 2.5 * arange(spec.stim_count)
+        _add_gaussians(
+            sweep, spec.sample_rate, stims, full(spec.stim_count, spec.stim_amp), 0.2
+        )
+        spikes = sort(rng.uniform(*spec.spikes_ms, spec.spike_count))
+        signs = rng.choice([-1.0, 1.0], spec.spike_count)
+        _add_gaussians(sweep, spec.sample_rate, spikes, signs * spec.spike_amp, 0.5)
+    return sweeps
+
+
+def write_abf1(
+    sweeps: NDArray[float64], filepath: str | Path, sample_rate: int
+) -> None:
+    """Writes (channels, sweeps, samples) data as an episodic ABF1 file."""
+    channel_count, sweep_count, sample_count = sweeps.shape
+    if channel_count > _MAX_CHANNELS:
+        raise ValueError(f"ABF1 files hold at most {_MAX_CHANNELS} channels.")
+    point_count = channel_count * sweep_count * sample_count
+    max_value = max(float(sweeps.max()), -float(sweeps.min())) or 1.0
+    scale_factor = 1.0
+    while max_value * _ADC_RESOLUTION / _ADC_RANGE * scale_factor > _INT16_MAX:
+        scale_factor /= 10
+    value_scale = _ADC_RESOLUTION / _ADC_RANGE * scale_factor
+
+    header = bytearray(_BLOCK_SIZE * _HEADER_BLOCKS)
+    struct.pack_into("4s", header, 0, b"ABF ")
+    struct.pack_into("f", header, 4, 1.3)
+    struct.pack_into("h", header, 8, 5)  # episodic stimulation
+    struct.pack_into("i", header, 10, point_count)
+    struct.pack_into("i", header, 16, sweep_count)
+    struct.pack_into("i", header, 40, _HEADER_BLOCKS)
+    struct.pack_into("h", header, 100, 0)  # int16 samples
+    struct.pack_into("h", header, 120, channel_count)
+    struct.pack_into("f", header, 122, 1e6 / sample_rate / channel_count)
+    struct.pack_into("i", header, 138, sample_count * channel_count)
+    struct.pack_into("f", header, 244, _ADC_RANGE)
+    struct.pack_into("i", header, 252, _ADC_RESOLUTION)
+    for channel in range(_MAX_CHANNELS):
+        sampling_sequence = channel if channel < channel_count else -1
+        struct.pack_into("h", header, 410 + channel * 2, sampling_sequence)
+        struct.pack_into(
+            "10s", header, 442 + channel * 10, f"IN {channel}".ljust(10).encode()
+        )
+        struct.pack_into("8s", header, 602 + channel * 8, b"mV      ")
+        struct.pack_into("f", header, 730 + channel * 4, 1.0)
+        struct.pack_into("f", header, 922 + channel * 4, scale_factor)
+        struct.pack_into("f", header, 1050 + channel * 4, 1.0)
+
+    padding = -(len(header) + point_count * 2) % _BLOCK_SIZE
+    with open(filepath, "wb") as file:
+        file.write(header)
+        # Sweep by sweep, not to hold int16 copies of the whole recording
+        for sweep_number in range(sweep_count):
+            samples = rint(sweeps[:, sweep_number] * value_scale).astype("<i2")
+            file.write(samples.T.tobytes())
+        file.write(bytes(padding))
+
+
+def write_synthetic_abf(spec: SyntheticSpec, filepath: str | Path) -> Path:
+    """Generates a recording and writes it as an ABF1 file."""
+    write_abf1(generate_sweeps(spec), filepath, spec.sample_rate)
+    return Path(filepath)
@@ -0,0 +1,350 @@
+"""Streaming aggregate statistics of the sweeps, across studies.
+
+Each analysed study is summarised once, its rows written right away, and its
+summary merged into the per-protocol groups, so memory does not grow with the
+number of studies.
+"""
+
+import csv
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from math import ceil, isfinite, log, sqrt
+from os.path import join
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterator, Tuple
+
+from loguru import logger
+from numpy import absolute, float64, floating, isclose, zeros
+from numpy.typing import NDArray
+
+from dorsal_ronflex.export.records import AGGREGATE_COLUMNS, TRACE_COLUMNS
+from dorsal_ronflex.export.writers import format_csv_value
+from dorsal_ronflex.sweep.result import SweepResult
+
+if TYPE_CHECKING:
+    from dorsal_ronflex.analyse.simplified_abf import AbfStudy
+
+AGGREGATES_FILENAME = "aggregates.csv"
+TRACES_FILENAME = "aggregate_traces.csv"
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# Samples a trace needs for its sampling interval to be known
+_MIN_TRACE_SAMPLES = 2
+
+# Protocol, ADC name and ADC units of a group of sweeps
+GroupKey = Tuple[str, str, str]
+
+
+@dataclass
+class QuantileSketch:
+    """Mergeable quantile sketch with a bounded relative error (DDSketch).
+    Values are counted in logarithmic buckets, the smallest magnitudes being
+    collapsed together beyond max_buckets.
+    """
+
+    relative_accuracy: float = 0.01
+    max_buckets: int = 2048
+    positive: Dict[int, int] = field(default_factory=dict)
+    negative: Dict[int, int] = field(default_factory=dict)
+    zero_count: int = 0
+    count: int = 0
+
+    @property
+    def gamma(self) -> float:
+        """Ratio between the bounds of a bucket."""
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    def _index(self, magnitude: float) -> int:
+        """Bucket of a positive magnitude."""
+        return ceil(log(magnitude) / log(self.gamma))
+
+    def _value(self, index: int) -> float:
+        """Magnitude estimated for the values of a bucket."""
+        return 2 * self.gamma**index / (self.gamma + 1)
+
+    def _collapse(self, buckets: Dict[int, int]) -> None:
+        """Merges the smallest magnitudes until there are max_buckets."""
+        while len(buckets) > self.max_buckets:
+            smallest = min(buckets)
+            count = buckets.pop(smallest)
+            next_smallest = min(buckets)
+            buckets[next_smallest] += count
+
+    def add(self, value: float) -> None:
+        """Counts a value."""
+        if value > 0:
+            buckets, index = self.positive, self._index(value)
+        elif value < 0:
+            buckets, index = self.negative, self._index(-value)
+        else:
+            self.zero_count += 1
+            self.count += 1
+            return
+        buckets[index] = buckets.get(index, 0) + 1
+        self.count += 1
+        self._collapse(buckets)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Counts the values of another sketch of the same accuracy."""
+        for buckets, other_buckets in (
+            (self.positive, other.positive),
+            (self.negative, other.negative),
+        ):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+            self._collapse(buckets)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def _ranked_buckets(self) -> Iterator[Tuple[int, float]]:
+        """Count and estimated value of every bucket, by increasing value."""
+        for index in sorted(self.negative, reverse=True):
+            yield self.negative[index], -self._value(index)
+        yield self.zero_count, 0.0
+        for index in sorted(self.positive):
+            yield self.positive[index], self._value(index)
+
+    def quantile(self, q: float) -> float:
+        """Estimated q-quantile of the values counted, nan if there are none."""
+        if not self.count:
+            return float("nan")
+        rank = q * (self.count - 1)
+        seen = 0
+        for count, value in self._ranked_buckets():
+            seen += count
+            if seen > rank:
+                return value
+        return self._value(max(self.positive))
+
+
+@dataclass
+class RunningStats:
+    """Count, mean, variance (Welford), extrema and quantiles of a metric."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    minimum: float = float("inf")
+    maximum: float = float("-inf")
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+
+    def add(self, value: float) -> None:
+        """Updates the statistics with a value, non-finite ones are ignored."""
+        if not isfinite(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        self.sketch.add(value)
+
+    def merge(self, other: "RunningStats") -> None:
+        """Updates the statistics with those of other values (Chan et al.)."""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation, nan below two values."""
+        return sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float("nan")
+
+    def row(self) -> Tuple[Any, ...]:
+        """Count, mean, std, min, quantiles and max."""
+        if not self.count:
+            return (0,) + (float("nan"),) * (4 + len(QUANTILES))
+        quantiles = tuple(
+            min(max(self.sketch.quantile(q), self.minimum), self.maximum)
+            for q in QUANTILES
+        )
+        return (self.count, self.mean, self.std, self.minimum, *quantiles, self.maximum)
+
+
+@dataclass
+class RunningTrace:
+    """Running mean of the absolute cropped traces of a group of sweeps.
+    Sweeps sampled at another rate are left out, the trace is cut to the
+    samples every sweep has.
+    """
+
+    times: NDArray[floating[Any]] | None = None
+    sums: NDArray[floating[Any]] | None = None
+    count: int = 0
+    skipped: int = 0
+
+    def _accepts(self, times: NDArray[floating[Any]]) -> bool:
+        """Whether the trace is sampled like the previous ones."""
+        if (
+            self.times is None
+            or len(times) < _MIN_TRACE_SAMPLES
+            or len(self.times) < _MIN_TRACE_SAMPLES
+        ):
+            return True
+        return bool(isclose(times[1] - times[0], self.times[1] - self.times[0]))
+
+    def add_sums(
+        self, times: NDArray[floating[Any]], sums: NDArray[floating[Any]], count: int
+    ) -> None:
+        """Adds the sum of count traces sampled at times."""
+        if not self._accepts(times):
+            self.skipped += count
+            return
+        if self.times is None or self.sums is None:
+            self.times, self.sums = times, zeros(len(times), dtype=float64)
+        length = min(len(self.sums), len(sums))
+        self.times = self.times[:length]
+        self.sums = self.sums[:length] + sums[:length]
+        self.count += count
+
+    def add(self, times: NDArray[floating[Any]], amps: NDArray[floating[Any]]) -> None:
+        """Adds the absolute trace of a sweep."""
+        self.add_sums(times, absolute(amps), 1)
+
+    def merge(self, other: "RunningTrace") -> None:
+        """Adds the traces of another group."""
+        if other.times is not None and other.sums is not None:
+            self.add_sums(other.times, other.sums, other.count)
+        self.skipped += other.skipped
+
+    @property
+    def mean(self) -> NDArray[floating[Any]]:
+        """Mean absolute amp at each of the times."""
+        if self.sums is None or not self.count:
+            return zeros(0, dtype=float64)
+        return self.sums / self.count
+
+
+def _metrics(sweep: SweepResult) -> Dict[str, float]:
+    """Values of a sweep aggregated, measurements only (not config values)."""
+    return {
+        "Area": sweep.area,
+        "Control Area": sweep.control_area,
+        "Event Duration": sweep.event_duration,
+        "Raw Spike Count": len(sweep.raw_spikes),
+        "Abs Spike Count": len(sweep.abs_spikes),
+    }
+
+
+@dataclass
+class GroupSummary:
+    """Aggregates of the sweeps of a group."""
+
+    metrics: Dict[str, RunningStats] = field(default_factory=dict)
+    trace: RunningTrace = field(default_factory=RunningTrace)
+
+    def add(
+        self,
+        sweep: SweepResult,
+        times: NDArray[floating[Any]],
+        amps: NDArray[floating[Any]],
+    ) -> None:
+        """Adds the results and cropped trace of a sweep."""
+        for name, value in _metrics(sweep).items():
+            self.metrics.setdefault(name, RunningStats()).add(value)
+        self.trace.add(times, amps)
+
+    def merge(self, other: "GroupSummary") -> None:
+        """Adds the sweeps of another group."""
+        for name, stats in other.metrics.items():
+            self.metrics.setdefault(name, RunningStats()).merge(stats)
+        self.trace.merge(other.trace)
+
+
+@dataclass
+class StudySummary:
+    """Aggregates of the sweeps of a study, per channel."""
+
+    name: str
+    groups: Dict[GroupKey, GroupSummary] = field(default_factory=dict)
+
+
+def summarise_study(study: "AbfStudy") -> StudySummary:
+    """Aggregates of the analysed study, its traces being read once more."""
+    summary = StudySummary(study.name)
+    for channel in study.channels:
+        metadata = study.channel_metadata(channel)
+        key = (metadata.protocol, metadata.adc_name, metadata.adc_units)
+        group = summary.groups.setdefault(key, GroupSummary())
+        for sweep in study.channel_results[channel]:
+            group.add(sweep, *study.cropped_sweep(sweep.id, channel))
+    return summary
+
+
+def _write_rows(
+    writer: Any, level: str, name: str, key: GroupKey, group: GroupSummary
+) -> None:
+    """Rows of the metrics of a group."""
+    for metric, stats in group.metrics.items():
+        row = (level, name, *key, metric, *stats.row())
+        writer.writerow(map(format_csv_value, row))
+
+
+def _write_traces(
+    traces_path: str | Path, protocols: Dict[GroupKey, GroupSummary]
+) -> None:
+    """Writes the mean trace of every protocol."""
+    with open(traces_path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(TRACE_COLUMNS)
+        for key, group in protocols.items():
+            trace = group.trace
+            if trace.skipped:
+                logger.warning(
+                    f"{trace.skipped} sweeps of {key[0]} ({key[1]}) are sampled "
+                    "at another rate and left out of its mean trace"
+                )
+            if trace.times is None:
+                continue
+            for time, amp in zip(trace.times.tolist(), trace.mean.tolist()):
+                row = (*key, trace.count, time, amp)
+                writer.writerow(map(format_csv_value, row))
+
+
+@dataclass
+class RunAggregates:
+    """Aggregates of a run: study rows are written as the studies come,
+    protocol groups are kept until the end of the run.
+    """
+
+    file: IO[str]
+    writer: Any
+    protocols: Dict[GroupKey, GroupSummary] = field(default_factory=dict)
+    study_count: int = 0
+
+    def add(self, summary: StudySummary) -> None:
+        """Writes the rows of a study and merges it into its protocols."""
+        for key, group in summary.groups.items():
+            _write_rows(self.writer, "Study", summary.name, key, group)
+            self.protocols.setdefault(key, GroupSummary()).merge(group)
+        self.file.flush()
+        self.study_count += 1
+
+    def close(self, traces_path: str | Path) -> None:
+        """Writes the protocol rows, and their mean traces to traces_path."""
+        for key, group in self.protocols.items():
+            _write_rows(self.writer, "Protocol", "", key, group)
+        _write_traces(traces_path, self.protocols)
+
+
+@contextmanager
+def aggregate_run(output: str | Path) -> Iterator[RunAggregates]:
+    """Aggregates of the studies of a run, written to the output directory."""
+    with open(join(output, AGGREGATES_FILENAME), "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(AGGREGATE_COLUMNS)
+        aggregates = RunAggregates(file, writer)
+        yield aggregates
+        aggregates.close(join(output, TRACES_FILENAME))
+    logger.info(
+        f"Aggregates of {aggregates.study_count} studies written to "
+        f"{join(output, AGGREGATES_FILENAME)}"
+    )
@@ -1,12 +1,86 @@
 """Analysis module."""
 
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
+)
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from sys import exit
+from queue import Queue
+from threading import Thread
+from typing import Callable, Dict, List, Tuple
 
 from loguru import logger
 from tqdm import tqdm
 
-from dorsal_ronflex.analyse.simplified_abf import AbfStudy
+from dorsal_ronflex.analyse.aggregates import (
+    RunAggregates,
+    StudySummary,
+    summarise_study,
+)
+from dorsal_ronflex.analyse.cache import (
+    ResultCache,
+    emitted_dir,
+    hash_study,
+    mark_emitted,
+)
+from dorsal_ronflex.analyse.planner import (
+    Plan,
+    PlannedStudy,
+    PlanOptions,
+    prescan,
+    take_fitting,
+)
+from dorsal_ronflex.analyse.shards import Shard, shard_files, write_manifest
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.export.database import run_database
+from dorsal_ronflex.profiling import profile_study, write_run_report
+from dorsal_ronflex.settings import load_config
+
+
+@dataclass
+class RunSummary:
+    """Which studies of a run succeeded and which failed."""
+
+    succeeded: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    output_dirs: Dict[str, str] = field(default_factory=dict)
+    skipped: Dict[str, str] = field(default_factory=dict)
+
+    def add(
+        self, study_path: str | Path, error: str | None, output_dir: str | None = None
+    ) -> None:
+        """Records the outcome of a study, and where its results are."""
+        if error is None:
+            self.succeeded.append(str(study_path))
+            if output_dir is not None:
+                self.output_dirs[str(study_path)] = output_dir
+        else:
+            self.failed[str(study_path)] = error
+
+    def log(self) -> None:
+        """Logs the outcome of the run."""
+        logger.info(
+            f"{len(self.succeeded)} studies analysed, {len(self.failed)} failed."
+            + (f" {len(self.skipped)} skipped." if self.skipped else "")
+        )
+        for study_path, error in self.failed.items():
+            logger.error(f"Failed {study_path}: {error}")
+
+
+@dataclass(frozen=True)
+class RunOptions:
+    """How the studies of a run are scheduled, cached, sharded and aggregated."""
+
+    jobs: int = 1
+    cache: ResultCache | None = None
+    prefetch: int = 0
+    aggregates: RunAggregates | None = None
+    shard: Shard | None = None
+    planning: PlanOptions | None = None
 
 
 def is_directory(path: str) -> bool:
@@ -19,26 +93,500 @@ def is_file(path: str) -> bool:
     return Path(path).is_file()
 
 
+SummaryCallback = Callable[[StudySummary], None]
+
+# Error of a study if it failed, and its output directory
+StudyOutcome = Tuple[str | None, str | None]
+# Outcome and aggregates of a study analysed by a worker
+WorkerResult = Tuple[StudyOutcome, List[StudySummary]]
+
+
+def _reuse_results(
+    study_path: str | Path, output: Path, cache: ResultCache, key: str
+) -> str | None:
+    """Output directory of the results of an unchanged or cached study, copied
+    from the cache if needed. None when the study has to be analysed.
+    """
+    if (previous_dir := emitted_dir(output, key)) is not None:
+        logger.info(f"{study_path} is unchanged, results are in {previous_dir}")
+        return str(previous_dir)
+    if (entry := cache.get(key)) is None:
+        return None
+    output_dir = cache.emit(entry, output)
+    logger.info(f"{study_path} is cached, results copied to {output_dir}")
+    mark_emitted(output, key, output_dir)
+    return output_dir
+
+
+def _reused_summary(
+    study_path: str | Path,
+    config_path: str | Path,
+    options: StudyOptions,
+    cache: ResultCache,
+    key: str,
+) -> StudySummary:
+    """Aggregates of a study whose results are reused, as cached with them.
+    Entries cached without aggregates have the study analysed again, nothing
+    being saved, and get them for the next runs.
+    """
+    entry = cache.get(key)
+    if entry is not None and (summary := cache.summary(entry)) is not None:
+        return summary
+    summary = summarise_study(AbfStudy(study_path, config_path, options))
+    if entry is not None:
+        cache.add_summary(entry, summary)
+    return summary
+
+
+def _save_and_cache(
+    study: AbfStudy,
+    output: Path,
+    cache: ResultCache,
+    key: str,
+    on_summary: SummaryCallback | None,
+) -> str:
+    """Saves the study and caches its results, with its aggregates when they
+    are passed to on_summary. Returns the output directory of the study.
+    """
+    if on_summary is not None:
+        study.analyse()
+    output_dir = study.save(output)
+    summary = None if on_summary is None else summarise_study(study)
+    cache.put(key, study.name, output_dir, summary)
+    mark_emitted(output, key, output_dir)
+    if on_summary is not None and summary is not None:
+        on_summary(summary)
+    return output_dir
+
+
+def _analyse_and_save_cached(
+    study_path: str | Path,
+    output: Path,
+    config_path: str | Path,
+    options: StudyOptions,
+    cache: ResultCache,
+    on_summary: SummaryCallback | None = None,
+) -> str:
+    """Skips unchanged studies, re-emits cached ones and analyses the others,
+    passing the aggregates of every one to on_summary.
+    Returns the output directory of the study.
+    """
+    key = hash_study(
+        study_path, load_config(config_path), options.formats, options.results_key()
+    )
+    if (output_dir := _reuse_results(study_path, output, cache, key)) is None:
+        study = AbfStudy(study_path, config_path, options)
+        return _save_and_cache(study, output, cache, key, on_summary)
+    if on_summary is not None:
+        on_summary(_reused_summary(study_path, config_path, options, cache, key))
+    return output_dir
+
+
+def _error_message(study_path: str | Path, error: Exception) -> str:
+    """Logs the error of a study and returns its message."""
+    logger.critical(f"Error analysing {study_path}: {error}")
+    return str(error) or type(error).__name__
+
+
+def list_studies(path: str | Path) -> List[Path]:
+    """The ABF file, or every ABF file found in the directory."""
+    if is_file(str(path)):
+        return [Path(path)]
+    return sorted(Path(path).rglob("*.abf"))
+
+
 def analyse_and_save_study(
-    study_path: str | Path, output: Path, config_path: str | Path
+    study_path: str | Path,
+    output: Path,
+    config_path: str | Path,
+    options: StudyOptions = StudyOptions(),
+    cache: ResultCache | None = None,
+    on_summary: SummaryCallback | None = None,
+) -> StudyOutcome:
+    """Analyse and save the study, returns the error if it failed and the
+    output directory if it succeeded.
+    Writes its profile report when options.profile_dir is set, and passes
+    the aggregates of the analysed study to on_summary.
+    """
+    output_dir = None
+    with profile_study(study_path, options.profile_dir) as study_profile:
+        try:
+            if cache is None:
+                study = AbfStudy(study_path, config_path, options)
+                if on_summary is not None:
+                    study.analyse()
+                output_dir = study.save(output)
+                if on_summary is not None:
+                    on_summary(summarise_study(study))
+            else:
+                output_dir = _analyse_and_save_cached(
+                    study_path, output, config_path, options, cache, on_summary
+                )
+        except Exception as e:
+            study_profile.error = _error_message(study_path, e)
+    return study_profile.error, output_dir
+
+
+def _analyse_and_summarise_study(
+    study_path: str | Path,
+    output: Path,
+    config_path: str | Path,
+    options: StudyOptions,
+    cache: ResultCache | None,
+) -> WorkerResult:
+    """Analyse and save the study in a worker, returns its outcome and aggregates."""
+    summaries: List[StudySummary] = []
+    outcome = analyse_and_save_study(
+        study_path, output, config_path, options, cache, summaries.append
+    )
+    return outcome, summaries
+
+
+def _collect_study(
+    future: Future[WorkerResult],
+    file: Path,
+    summary: RunSummary,
+    aggregates: RunAggregates | None,
 ) -> None:
-    """Analyse and save the study."""
+    """Records the outcome of a study analysed by a worker, and its aggregates."""
     try:
-        study = AbfStudy(study_path, config_path)
-        study.save(output)
+        (error, output_dir), study_summaries = future.result()
     except Exception as e:
-        logger.critical(f"Error analysing {study_path}: {e}")
-        exit(0)
+        logger.critical(f"Worker failed on {file}: {e}")
+        error, output_dir = str(e) or type(e).__name__, None
+        study_summaries = []
+    if aggregates is not None:
+        for study_summary in study_summaries:
+            aggregates.add(study_summary)
+    summary.add(file, error, output_dir)
+
+
+def _analyse_files_in_parallel(
+    files: List[Path],
+    output: Path,
+    config: str | Path,
+    options: StudyOptions,
+    jobs: int,
+    cache: ResultCache | None,
+    aggregates: RunAggregates | None,
+) -> RunSummary:
+    """Spreads the studies over a process pool, one failure never stops the run.
+    The aggregates of each study are sent back and merged in this process.
+    """
+    summary = RunSummary()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(
+                _analyse_and_summarise_study, file, output, config, options, cache
+            ): file
+            for file in files
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            _collect_study(future, futures[future], summary, aggregates)
+    return summary
+
+
+def _analyse_planned_in_parallel(
+    studies: List[PlannedStudy],
+    output: Path,
+    config: str | Path,
+    options: StudyOptions,
+    jobs: int,
+    cache: ResultCache | None,
+    aggregates: RunAggregates | None,
+    memory_budget: int | None,
+) -> RunSummary:
+    """Like _analyse_files_in_parallel, but the studies (largest first) are only
+    submitted while the estimated memory of the running ones fits the budget.
+    """
+    summary = RunSummary()
+    pending = list(studies)
+    running: Dict[Future[WorkerResult], PlannedStudy] = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor, tqdm(
+        total=len(studies)
+    ) as progress:
+        while pending or running:
+            running_bytes = sum(study.memory_bytes for study in running.values())
+            for study in take_fitting(
+                pending, running_bytes, len(running), memory_budget, jobs
+            ):
+                future = executor.submit(
+                    _analyse_and_summarise_study,
+                    study.path,
+                    output,
+                    config,
+                    options,
+                    cache,
+                )
+                running[future] = study
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                _collect_study(future, running.pop(future).path, summary, aggregates)
+                progress.update()
+    return summary
+
 
+StudyItem = Tuple[AbfStudy, str | None]
 
-def analyse_and_save(path: str, output: Path, config: str | Path) -> None:
+
+def _read_studies(
+    files: List[Path],
+    config: str | Path,
+    options: StudyOptions,
+    loaded: Queue[StudyItem | None],
+) -> None:
+    """Reader stage, loads the studies ahead of the analysis."""
+    try:
+        for file in files:
+            study = AbfStudy(file, config, options)
+            try:
+                study.header
+            except Exception as e:
+                loaded.put((study, _error_message(file, e)))
+                continue
+            loaded.put((study, None))
+    finally:
+        loaded.put(None)
+
+
+def _write_studies(
+    output: Path,
+    analysed: Queue[StudyItem | None],
+    summary: RunSummary,
+    aggregates: RunAggregates | None,
+) -> None:
+    """Writer stage, saves and aggregates the analysed studies in order."""
+    while (item := analysed.get()) is not None:
+        study, error = item
+        output_dir = None
+        if error is None:
+            try:
+                output_dir = study.save(output)
+                if aggregates is not None:
+                    aggregates.add(summarise_study(study))
+            except Exception as e:
+                error = _error_message(study.filepath, e)
+        summary.add(study.filepath, error, output_dir)
+
+
+def _analyse_loaded(item: StudyItem) -> StudyItem:
+    """Analysis stage, analyses the study unless it could not be read."""
+    study, error = item
+    if error is not None:
+        return item
+    try:
+        study.analyse()
+    except Exception as e:
+        return study, _error_message(study.filepath, e)
+    return item
+
+
+def _analyse_files_pipelined(
+    files: List[Path],
+    output: Path,
+    config: str | Path,
+    options: StudyOptions,
+    prefetch: int,
+    aggregates: RunAggregates | None,
+) -> RunSummary:
+    """Reads, analyses and writes the studies on three overlapping stages.
+    Bounded queues hold at most prefetch studies on each side of the analysis.
+    """
+    summary = RunSummary()
+    loaded: Queue[StudyItem | None] = Queue(maxsize=prefetch)
+    analysed: Queue[StudyItem | None] = Queue(maxsize=prefetch)
+    reader = Thread(
+        target=_read_studies, args=(files, config, options, loaded), daemon=True
+    )
+    writer = Thread(target=_write_studies, args=(output, analysed, summary, aggregates))
+    reader.start()
+    writer.start()
+    try:
+        for item in tqdm(iter(loaded.get, None), total=len(files)):
+            analysed.put(_analyse_loaded(item))
+    finally:
+        analysed.put(None)
+        writer.join()
+    reader.join()
+    return summary
+
+
+def prefetch_conflict(options: StudyOptions, cached: bool) -> str | None:
+    """What keeps the studies from being prefetched, if anything. The cache
+    and profiling handle each study in turn, gap-free recordings are streamed,
+    and the process pools of the sweep and plot jobs must not fork while the
+    reader and writer threads run.
+    """
+    conflicts = {
+        "--cache": cached,
+        "--profile": options.profile_dir is not None,
+        "--gap-free": options.gap_free,
+        "--sweep-jobs": options.sweep_jobs > 1,
+        "--plot-jobs": options.plot_jobs > 1,
+    }
+    return next((name for name, conflict in conflicts.items() if conflict), None)
+
+
+def analyse_files(
+    files: List[Path],
+    output: Path,
+    config: str | Path,
+    options: StudyOptions = StudyOptions(),
+    run_options: RunOptions = RunOptions(),
+) -> RunSummary:
+    """Analyse and save every study, on run_options.jobs processes.
+    On a single process, reading and writing overlap the analysis when
+    prefetch is positive and nothing conflicts with it, see prefetch_conflict.
+    The analysed studies are added to the aggregates, if any.
+    """
+    jobs, cache, aggregates = (
+        run_options.jobs,
+        run_options.cache,
+        run_options.aggregates,
+    )
+    if jobs > 1:
+        return _analyse_files_in_parallel(
+            files, output, config, options, jobs, cache, aggregates
+        )
+    if run_options.prefetch > 0:
+        conflict = prefetch_conflict(options, cache is not None)
+        if conflict is None:
+            return _analyse_files_pipelined(
+                files, output, config, options, run_options.prefetch, aggregates
+            )
+        logger.warning(f"Studies handled in turn, prefetching is off with {conflict}.")
+    on_summary = None if aggregates is None else aggregates.add
+    summary = RunSummary()
+    for file in tqdm(files):
+        error, output_dir = analyse_and_save_study(
+            file, output, config, options, cache, on_summary
+        )
+        summary.add(file, error, output_dir)
+    return summary
+
+
+def analyse_planned(
+    plan: Plan,
+    output: Path,
+    config: str | Path,
+    options: StudyOptions = StudyOptions(),
+    run_options: RunOptions = RunOptions(),
+) -> RunSummary:
+    """Analyse and save the studies of a pre-scan, largest first, the files it
+    left out being recorded as skipped. On several processes, the studies
+    running together stay within the memory budget of the planning (estimated).
+    """
+    if run_options.jobs > 1:
+        planning = run_options.planning
+        summary = _analyse_planned_in_parallel(
+            plan.studies,
+            output,
+            config,
+            options,
+            run_options.jobs,
+            run_options.cache,
+            run_options.aggregates,
+            None if planning is None else planning.memory_budget,
+        )
+    else:
+        files = [study.path for study in plan.studies]
+        summary = analyse_files(files, output, config, options, run_options)
+    summary.skipped.update(plan.skipped)
+    return summary
+
+
+def _analyse_directory(
+    directory: Path,
+    output: Path,
+    config: str | Path,
+    options: StudyOptions,
+    run_options: RunOptions,
+) -> Tuple[List[Path], RunSummary]:
+    """Studies of the directory, or of its shard, and the summary of their
+    analysis. The manifest of the shard is written to output.
+    """
+    files = list_studies(directory)
+    shard = run_options.shard
+    if shard is not None:
+        files = shard_files(files, directory, shard)
+        logger.info(f"Shard {shard}: {len(files)} studies")
+    planning = run_options.planning
+    if planning is None:
+        summary = analyse_files(files, output, config, options, run_options)
+    else:
+        plan = prescan(files, config, options, planning.protocols)
+        summary = analyse_planned(plan, output, config, options, run_options)
+    if shard is not None:
+        write_manifest(
+            output,
+            shard,
+            directory,
+            files,
+            {**summary.skipped, **summary.failed},
+            summary.output_dirs,
+        )
+    return files, summary
+
+
+def _end_run(
+    files: List[Path], options: StudyOptions, cache: ResultCache | None
+) -> None:
+    """Evicts the oldest cached results and writes the profile report, if any."""
+    if cache is not None:
+        cache.evict()
+    if options.profile_dir is not None and files:
+        report_path = write_run_report(options.profile_dir, files)
+        logger.info(f"Profile report written to {report_path}")
+
+
+def _analyse_path(
+    path: str,
+    output: Path,
+    config: str | Path,
+    options: StudyOptions,
+    run_options: RunOptions,
+) -> Tuple[List[Path], RunSummary]:
+    """Studies of the file or directory, and the summary of their analysis."""
+    if is_file(path):
+        aggregates = run_options.aggregates
+        summary = RunSummary()
+        error, output_dir = analyse_and_save_study(
+            path,
+            output,
+            config,
+            options,
+            run_options.cache,
+            None if aggregates is None else aggregates.add,
+        )
+        summary.add(path, error, output_dir)
+        return [Path(path)], summary
+    if is_directory(path):
+        return _analyse_directory(Path(path), output, config, options, run_options)
+    logger.critical(f"Path {path} is not a file nor directory.")
+    return [], RunSummary()
+
+
+def analyse_and_save(
+    path: str,
+    output: Path,
+    config: str | Path,
+    options: StudyOptions = StudyOptions(),
+    run_options: RunOptions = RunOptions(),
+) -> RunSummary:
     """Makes the distinction between a file and a directory.
     If it is a file, analyse and save the study.
+    If it is a directory and a shard is given, only its slice of the directory
+    is analysed, and its manifest written to output.
+    With planning, the headers of the directory are pre-scanned first, see
+    analyse_planned.
+    The database of options, if any, is opened once for the run and closed
+    with it.
     """
-    if is_file(path):
-        analyse_and_save_study(path, output, config)
-    elif is_directory(path):
-        for file in tqdm(Path(path).rglob("*.abf")):
-            analyse_and_save_study(file, output, config)
-    else:
-        logger.critical(f"Path {path} is not a file nor directory.")
+    if run_options.aggregates is not None and options.gap_free:
+        logger.warning("Gap-free recordings have no sweeps to aggregate.")
+        run_options = replace(run_options, aggregates=None)
+    with run_database(options.database):
+        files, summary = _analyse_path(path, output, config, options, run_options)
+    _end_run(files, options, run_options.cache)
+    summary.log()
+    return summary
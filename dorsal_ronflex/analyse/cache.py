@@ -0,0 +1,182 @@
+"""Content-hash cache of study results, for incremental re-runs.
+
+The aggregates of the studies are cached as pickles, which run code when they
+are loaded: the cache directory must only be writable by trusted users.
+"""
+
+import json
+import pickle
+from dataclasses import dataclass
+from functools import cache, partial
+from hashlib import sha256
+from os import replace, scandir, utime
+from pathlib import Path
+from shutil import copy2, copytree, rmtree
+from typing import Any, Dict, List, Tuple
+from uuid import uuid4
+
+from loguru import logger
+
+from dorsal_ronflex.analyse.aggregates import StudySummary
+from dorsal_ronflex.analyse.simplified_abf import create_unique_dir
+from dorsal_ronflex.settings import Config
+
+_CACHE_VERSION = 1
+_CHUNK_SIZE = 1 << 20
+_STUDY_FILENAME = "study.json"
+_SUMMARY_FILENAME = "summary.pickle"
+_EMITTED_DIRNAME = ".dorsal_ronflex"
+_PACKAGE_DIR = Path(__file__).resolve().parents[1]
+
+
+@cache
+def code_digest() -> str:
+    """Digest of the sources of the package, changing the analysis code
+    changes the keys of the studies.
+    """
+    digest = sha256()
+    for source in sorted(_PACKAGE_DIR.rglob("*.py")):
+        digest.update(source.relative_to(_PACKAGE_DIR).as_posix().encode())
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def hash_study(
+    study_path: str | Path,
+    config: Config,
+    formats: Tuple[str, ...],
+    results_key: Dict[str, Any] | None = None,
+) -> str:
+    """Hash of the study content along with the config it is analysed with,
+    the options changing its results, the formats it is exported to and the
+    code analysing it.
+    """
+    digest = sha256(f"{_CACHE_VERSION}".encode())
+    digest.update(code_digest().encode())
+    digest.update(json.dumps(config, sort_keys=True).encode())
+    digest.update(json.dumps(sorted(formats)).encode())
+    if results_key:
+        digest.update(json.dumps(results_key, sort_keys=True).encode())
+    with open(study_path, "rb") as file:
+        for chunk in iter(partial(file.read, _CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def emitted_dir(output: Path, key: str) -> Path | None:
+    """Output directory already holding the results of the key, if any."""
+    marker = Path(output) / _EMITTED_DIRNAME / key
+    if not marker.is_file():
+        return None
+    output_dir = Path(output) / marker.read_text()
+    return output_dir if output_dir.is_dir() else None
+
+
+def mark_emitted(output: Path, key: str, output_dir: str | Path) -> None:
+    """Records that the results of the key are in output_dir."""
+    markers = Path(output) / _EMITTED_DIRNAME
+    markers.mkdir(exist_ok=True)
+    (markers / key).write_text(Path(output_dir).name)
+
+
+def _entry_size(entry: Path) -> int:
+    """Size in bytes of the files of a cache entry."""
+    return sum(file.stat().st_size for file in entry.iterdir())
+
+
+def _prefix_entries(prefix: str) -> List[Tuple[float, int, Path]]:
+    """Last use, size and path of the entries of a key prefix directory,
+    leaving out the entries still being staged.
+    """
+    return [
+        (entry.stat().st_mtime, _entry_size(Path(entry.path)), Path(entry.path))
+        for entry in scandir(prefix)
+        if entry.is_dir() and not entry.name.startswith(".")
+    ]
+
+
+@dataclass(frozen=True)
+class ResultCache:
+    """On-disk cache of the exported files of the studies.
+    Entries are evicted least recently used first above max_bytes. Cached
+    aggregates are unpickled, the directory must be trusted.
+    """
+
+    directory: Path
+    max_bytes: int
+
+    def _entry(self, key: str) -> Path:
+        """Directory of the entry of the key."""
+        return Path(self.directory) / key[:2] / key
+
+    def get(self, key: str) -> Path | None:
+        """Entry of the key if it is cached, marked as recently used."""
+        entry = self._entry(key)
+        if not entry.is_dir():
+            return None
+        utime(entry)
+        return entry
+
+    def put(
+        self,
+        key: str,
+        name: str,
+        output_dir: str | Path,
+        summary: StudySummary | None = None,
+    ) -> None:
+        """Caches the exported files of a study, and its aggregates if given."""
+        entry = self._entry(key)
+        staging = entry.with_name(f".{key}.{uuid4().hex}")
+        copytree(output_dir, staging)
+        (staging / _STUDY_FILENAME).write_text(json.dumps({"name": name}))
+        if summary is not None:
+            (staging / _SUMMARY_FILENAME).write_bytes(pickle.dumps(summary))
+        try:
+            replace(staging, entry)
+        except OSError:
+            rmtree(staging, ignore_errors=True)
+
+    def summary(self, entry: Path) -> StudySummary | None:
+        """Aggregates cached with the entry, if they were."""
+        summary_path = entry / _SUMMARY_FILENAME
+        if not summary_path.is_file():
+            return None
+        summary: StudySummary = pickle.loads(summary_path.read_bytes())
+        return summary
+
+    def add_summary(self, entry: Path, summary: StudySummary) -> None:
+        """Caches the aggregates of an entry cached without them."""
+        staging = entry / f".{_SUMMARY_FILENAME}.{uuid4().hex}"
+        staging.write_bytes(pickle.dumps(summary))
+        replace(staging, entry / _SUMMARY_FILENAME)
+
+    def emit(self, entry: Path, output: Path) -> str:
+        """Copies a cached entry to a new study directory of output."""
+        name = json.loads((entry / _STUDY_FILENAME).read_text())["name"]
+        output_dir = create_unique_dir(str(output), name)
+        for file in entry.iterdir():
+            if file.name not in (_STUDY_FILENAME, _SUMMARY_FILENAME):
+                copy2(file, output_dir)
+        return output_dir
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        """Last use, size and path of every entry."""
+        if not Path(self.directory).is_dir():
+            return []
+        return [
+            entry
+            for prefix in scandir(self.directory)
+            if prefix.is_dir()
+            for entry in _prefix_entries(prefix.path)
+        ]
+
+    def evict(self) -> None:
+        """Removes the least recently used entries above the size limit."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            rmtree(path, ignore_errors=True)
+            total -= size
+            logger.info(f"Evicted {path.name} from the result cache.")
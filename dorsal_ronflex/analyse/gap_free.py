@@ -0,0 +1,79 @@
+"""Streaming analysis of long gap-free recordings, in bounded memory."""
+
+import csv
+from os.path import join
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Tuple
+
+from loguru import logger
+from numpy import floating
+from numpy.typing import NDArray
+
+from dorsal_ronflex.export.records import EVENT_COLUMNS, StudyMetadata, event_row
+from dorsal_ronflex.export.writers import format_csv_value
+from dorsal_ronflex.settings import DEFAULT_ABS_TOLERANCE_STR, DEFAULT_MS_DELAY_STR
+from dorsal_ronflex.signals.stream import EventStream, StreamEvent
+
+if TYPE_CHECKING:
+    from dorsal_ronflex.analyse.simplified_abf import AbfStudy
+
+EVENTS_SUFFIX = "_events.csv"
+
+
+ChannelStream = Tuple[StudyMetadata, EventStream]
+
+
+def _channel_streams(study: "AbfStudy") -> List[ChannelStream]:
+    """Metadata and event stream of every channel of the study."""
+    header = study.mapped_abf.header
+    return [
+        (
+            study.channel_metadata(channel),
+            EventStream(
+                header.dataSecPerPoint * 1000,
+                study.config[DEFAULT_ABS_TOLERANCE_STR],
+                study.config[DEFAULT_MS_DELAY_STR],
+            ),
+        )
+        for channel in study.channels
+    ]
+
+
+def _feed_chunks(
+    streams: List[ChannelStream], chunks: Iterable[NDArray[floating[Any]]]
+) -> Iterator[Tuple[StudyMetadata, StreamEvent]]:
+    """Events closed by a chunk of every channel."""
+    for (metadata, stream), amps in zip(streams, chunks):
+        for event in stream.feed(amps):
+            yield metadata, event
+
+
+def stream_events(
+    study: "AbfStudy", chunk_seconds: float
+) -> Iterator[Tuple[StudyMetadata, StreamEvent]]:
+    """Events of every channel of the study, as soon as they are detected.
+    The file is memory-mapped and read once, chunk by chunk.
+    """
+    streams = _channel_streams(study)
+    chunk_points = max(1, int(chunk_seconds * study.mapped_abf.header.dataRate))
+    for chunks in study.mapped_abf.read_chunks(study.channels, chunk_points):
+        yield from _feed_chunks(streams, chunks)
+    for metadata, stream in streams:
+        for event in stream.close():
+            yield metadata, event
+
+
+def write_events(study: "AbfStudy", output_dir: str, chunk_seconds: float) -> int:
+    """Streams the events of the study to {name}_events.csv, returns their count"""
+    event_count = 0
+    with open(
+        join(output_dir, f"{study.name}{EVENTS_SUFFIX}"), "w", newline=""
+    ) as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(EVENT_COLUMNS)
+        for metadata, event in stream_events(study, chunk_seconds):
+            writer.writerow(
+                map(format_csv_value, event_row(metadata, event_count, event))
+            )
+            event_count += 1
+    logger.info(f"Found {event_count} events in {study.name}")
+    return event_count
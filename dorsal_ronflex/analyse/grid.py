@@ -0,0 +1,163 @@
+"""Parameter grid analysis, evaluating many configs on the same loaded data."""
+
+import json
+from dataclasses import replace
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple, cast
+
+from loguru import logger
+from numpy import floating
+from numpy.typing import NDArray
+from pandas import DataFrame, concat
+from tqdm import tqdm
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.export.records import SweepColumns
+from dorsal_ronflex.settings import (
+    DEFAULT_CHANNEL_STR,
+    SEGMENT_END_STR,
+    SEGMENT_START_STR,
+    Config,
+    config_interval,
+    load_config,
+)
+from dorsal_ronflex.sweep.create_sweep import create_sweep, create_sweep_results
+from dorsal_ronflex.sweep.result import SweepResult
+
+GRID_FILENAME = "grid.csv"
+
+
+def load_grid(filepath: str | Path) -> Dict[str, List[Any]]:
+    """Loads a grid file, mapping config keys to the values to try."""
+    with open(str(filepath)) as file:
+        grid: Dict[str, List[Any]] = json.load(file)
+    unknown_keys = set(grid) - set(Config.__annotations__)
+    if unknown_keys:
+        raise ValueError(f"Unknown config keys in grid: {sorted(unknown_keys)}")
+    return grid
+
+
+def expand_grid(config: Config, grid: Dict[str, List[Any]]) -> List[Config]:
+    """Every combination of the grid values, on top of the config."""
+    keys = list(grid)
+    combinations = product(*(grid[key] for key in keys))
+    return [
+        cast(Config, {**config, **dict(zip(keys, values))}) for values in combinations
+    ]
+
+
+# Times and (sweeps x samples) amps of a channel, or the times and amps of
+# each of its sweeps when they have unequal lengths
+ChannelData = (
+    Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]
+    | List[Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]]
+)
+
+
+def _grid_channels(study: AbfStudy, config: Config) -> Tuple[int, ...]:
+    """Channels analysed with the config: those of the options, if chosen."""
+    if study.options.all_channels or study.options.channels:
+        return study.channels
+    return (config[DEFAULT_CHANNEL_STR],)
+
+
+def _reader(study: AbfStudy, config: Config) -> AbfStudy:
+    """Study reading what the config analyses. A memory-mapped study only
+    decodes the segment of its config, so another segment needs another reader.
+    """
+    if not study.mapped:
+        return study
+    segment = {SEGMENT_START_STR: config[SEGMENT_START_STR]}
+    segment[SEGMENT_END_STR] = config[SEGMENT_END_STR]
+    return replace(study, config_overrides={**study.config_overrides, **segment})
+
+
+def _read_channel(study: AbfStudy, channel: int) -> ChannelData:
+    """Sweeps of the channel, as a matrix when they have equal lengths."""
+    try:
+        return study.read_matrix(channel)
+    except ValueError:
+        return [
+            study.read_sweep(sweep_number, channel)
+            for sweep_number in study.sweep_numbers
+        ]
+
+
+def _analyse_channel(
+    data: ChannelData, sweep_numbers: List[int], config: Config
+) -> List[SweepResult]:
+    """Results of the sweeps of a channel for the config."""
+    if isinstance(data, tuple):
+        return create_sweep_results(*data, config, sweep_numbers)
+    return [
+        create_sweep(sweep_number, times, amps, config).to_result()
+        for sweep_number, (times, amps) in zip(sweep_numbers, data)
+    ]
+
+
+def _grid_table(
+    study: AbfStudy, config: Config, adc_name: str, sweep_results: List[SweepResult]
+) -> DataFrame:
+    """Tidy table of the sweep results of a channel for the config."""
+    sweep_columns = SweepColumns()
+    for sweep_index, sweep in enumerate(sweep_results):
+        sweep_columns.append(sweep_index, sweep)
+    table = DataFrame(sweep_columns.columns)
+    for position, (key, value) in enumerate(config.items()):
+        table.insert(position, key, value)
+    table.insert(0, "ADC Name", adc_name)
+    table.insert(0, "Study", study.name)
+    return table
+
+
+def analyse_study_grid(study: AbfStudy, configs: Iterable[Config]) -> DataFrame:
+    """Tidy table of the sweep results of the study for every config.
+    Each channel is read once, and once per segment when memory-mapped, through
+    the same reads as a normal analysis of the study.
+    """
+    channel_data: Dict[Tuple[int, Tuple[int, int] | None], ChannelData] = {}
+    tables = []
+    for config in configs:
+        reader = _reader(study, config)
+        interval = config_interval(config) if study.mapped else None
+        for channel in _grid_channels(study, config):
+            if (channel, interval) not in channel_data:
+                channel_data[channel, interval] = _read_channel(reader, channel)
+            try:
+                sweep_results = _analyse_channel(
+                    channel_data[channel, interval], study.sweep_numbers, config
+                )
+            except ValueError as e:
+                logger.warning(f"Skipping {config} for {study.name}: {e}")
+                continue
+            adc_name = study.header.adcNames[channel]
+            tables.append(_grid_table(study, config, adc_name, sweep_results))
+    return concat(tables, ignore_index=True) if tables else DataFrame()
+
+
+def analyse_and_save_grid(
+    files: Iterable[Path],
+    output: Path,
+    config_path: str | Path | None,
+    grid_path: str | Path,
+    options: StudyOptions = StudyOptions(),
+) -> Path:
+    """Analyses every study over the grid, in one table saved to output.
+    The studies are read as the options say (mapped, channels, sweeps).
+    """
+    configs = expand_grid(load_config(config_path), load_grid(grid_path))
+    logger.info(f"Evaluating {len(configs)} configs per study.")
+    tables = []
+    for file in tqdm(list(files)):
+        try:
+            tables.append(
+                analyse_study_grid(AbfStudy(file, config_path, options), configs)
+            )
+        except Exception as e:
+            logger.critical(f"Error analysing {file}: {e}")
+    destination = Path(output) / GRID_FILENAME
+    table = concat(tables, ignore_index=True) if tables else DataFrame()
+    table.to_csv(destination, index=False)
+    logger.info(f"Grid results saved to {destination}")
+    return destination
@@ -0,0 +1,95 @@
+"""Memory-mapped ABF reading, decoding only the samples we analyse."""
+
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Iterator, List, Tuple
+
+from numpy import add, arange, float32, floating, int16, memmap, multiply
+from numpy.typing import NDArray
+from pyabf import ABF
+
+from dorsal_ronflex.profiling import profiled
+from dorsal_ronflex.signals.create_signals import segment_window
+
+
+@profiled("load_abf")
+def load_abf_header(abf_file: str | Path) -> ABF:
+    """Load the header of an ABF file, without its data."""
+    return ABF(abf_file, loadData=False)
+
+
+@dataclass
+class MappedAbf:
+    """ABF header along with a memory map of its data section.
+    Samples are scaled like pyabf does, but only for the requested
+    channel and segment window.
+    """
+
+    filepath: str | Path
+
+    @cached_property
+    def header(self) -> ABF:
+        """ABF object holding the header only."""
+        return load_abf_header(self.filepath)
+
+    @cached_property
+    def samples(self) -> NDArray[Any]:
+        """Raw interleaved samples, shaped (sweeps, sweep points, channels)."""
+        header = self.header
+        sweep_shape = (header.sweepCount, header.sweepPointCount, header.channelCount)
+        if header.dataPointCount != sweep_shape[0] * sweep_shape[1] * sweep_shape[2]:
+            raise ValueError("Memory-mapped reading needs sweeps of equal length.")
+        return memmap(
+            self.filepath,
+            dtype=header._dtype,
+            mode="r",
+            offset=header.dataByteStart,
+            shape=sweep_shape,
+        )
+
+    @cached_property
+    def sweep_times(self) -> NDArray[floating[Any]]:
+        """Time of every point of a sweep, in seconds, as pyabf's sweepX."""
+        return arange(self.header.sweepPointCount) * self.header.dataSecPerPoint
+
+    def _scale(self, raw: NDArray[Any], channel: int) -> NDArray[floating[Any]]:
+        """Converts raw samples of a channel to float32 values."""
+        data = raw.astype(float32)
+        if self.header._dtype == int16:
+            multiply(data, self.header._dataGain[channel], out=data, dtype=float32)
+            add(data, self.header._dataOffset[channel], out=data, dtype=float32)
+        return data
+
+    def read_window(
+        self, sweep_number: int, channel: int, interval: Tuple[int, int]
+    ) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+        """Times and scaled samples of a sweep within the interval (in ms)."""
+        window = segment_window(self.sweep_times, interval)
+        raw = self.samples[sweep_number, window, channel]
+        return self.sweep_times[window], self._scale(raw, channel)
+
+    def read_window_matrix(
+        self,
+        channel: int,
+        interval: Tuple[int, int],
+        sweep_numbers: List[int] | None = None,
+    ) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+        """Times and (sweeps x samples) scaled samples within the interval,
+        of every sweep or only of sweep_numbers.
+        """
+        window = segment_window(self.sweep_times, interval)
+        sweeps = slice(None) if sweep_numbers is None else sweep_numbers
+        raw = self.samples[sweeps, window, channel]
+        return self.sweep_times[window], self._scale(raw, channel)
+
+    def read_chunks(
+        self, channels: Tuple[int, ...], chunk_points: int
+    ) -> Iterator[Tuple[NDArray[floating[Any]], ...]]:
+        """Scaled samples of the channels, chunk by chunk, as one continuous
+        recording (sweeps after one another), only a chunk being decoded at once.
+        """
+        flat = self.samples.reshape(-1, self.header.channelCount)
+        for start in range(0, len(flat), chunk_points):
+            raw = flat[start : start + chunk_points]
+            yield tuple(self._scale(raw[:, channel], channel) for channel in channels)
@@ -0,0 +1,262 @@
+"""Header-only pre-scan of the studies, and memory-aware scheduling.
+
+Only the ABF headers are read, to leave out the files the analysis would fail
+on and to estimate the cost and memory of the others, so that the largest
+studies start first and never run together beyond a memory budget.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from os.path import getsize
+from pathlib import Path
+from typing import Collection, Dict, List, Tuple
+
+from loguru import logger
+
+from dorsal_ronflex.analyse.mapped_abf import load_abf_header
+from dorsal_ronflex.analyse.simplified_abf import StudyOptions
+from dorsal_ronflex.settings import (
+    DEFAULT_CHANNEL_STR,
+    Config,
+    config_interval,
+    load_config,
+)
+from dorsal_ronflex.sweep.selection import select_sweeps
+
+# Bytes held per sample of a file loaded by pyabf: int16 read, float32 scaled
+_LOADED_BYTES_PER_POINT = 6
+# Bytes per analysed sample: float64 raw and abs signals, cumulative area, temps
+_WORKING_BYTES_PER_POINT = 32
+_SCAN_THREADS = 8
+
+
+@dataclass(frozen=True)
+class StudyHeader:
+    """What the header of an ABF file tells about its analysis."""
+
+    path: Path
+    size: int
+    protocol: str
+    sweep_count: int
+    channel_count: int
+    sweep_point_count: int
+    sample_rate: float
+    data_point_count: int
+
+    @property
+    def equal_sweeps(self) -> bool:
+        """Whether every sweep has the same number of points."""
+        sweep_points = self.sweep_count * self.sweep_point_count
+        return self.data_point_count == sweep_points * self.channel_count
+
+    @property
+    def sweep_ms(self) -> float:
+        """Duration of a sweep, in ms."""
+        return self.sweep_point_count * 1000 / self.sample_rate
+
+
+def read_header(path: Path) -> StudyHeader:
+    """Header of the file, without reading its data."""
+    header = load_abf_header(path)
+    return StudyHeader(
+        path=path,
+        size=getsize(path),
+        protocol=str(header.protocol),
+        sweep_count=int(header.sweepCount),
+        channel_count=int(header.channelCount),
+        sweep_point_count=int(header.sweepPointCount),
+        sample_rate=float(header.dataRate),
+        data_point_count=int(header.dataPointCount),
+    )
+
+
+@dataclass(frozen=True)
+class PlannedStudy:
+    """A compatible study, with its estimated cost and memory."""
+
+    header: StudyHeader
+    samples: int
+    memory_bytes: int
+
+    @property
+    def path(self) -> Path:
+        """Path of the study."""
+        return self.header.path
+
+
+@dataclass(frozen=True)
+class PlanOptions:
+    """Which studies a planned run keeps, and how many of them run together."""
+
+    memory_budget: int | None = None
+    protocols: Tuple[str, ...] = ()
+
+
+@dataclass
+class Plan:
+    """Studies to analyse, largest first, and the files left out."""
+
+    studies: List[PlannedStudy] = field(default_factory=list)
+    skipped: Dict[str, str] = field(default_factory=dict)
+
+
+def _channels(header: StudyHeader, options: StudyOptions, default: int) -> List[int]:
+    """Channels of the file the study is analysed on."""
+    if options.all_channels:
+        return list(range(header.channel_count))
+    return list(options.channels or (default,))
+
+
+def _channel_incompatibility(header: StudyHeader, channels: List[int]) -> str | None:
+    """Why a channel of the study cannot be read, if one cannot."""
+    for channel in channels:
+        if not 0 <= channel < header.channel_count:
+            return f"Channel {channel} not available ({header.channel_count} channels)."
+    return None
+
+
+def _sweep_incompatibility(
+    header: StudyHeader, interval: Tuple[int, int], options: StudyOptions
+) -> str | None:
+    """Why the sweeps of the study cannot be analysed, if they cannot."""
+    if (options.matrix or options.mapped) and not header.equal_sweeps:
+        return "Matrix and mapped modes need sweeps of equal length."
+    if not options.gap_free and header.sweep_ms <= interval[0]:
+        return f"Sweeps of {header.sweep_ms:g} ms end before the analysed segment."
+    return None
+
+
+def incompatibility(
+    header: StudyHeader,
+    channels: List[int],
+    interval: Tuple[int, int],
+    options: StudyOptions,
+    protocols: Collection[str] = (),
+) -> str | None:
+    """Why the analysis of the study would fail or is not wanted, if it would."""
+    if header.sweep_count <= 0:
+        return "No sweeps."
+    if protocols and header.protocol not in protocols:
+        return f"Protocol {header.protocol} is not analysed."
+    return _channel_incompatibility(header, channels) or _sweep_incompatibility(
+        header, interval, options
+    )
+
+
+def estimate(
+    header: StudyHeader,
+    channels: List[int],
+    interval: Tuple[int, int],
+    options: StudyOptions,
+) -> PlannedStudy:
+    """Samples analysed and peak memory estimated for the study."""
+    if options.gap_free:
+        chunk_points = int(options.chunk_seconds * header.sample_rate)
+        return PlannedStudy(
+            header=header,
+            samples=header.data_point_count // header.channel_count * len(channels),
+            memory_bytes=chunk_points * _WORKING_BYTES_PER_POINT,
+        )
+    sweep_count = header.sweep_count
+    if options.sweeps is not None:
+        sweep_count = len(select_sweeps(options.sweeps, header.sweep_count))
+    window_ms = min(interval[1], header.sweep_ms) - interval[0]
+    window_points = max(1, int(window_ms * header.sample_rate / 1000))
+    mapped = options.mapped or (options.sweeps is not None and header.equal_sweeps)
+    loaded_bytes = 0 if mapped else header.data_point_count * _LOADED_BYTES_PER_POINT
+    all_at_once = options.matrix or options.sweep_jobs > 1
+    working_points = window_points * (sweep_count if all_at_once else 1)
+    return PlannedStudy(
+        header=header,
+        samples=sweep_count * window_points * len(channels),
+        memory_bytes=loaded_bytes + working_points * _WORKING_BYTES_PER_POINT,
+    )
+
+
+def _scan(path: Path) -> StudyHeader | str:
+    """Header of the file, or why it could not be read."""
+    try:
+        return read_header(path)
+    except Exception as e:
+        return str(e) or type(e).__name__
+
+
+def _plan_study(
+    header: StudyHeader,
+    config: Config,
+    options: StudyOptions,
+    protocols: Collection[str],
+) -> PlannedStudy | str:
+    """Estimated cost of the study, or why it is left out."""
+    channels = _channels(header, options, config[DEFAULT_CHANNEL_STR])
+    interval = config_interval(config)
+    reason = incompatibility(header, channels, interval, options, protocols)
+    if reason is not None:
+        return reason
+    try:
+        return estimate(header, channels, interval, options)
+    except ValueError as e:
+        return str(e)
+
+
+def prescan(
+    files: List[Path],
+    config_path: str | Path | None,
+    options: StudyOptions,
+    protocols: Collection[str] = (),
+) -> Plan:
+    """Reads the headers of the files, leaves out the incompatible ones and
+    orders the others largest first.
+    """
+    config = load_config(config_path)
+    plan = Plan()
+    with ThreadPoolExecutor(max_workers=_SCAN_THREADS) as executor:
+        for path, header in zip(files, executor.map(_scan, files)):
+            planned = (
+                header
+                if isinstance(header, str)
+                else _plan_study(header, config, options, protocols)
+            )
+            if isinstance(planned, str):
+                plan.skipped[str(path)] = planned
+            else:
+                plan.studies.append(planned)
+    plan.studies.sort(key=lambda study: (-study.memory_bytes, -study.samples))
+    for path, reason in plan.skipped.items():
+        logger.warning(f"Skipping {path}: {reason}")
+    logger.info(
+        f"Pre-scan: {len(plan.studies)} studies to analyse, "
+        f"{len(plan.skipped)} left out."
+    )
+    return plan
+
+
+def take_fitting(
+    pending: List[PlannedStudy],
+    running_bytes: int,
+    running_count: int,
+    budget_bytes: int | None,
+    jobs: int,
+) -> List[PlannedStudy]:
+    """Removes from pending (largest first) the studies to start now: as many as
+    free jobs, as long as the running ones stay under the budget. A study above
+    the whole budget starts alone.
+    """
+    taken: List[PlannedStudy] = []
+    for study in list(pending):
+        if running_count + len(taken) >= jobs:
+            break
+        idle = running_count + len(taken) == 0
+        fits = (
+            budget_bytes is None or running_bytes + study.memory_bytes <= budget_bytes
+        )
+        if fits or idle:
+            if not fits:
+                logger.warning(
+                    f"{study.path} needs about {study.memory_bytes / 2**20:.0f} MB, "
+                    "more than the memory budget, it runs alone."
+                )
+            pending.remove(study)
+            taken.append(study)
+            running_bytes += study.memory_bytes
+    return taken
@@ -0,0 +1,155 @@
+"""Warm analysis server, answering requests with JSON results.
+
+Each request is a line of JSON:
+
+    {"path": "...", "config": {"default_tolerance": 0.2}, "channels": [0, 1]}
+
+and gets a line of JSON back, with the results of every sweep of every
+channel analysed, or the error. Nothing is written to disk. The config file
+is the one the server was started with, requests only override its values.
+"""
+
+import json
+import socketserver
+from argparse import ArgumentParser
+from concurrent.futures import Executor, ProcessPoolExecutor
+from os import unlink
+from pathlib import Path
+from signal import SIG_IGN, SIGINT, signal
+from socket import AF_UNIX
+from typing import Any, Dict
+
+from loguru import logger
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.client import DEFAULT_ADDRESS, parse_address
+
+
+def analyse_request(
+    request: Dict[str, Any], config_path: str | Path | None = None
+) -> Dict[str, Any]:
+    """JSON results of an analysis request, or its error. The request
+    overrides values of the config at config_path, never the path itself.
+    """
+    try:
+        options = StudyOptions(
+            matrix=bool(request.get("matrix", False)),
+            mapped=bool(request.get("mapped", False)),
+            channels=tuple(request.get("channels", ())),
+            all_channels=bool(request.get("all_channels", False)),
+            sweeps=request.get("sweeps"),
+        )
+        study = AbfStudy(
+            request["path"],
+            config_path,
+            options,
+            request.get("config", {}),
+        )
+        return {
+            "study": study.name,
+            "channels": [
+                {
+                    "adc_name": metadata.adc_name,
+                    "adc_units": metadata.adc_units,
+                    "sweeps": [sweep.to_dict() for sweep in sweep_results],
+                }
+                for metadata, sweep_results in study.channel_sweeps()
+            ],
+        }
+    except KeyError as e:
+        return {"error": f"Missing {e} in the request."}
+    except Exception as e:
+        logger.error(f"Error analysing {request.get('path')}: {e}")
+        return {"error": str(e) or type(e).__name__}
+
+
+def _ignore_interrupts() -> None:
+    """Leaves Ctrl+C to the server, which shuts the workers down."""
+    signal(SIGINT, SIG_IGN)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers the requests of a connection, one JSON line each."""
+
+    server: "AnalysisServer"
+
+    def handle(self) -> None:
+        """Answers every request line until the client disconnects."""
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                response = {"error": f"Invalid request: {e}"}
+            else:
+                response = self.server.analyse(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class AnalysisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Keeps the analysis modules, and a pool of warm workers when jobs > 1,
+    between requests. Listens on unix:/path/to/socket or host:port.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self, address: str, config_path: str | Path | None = None, jobs: int = 1
+    ) -> None:
+        family, socket_address = parse_address(address)
+        self.address_family = family
+        self.config_path = config_path
+        self.executor: Executor | None = None
+        self.bound = False
+        super().__init__(socket_address, _RequestHandler)
+        if jobs > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=jobs, initializer=_ignore_interrupts
+            )
+            for future in [self.executor.submit(int) for _ in range(jobs)]:
+                future.result()
+
+    def server_bind(self) -> None:
+        """Binds the socket, a unix socket file is then ours to remove."""
+        super().server_bind()
+        self.bound = True
+
+    def analyse(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Results of a request, analysed on the pool when there is one."""
+        if self.executor is None:
+            return analyse_request(request, self.config_path)
+        return self.executor.submit(analyse_request, request, self.config_path).result()
+
+    def server_close(self) -> None:
+        """Closes the socket, the pool and removes the unix socket file."""
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.address_family == AF_UNIX and self.bound:
+            unlink(self.server_address)
+
+
+def main() -> None:
+    """Runs the analysis server until interrupted."""
+    parser = ArgumentParser(description="Dorsal Ronflex analysis server")
+    parser.add_argument(
+        "-a",
+        "--address",
+        default=DEFAULT_ADDRESS,
+        help="host:port or unix:/path/to/socket to listen on.",
+    )
+    parser.add_argument("-c", "--config", default=None, type=Path)
+    parser.add_argument("-j", "--jobs", default=1, type=int)
+    args = parser.parse_args()
+
+    with AnalysisServer(args.address, args.config, args.jobs) as server:
+        logger.info(f"Listening on {args.address}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Shutting down.")
+
+
+if __name__ == "__main__":
+    main()
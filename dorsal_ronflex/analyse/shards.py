@@ -0,0 +1,257 @@
+"""Sharded batch runs over several nodes, and the merge of their results.
+
+Every node lists the same tree and keeps its own slice of it: the partition
+only depends on the relative paths and sizes of the files, so the shards are
+disjoint and cover the tree without any coordination. Each shard writes a
+manifest next to its results, and merge_shards combines them.
+"""
+
+import csv
+import heapq
+import json
+from dataclasses import dataclass
+from os.path import getsize
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from loguru import logger
+
+MERGED_RESULTS_FILENAME = "results.csv"
+MERGED_FAILURES_FILENAME = "failures.csv"
+MERGED_MANIFEST_FILENAME = "manifest.json"
+_MANIFEST_GLOB = "shard-*-of-*.json"
+
+# Path and content of the manifest of each shard, by shard index
+Manifests = Dict[int, Tuple[Path, Dict[str, Any]]]
+# Shard index, manifest path and manifest entry of a study
+ShardStudy = Tuple[int, Path, Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Shard index (from 1) out of count."""
+
+    index: int
+    count: int
+
+    def __str__(self) -> str:
+        """i/N, as given on the command line."""
+        return f"{self.index}/{self.count}"
+
+    @property
+    def manifest_name(self) -> str:
+        """File name of the manifest of the shard."""
+        return f"shard-{self.index}-of-{self.count}.json"
+
+
+def parse_shard(text: str) -> Shard:
+    """Shard of i/N, i going from 1 to N."""
+    index, _, count = text.partition("/")
+    try:
+        shard = Shard(int(index), int(count))
+    except ValueError:
+        raise ValueError(f"Invalid shard {text}, expected i/N.") from None
+    if not 1 <= shard.index <= shard.count:
+        raise ValueError(f"Invalid shard {text}, i must be between 1 and N.")
+    return shard
+
+
+def relative_path(file: Path, root: Path) -> str:
+    """Path of the file relative to the root of the tree, the same on every node."""
+    return file.relative_to(root).as_posix() if root.is_dir() else file.name
+
+
+def partition(files: List[Path], root: Path, count: int) -> List[List[Path]]:
+    """Size-balanced partition of the files in count shards: largest first, each
+    file goes to the lightest shard so far (the first one on ties).
+    """
+    sized = sorted(
+        ((getsize(file), relative_path(file, root), file) for file in files),
+        key=lambda item: (-item[0], item[1]),
+    )
+    loads: List[Tuple[int, int]] = [(0, index) for index in range(count)]
+    shards: List[List[Path]] = [[] for _ in range(count)]
+    for size, _, file in sized:
+        load, index = heapq.heappop(loads)
+        shards[index].append(file)
+        heapq.heappush(loads, (load + size, index))
+    return [sorted(shard) for shard in shards]
+
+
+def shard_files(files: List[Path], root: Path, shard: Shard) -> List[Path]:
+    """Files of the tree processed by the shard."""
+    return partition(files, root, shard.count)[shard.index - 1]
+
+
+def write_manifest(
+    output: Path,
+    shard: Shard,
+    root: Path,
+    files: List[Path],
+    failed: Dict[str, str],
+    output_dirs: Dict[str, str],
+) -> Path:
+    """Writes what the shard processed, where the results are and its failures."""
+    studies = []
+    for file in files:
+        output_dir = output_dirs.get(str(file))
+        studies.append(
+            {
+                "path": relative_path(file, root),
+                "size": getsize(file),
+                "output_dir": (
+                    None
+                    if output_dir is None
+                    else Path(output_dir).relative_to(output).as_posix()
+                ),
+                "error": failed.get(str(file)),
+            }
+        )
+    manifest_path = Path(output) / shard.manifest_name
+    manifest = {"shard": shard.index, "shard_count": shard.count, "studies": studies}
+    manifest_path.write_text(json.dumps(manifest, indent=4))
+    logger.info(f"Shard {shard} manifest written to {manifest_path}")
+    return manifest_path
+
+
+def _find_manifests(paths: List[Path]) -> List[Path]:
+    """Manifests given, or found in the shard output directories given."""
+    manifests = []
+    for path in paths:
+        if path.is_dir():
+            manifests.extend(sorted(path.glob(_MANIFEST_GLOB)))
+        elif path.is_file():
+            manifests.append(path)
+        else:
+            raise ValueError(f"{path} is not a shard output directory nor manifest.")
+    return manifests
+
+
+def _study_table(manifest_path: Path, study: Dict[str, Any]) -> Path | None:
+    """CSV export of a study of a manifest, if there is one."""
+    if study["output_dir"] is None:
+        return None
+    output_dir = manifest_path.parent / study["output_dir"]
+    table = output_dir / f"{Path(study['path']).stem}.csv"
+    return table if table.is_file() else None
+
+
+def _load_manifests(paths: List[Path]) -> Tuple[int, Manifests]:
+    """Shard count and manifests by shard index, checked to be of one run."""
+    manifests = {}
+    for manifest_path in _find_manifests(paths):
+        manifest = json.loads(manifest_path.read_text())
+        manifests[(manifest["shard"], manifest["shard_count"])] = (
+            manifest_path,
+            manifest,
+        )
+    if not manifests:
+        raise ValueError(f"No shard manifest found in {paths}.")
+    shard_counts = {shard_count for _, shard_count in manifests}
+    if len(shard_counts) != 1:
+        raise ValueError(f"Expected the manifests of one run, got {shard_counts}.")
+    return shard_counts.pop(), {
+        index: loaded for (index, _), loaded in manifests.items()
+    }
+
+
+def _missing_shards(manifests: Manifests, shard_count: int) -> List[int]:
+    """Indices of the shards of the run without a manifest."""
+    missing = [i for i in range(1, shard_count + 1) if i not in manifests]
+    if missing:
+        logger.warning(f"Missing shards {missing} out of {shard_count}")
+    return missing
+
+
+def _collect_studies(manifests: Manifests) -> Dict[str, ShardStudy]:
+    """Studies of every shard by relative path, each in a single shard."""
+    studies: Dict[str, ShardStudy] = {}
+    for index, (manifest_path, manifest) in sorted(manifests.items()):
+        for study in manifest["studies"]:
+            if study["path"] in studies:
+                raise ValueError(
+                    f"{study['path']} is in shards {studies[study['path']][0]} "
+                    f"and {index}."
+                )
+            studies[study["path"]] = (index, manifest_path, study)
+    return studies
+
+
+def _write_failures(path: Path, studies: Dict[str, ShardStudy]) -> None:
+    """Writes the failed studies, with their shard and error."""
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(("Study", "Shard", "Error"))
+        for relative, (index, _, study) in sorted(studies.items()):
+            if study["error"] is not None:
+                writer.writerow((relative, index, study["error"]))
+
+
+def _study_tables(studies: Dict[str, ShardStudy]) -> Iterator[Path]:
+    """CSV exports of the succeeded studies, by relative path."""
+    for relative, (index, manifest_path, study) in sorted(studies.items()):
+        if study["error"] is not None:
+            continue
+        table = _study_table(manifest_path, study)
+        if table is None:
+            logger.warning(f"No CSV results for {relative} in shard {index}")
+            continue
+        yield table
+
+
+def _read_table(table: Path) -> Tuple[List[str], List[List[str]]]:
+    """Header and rows of a CSV export."""
+    with open(table, newline="") as file:
+        rows = list(csv.reader(file))
+    return rows[0], rows[1:]
+
+
+def _merge_tables(path: Path, tables: Iterable[Path]) -> int:
+    """Writes the rows of the tables one after another, renumbering the index
+    of each study so that it runs over the whole results. Returns the number
+    of tables merged.
+    """
+    header = None
+    row_count = table_count = 0
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        for table in tables:
+            table_header, rows = _read_table(table)
+            if header is None:
+                header = table_header
+                writer.writerow(header)
+            elif table_header != header:
+                raise ValueError(f"{table} has other columns than {header}.")
+            for row in rows:
+                writer.writerow((row_count, *row[1:]))
+                row_count += 1
+            table_count += 1
+    return table_count
+
+
+def merge_shards(paths: List[Path], output: Path) -> Dict[str, Any]:
+    """Combines the results and failures of the shards into output, the same
+    whatever the number of shards: studies are sorted by their relative path.
+    Returns the merged manifest.
+    """
+    shard_count, manifests = _load_manifests(paths)
+    missing = _missing_shards(manifests, shard_count)
+    studies = _collect_studies(manifests)
+    output.mkdir(parents=True, exist_ok=True)
+    _write_failures(output / MERGED_FAILURES_FILENAME, studies)
+    table_count = _merge_tables(
+        output / MERGED_RESULTS_FILENAME, _study_tables(studies)
+    )
+
+    merged = {
+        "shard_count": shard_count,
+        "missing_shards": missing,
+        "studies": len(studies),
+        "merged": table_count,
+        "failed": sum(study["error"] is not None for _, _, study in studies.values()),
+    }
+    (output / MERGED_MANIFEST_FILENAME).write_text(json.dumps(merged, indent=4))
+    logger.info(
+        f"Merged {table_count} studies of {len(manifests)} shards into {output}"
+    )
+    return merged
@@ -1,23 +1,39 @@
 """Simplified ABF file handling."""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from functools import cached_property
 from os import mkdir
 from os.path import join
 from pathlib import Path
-from typing import List
+from shutil import rmtree
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Tuple
 
 from genericpath import exists
 from loguru import logger
-from pandas import DataFrame, concat
+from numpy import arange, floating
+from numpy.typing import NDArray
 from pyabf import ABF
 
-from dorsal_ronflex.settings import CONFIG, DEFAULT_CHANNEL_STR, ConfigLoader
-from dorsal_ronflex.sweep.create_sweep import create_sweep
+from dorsal_ronflex.analyse.mapped_abf import MappedAbf
+from dorsal_ronflex.export.records import CSV_COLUMNS, StudyMetadata, sweep_row
+from dorsal_ronflex.export.writers import DEFAULT_FORMATS, ChannelSweeps, write_channels
+from dorsal_ronflex.profiling import profiled
+from dorsal_ronflex.settings import (
+    DEFAULT_CHANNEL_STR,
+    Config,
+    config_interval,
+    load_config,
+    override_config,
+)
+from dorsal_ronflex.signals.create_signals import segment_window
+from dorsal_ronflex.sweep.create_sweep import create_sweep, create_sweep_results
+from dorsal_ronflex.sweep.result import SweepResult
+from dorsal_ronflex.sweep.selection import select_sweeps
 from dorsal_ronflex.sweep.sweep import Sweep
 
-_DEFAULT_CHANNEL = CONFIG[DEFAULT_CHANNEL_STR]
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
 
 def generate_unique_dirname(directory: str, dirname: str) -> str:
@@ -32,41 +48,186 @@ def generate_unique_dirname(directory: str, dirname: str) -> str:
     return new_dirname
 
 
+def create_unique_dir(directory: str, dirname: str) -> str:
+    """Create a directory with a unique name, safe against concurrent runs."""
+    while True:
+        output_dir = join(directory, generate_unique_dirname(directory, dirname))
+        try:
+            mkdir(output_dir)
+            return output_dir
+        except FileExistsError:
+            continue
+
+
+@profiled("load_abf")
 def load_abf(abf_file: str | Path) -> ABF:
     """Load an ABF file and return the ABF object."""
     abf = ABF(abf_file)
     return abf
 
 
+def check_channel(abf: ABF, channel: int) -> None:
+    """Raises like pyabf does when the channel is not in the file."""
+    if channel not in abf.channelList:
+        raise ValueError(
+            f"Channel {channel} not available (must be 0 - {abf.channelCount - 1})"
+        )
+
+
+def check_sweep(sweep_number: int, sweep_count: int) -> None:
+    """Raises when the sweep is not in the file, rather than reading another."""
+    if not 0 <= sweep_number < sweep_count:
+        raise ValueError(
+            f"Sweep {sweep_number} not available (must be 0 - {sweep_count - 1})"
+        )
+
+
+def sweep_window(abf: ABF, sweep_number: int) -> slice:
+    """Samples of the sweep in the channel data, as setSweep slices them.
+    Mirrors setSweep of the pinned pyabf version, which only reads the synch
+    array of ABF2 files, when there is one.
+    """
+    synch_array = getattr(abf, "_synchArraySection", None)
+    if (
+        abf.sweepCount > 1
+        and synch_array is not None
+        and len(set(synch_array.lLength)) > 1
+    ):
+        lengths = [length // abf.channelCount for length in synch_array.lLength]
+        start = sum(lengths[:sweep_number])
+        return slice(start, start + lengths[sweep_number])
+    start = abf.sweepPointCount * sweep_number
+    return slice(start, start + abf.sweepPointCount)
+
+
+def _sweeps_repr(sweep_results: Iterable[SweepResult]) -> str:
+    """Representation of the results of sweeps, one block per sweep."""
+    return "\n".join(sweep.to_txt() for sweep in sweep_results)
+
+
+def load_channel_matrix(
+    abf: ABF, channel: int
+) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+    """Returns the sweep time axis and a (sweeps x samples) view of the channel"""
+    abf.setSweep(0, channel=channel)
+    sweep_count, sweep_length = abf.sweepCount, abf.sweepPointCount
+    channel_data = abf.data[channel]
+    if len(channel_data) != sweep_count * sweep_length:
+        raise ValueError("Matrix mode needs sweeps of equal length.")
+    return abf.sweepX, channel_data.reshape(sweep_count, sweep_length)
+
+
+@dataclass(frozen=True)
+class StudyOptions:
+    """How a study is read and analysed."""
+
+    matrix: bool = False
+    mapped: bool = False
+    formats: Tuple[str, ...] = DEFAULT_FORMATS
+    channels: Tuple[int, ...] = ()
+    all_channels: bool = False
+    gap_free: bool = False
+    chunk_seconds: float = 10.0
+    profile_dir: Path | None = None
+    plot_formats: Tuple[str, ...] = ()
+    plot_jobs: int = 1
+    database: Path | None = None
+    sweeps: str | None = None
+    sweep_jobs: int = 1
+
+    def results_key(self) -> Dict[str, Any]:
+        """Options changing the results of a study, its exported files or where
+        they are written, besides its config and formats.
+        """
+        key = {
+            "channels": "all" if self.all_channels else list(self.channels),
+            "gap_free": self.gap_free,
+            "plots": sorted(self.plot_formats),
+            "sweeps": self.sweeps,
+            "database": (
+                None if self.database is None else str(self.database.resolve())
+            ),
+        }
+        return {name: value for name, value in key.items() if value}
+
+
 @dataclass
 class AbfStudy:
     """Everything we need from a study."""
 
     filepath: str | Path
     config_filepath: str | Path | None = None
+    options: StudyOptions = field(default_factory=StudyOptions)
+    config_overrides: Dict[str, Any] = field(default_factory=dict)
+
+    @cached_property
+    def config(self) -> Config:
+        """Config the study is analysed with."""
+        return override_config(load_config(self.config_filepath), self.config_overrides)
+
+    @cached_property
+    def channels(self) -> Tuple[int, ...]:
+        """ADC channels analysed, the config one unless chosen in the options."""
+        if self.options.all_channels:
+            return tuple(self.header.channelList)
+        return self.options.channels or (self.config[DEFAULT_CHANNEL_STR],)
+
+    @cached_property
+    def channel(self) -> int:
+        """First ADC channel analysed."""
+        return self.channels[0]
 
     @cached_property
     def abf(self) -> ABF:
         """Load an ABF file and return the ABF object."""
-        ConfigLoader().init(self.config_filepath)
         return load_abf(self.filepath)
 
+    @cached_property
+    def mapped_abf(self) -> MappedAbf:
+        """Memory-mapped ABF, only decoding the analysed window."""
+        return MappedAbf(self.filepath)
+
+    @cached_property
+    def mapped(self) -> bool:
+        """Whether the sweeps are read from a memory map, only decoding what is
+        analysed. Selecting sweeps maps the file when they have equal lengths.
+        """
+        if self.options.mapped or self.options.sweeps is None:
+            return self.options.mapped
+        header = self.mapped_abf.header
+        point_count = header.sweepCount * header.sweepPointCount * header.channelCount
+        return bool(header.dataPointCount == point_count)
+
+    @cached_property
+    def header(self) -> ABF:
+        """ABF object for the metadata, without data when memory-mapped."""
+        if self.mapped:
+            return self.mapped_abf.header
+        return self.abf
+
     @cached_property
     def name(self) -> str:
         """Name of the file."""
-        return self.abf.abfID
+        return self.header.abfID
 
     @cached_property
     def sweep_count(self) -> int:
         """Number of sweeps in the file."""
-        if isinstance(count := self.abf.sweepCount, (int, float)) and count > 0:
+        if isinstance(count := self.header.sweepCount, (int, float)) and count > 0:
             return int(count)
         raise ValueError("Sweep count is not a positive integer.")
 
+    @cached_property
+    def sweep_numbers(self) -> List[int]:
+        """Sweeps analysed, all of them unless selected in the options."""
+        if self.options.sweeps is None:
+            return list(range(self.sweep_count))
+        return select_sweeps(self.options.sweeps, self.sweep_count)
+
     @cached_property
     def abd_start_time(self) -> datetime | None:
         """Start time of the file."""
-        if isinstance(start_time := self.abf.abfDateTime, datetime):
+        if isinstance(start_time := self.header.abfDateTime, datetime):
             return start_time
         logger.warning("Start time is not a datetime | str object.")
         return None
@@ -74,89 +235,266 @@ class AbfStudy:
     @cached_property
     def protocol(self) -> str:
         """Protocol of the file."""
-        return self.abf.protocol
+        return self.header.protocol
 
     @cached_property
     def adc_name(self) -> str:
         """Name of the ADC channel."""
-        return self.abf.adcNames[_DEFAULT_CHANNEL]
+        return self.header.adcNames[self.channel]
 
     @cached_property
     def adc_units(self) -> str:
         """Units of the ADC channel."""
-        return str(self.abf.adcUnits[_DEFAULT_CHANNEL])
+        return str(self.header.adcUnits[self.channel])
+
+    @profiled("read_sweep")
+    def read_sweep(
+        self, sweep_number: int, channel: int | None = None
+    ) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+        """Times and amps of a sweep, on the first channel by default.
+        Slices the data decoded at load time, without setSweep.
+        """
+        channel = self.channel if channel is None else channel
+        check_sweep(sweep_number, self.sweep_count)
+        if self.mapped:
+            return self.mapped_abf.read_window(
+                sweep_number, channel, config_interval(self.config)
+            )
+        check_channel(self.abf, channel)
+        amps = self.abf.data[channel][sweep_window(self.abf, sweep_number)]
+        return arange(len(amps)) * self.abf.dataSecPerPoint, amps
+
+    @profiled("read_matrix")
+    def read_matrix(
+        self, channel: int | None = None
+    ) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+        """Times and (sweeps x samples) amps of the sweeps analysed, on the first
+        channel by default.
+        """
+        channel = self.channel if channel is None else channel
+        sweep_numbers = None if self.options.sweeps is None else self.sweep_numbers
+        if self.mapped:
+            return self.mapped_abf.read_window_matrix(
+                channel, config_interval(self.config), sweep_numbers
+            )
+        times, amps = load_channel_matrix(self.abf, channel)
+        return times, amps if sweep_numbers is None else amps[sweep_numbers]
+
+    def cropped_sweep(
+        self, sweep_number: int, channel: int | None = None
+    ) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+        """Times (in ms) and amps of the analysed segment of a sweep."""
+        times, amps = self.analysed_window(sweep_number, channel)
+        return times * 1000, amps
+
+    def analysed_window(
+        self, sweep_number: int, channel: int | None = None
+    ) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+        """Times (in s) and amps of the analysed segment of a sweep, which is all
+        its analysis reads.
+        """
+        times, amps = self.read_sweep(sweep_number, channel)
+        window = segment_window(times, config_interval(self.config))
+        return times[window], amps[window]
+
+    def iter_sweeps(self, channel: int | None = None) -> Iterator[Sweep]:
+        """Sweeps analysed, each one read and created as it is consumed."""
+        for sweep_number in self.sweep_numbers:
+            times, amps = self.read_sweep(sweep_number, channel)
+            yield create_sweep(sweep_number, times, amps, self.config)
+
+    def iter_results(self, channel: int | None = None) -> Iterator[SweepResult]:
+        """Results of the sweeps analysed, only one sweep being alive at once."""
+        for sweep in self.iter_sweeps(channel):
+            yield sweep.to_result()
 
     @cached_property
     def sweep_data(self) -> List[Sweep]:
         """Data of the sweeps."""
-        sweep_data = []
         logger.info(f"Creating sweep data for {self.name}")
-        for sweep_number in range(self.sweep_count):
-            self.abf.setSweep(sweep_number, channel=_DEFAULT_CHANNEL)
-            sweep = create_sweep(sweep_number, self.abf.sweepX, self.abf.sweepY)
-            sweep_data.append(sweep)
-        logger.info(f"Finished {self.sweep_count} sweeps.")
+        sweep_data = list(self.iter_sweeps())
+        logger.info(f"Finished {len(sweep_data)} sweeps.")
         return sweep_data
 
+    def _analyse_channels(self) -> Dict[int, List[SweepResult]]:
+        """Results of every channel, each sweep being read once for all."""
+        channel_results: Dict[int, List[SweepResult]] = {
+            channel: [] for channel in self.channels
+        }
+        logger.info(f"Creating sweep data for {self.name}")
+        for sweep_number in self.sweep_numbers:
+            for channel, sweep_results in channel_results.items():
+                times, amps = self.read_sweep(sweep_number, channel)
+                sweep = create_sweep(sweep_number, times, amps, self.config)
+                sweep_results.append(sweep.to_result())
+        logger.info(f"Finished {len(self.sweep_numbers)} sweeps.")
+        return channel_results
+
+    def _analyse_channels_in_parallel(self) -> Dict[int, List[SweepResult]]:
+        """Results of every channel, the sweeps being analysed by a process pool
+        reading their windows from shared memory.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        from dorsal_ronflex.analyse.sweep_pool import analyse_shared_sweeps
+
+        jobs = self.options.sweep_jobs
+        logger.info(f"Creating sweep data for {self.name} on {jobs} processes")
+        channel_results = {}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for channel in self.channels:
+                windows = [
+                    self.analysed_window(sweep_number, channel)
+                    for sweep_number in self.sweep_numbers
+                ]
+                channel_results[channel] = analyse_shared_sweeps(
+                    executor, windows, self.sweep_numbers, self.config, jobs
+                )
+        logger.info(f"Finished {len(self.sweep_numbers)} sweeps.")
+        return channel_results
+
+    @cached_property
+    def channel_results(self) -> Dict[int, List[SweepResult]]:
+        """Results of the sweeps of every channel analysed.
+        In matrix mode all the sweeps of a channel are analysed at once, with
+        sweep_jobs they are spread over processes.
+        """
+        if not self.options.matrix and self.options.sweep_jobs > 1:
+            return self._analyse_channels_in_parallel()
+        if not self.options.matrix:
+            return self._analyse_channels()
+        logger.info(f"Analysing sweep matrix for {self.name}")
+        channel_results = {
+            channel: create_sweep_results(
+                *self.read_matrix(channel), self.config, self.sweep_numbers
+            )
+            for channel in self.channels
+        }
+        logger.info(f"Finished {len(self.sweep_numbers)} sweeps.")
+        return channel_results
+
+    @property
+    def analysed(self) -> bool:
+        """Whether the sweeps of every channel are analysed and kept."""
+        return "channel_results" in self.__dict__
+
+    def analyse(self) -> Dict[int, List[SweepResult]]:
+        """Analyses the sweeps of every channel once and keeps their results,
+        for the exports, plots and aggregates reusing them.
+        """
+        return self.channel_results
+
+    @cached_property
+    def sweep_results(self) -> List[SweepResult]:
+        """Results of the sweeps of the first channel."""
+        return self.channel_results[self.channel]
+
+    def channel_metadata(self, channel: int) -> StudyMetadata:
+        """Metadata of the study, as exported for the channel."""
+        return StudyMetadata(
+            name=self.name,
+            protocol=self.protocol,
+            abd_start_time=self.abd_start_time,
+            adc_name=self.header.adcNames[channel],
+            adc_units=str(self.header.adcUnits[channel]),
+            sweep_count=self.sweep_count,
+        )
+
+    @cached_property
+    def metadata(self) -> StudyMetadata:
+        """Metadata of the study, as exported for the first channel."""
+        return self.channel_metadata(self.channel)
+
+    def channel_sweeps(self) -> List[Tuple[StudyMetadata, List[SweepResult]]]:
+        """Metadata and sweep results of every channel analysed."""
+        return [
+            (self.channel_metadata(channel), sweep_results)
+            for channel, sweep_results in self.channel_results.items()
+        ]
+
+    def iter_channel_sweeps(self) -> Iterator[ChannelSweeps]:
+        """Metadata and sweep results of every channel analysed, the sweeps
+        being analysed as they are consumed unless they are analysed all at
+        once (matrix mode, sweep_jobs) or already were.
+        """
+        if self.options.matrix or self.options.sweep_jobs > 1 or self.analysed:
+            yield from self.channel_sweeps()
+            return
+        for channel in self.channels:
+            yield self.channel_metadata(channel), self.iter_results(channel)
+
     def sweep_repr(self) -> str:
         """Representation of the sweep data."""
-        return "\n".join(sweep.to_txt() for sweep in self.sweep_data)
+        return _sweeps_repr(self.sweep_results)
 
+    @profiled("to_txt")
     def to_txt(self) -> str:
-        """Returns a string representation of the study."""
-        return f"""
-Study: {self.name}
-Protocol: {self.protocol}
-Start time: {self.abd_start_time}
-ADC Name: {self.adc_name}
-ADC Units: {self.adc_units}
-Sweep Count: {self.sweep_count}
-{self.sweep_repr()}
-"""
-
-    def to_df(self) -> DataFrame:
-        """Returns a DataFrame representation of the study."""
-        data = []
-        for i, sweep in enumerate(self.sweep_data):
-            first_part = DataFrame(
-                {
-                    "Study": [self.name],
-                    "Sweep Number": [sweep.id],
-                    "ABD Start Time": [self.abd_start_time],
-                    "Protocol": [self.protocol],
-                    "ADC Name": [self.adc_name],
-                    "ADC Units": [self.adc_units],
-                    "Sweep Count": [self.sweep_count],
-                    "Sweep ID": [i],
-                }
-            )
-            second_part = sweep.to_df()
-            merged_df = concat([first_part, second_part], axis=1)
-            data.append(merged_df)
-        return concat(data, ignore_index=True)
+        """Returns a string representation of the study, a block per channel."""
+        return "".join(
+            f"{metadata.to_txt()}{_sweeps_repr(sweep_results)}\n"
+            for metadata, sweep_results in self.iter_channel_sweeps()
+        )
 
-    def save(self, destination: str | Path) -> None:
-        """Save the study to a file."""
-        unique_dirname = generate_unique_dirname(str(destination), self.name)
-        output_dir = join(destination, unique_dirname)
+    @profiled("to_df")
+    def to_df(self) -> "DataFrame":
+        """Returns a DataFrame representation of the study."""
+        from pandas import DataFrame
 
-        txt_name = f"{self.name}.txt"
-        csv_name = f"{self.name}.csv"
-        txt_destination = join(output_dir, txt_name)
-        csv_destination = join(output_dir, csv_name)
+        rows = [
+            sweep_row(metadata, sweep_index, sweep)
+            for metadata, sweep_results in self.iter_channel_sweeps()
+            for sweep_index, sweep in enumerate(sweep_results)
+        ]
+        return DataFrame(rows, columns=list(CSV_COLUMNS))
 
+    def save(self, destination: str | Path) -> str:
+        """Save the study to a file, returns the output directory."""
+        if self.options.gap_free:
+            return self.save_events(destination)
+        if self.options.plot_formats or self.options.database is not None:
+            self.analyse()
+        output_dir = create_unique_dir(str(destination), self.name)
         try:
-            txt_export = self.to_txt()
-            csv_export = self.to_df()
+            write_channels(output_dir, self.iter_channel_sweeps(), self.options.formats)
         except Exception as e:
+            rmtree(output_dir, ignore_errors=True)
             logger.error(f"Error exporting study {self.name}: {e}")
             raise e
+        self._save_reusing_results(output_dir)
+
+        logger.info(f"Study {self.name} saved to {output_dir}")
+        return output_dir
+
+    def _save_reusing_results(self, output_dir: str) -> None:
+        """Saves the plots and database rows of the analysed study, if any."""
+        if self.options.plot_formats:
+            self.save_plots(output_dir)
+        if self.options.database is not None:
+            self.save_to_database(self.options.database, output_dir)
+
+    def save_plots(self, output_dir: str) -> None:
+        """Renders the QC figures of the analysed study to output_dir."""
+        from dorsal_ronflex.export.plots import save_study_plots
+
+        figure_count = save_study_plots(
+            self, output_dir, self.options.plot_formats, self.options.plot_jobs
+        )
+        logger.info(f"Rendered {figure_count} figures of {self.name}")
+
+    def save_to_database(self, database: Path, output_dir: str | None = None) -> None:
+        """Replaces the results of the study in the SQLite database."""
+        from dorsal_ronflex.export.database import open_database
 
-        mkdir(output_dir)
-        with open(txt_destination, "w") as file:
-            file.write(txt_export)
+        with open_database(database) as results:
+            results.insert_study(self.filepath, self.channel_sweeps(), output_dir)
 
-        with open(csv_destination, "w") as file:
-            csv_export.to_csv(file)
+    def save_events(self, destination: str | Path) -> str:
+        """Streams the events of a gap-free recording to a new directory,
+        returns the output directory.
+        """
+        from dorsal_ronflex.analyse.gap_free import write_events
 
+        output_dir = create_unique_dir(str(destination), self.name)
+        write_events(self, output_dir, self.options.chunk_seconds)
         logger.info(f"Study {self.name} saved to {output_dir}")
+        return output_dir
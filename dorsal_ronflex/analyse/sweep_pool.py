@@ -0,0 +1,116 @@
+"""Analysis of the sweeps of one study on a process pool, over shared memory.
+
+The analysed window of every sweep of a channel is decoded once into two
+shared-memory blocks (times and amps, sweeps one after another). Workers map
+the blocks and analyse ranges of sweeps on views of them: only the block
+names, the offsets of the range and the small results cross processes.
+"""
+
+from concurrent.futures import Executor
+from contextlib import suppress
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, List, Sequence, Tuple
+
+from numpy import concatenate, cumsum, dtype, floating, ndarray
+from numpy.typing import NDArray
+
+from dorsal_ronflex.settings import Config
+from dorsal_ronflex.sweep.create_sweep import create_sweep
+from dorsal_ronflex.sweep.result import SweepResult
+
+# Ranges of sweeps per worker, so that uneven sweeps still balance
+_RANGES_PER_WORKER = 4
+
+SweepWindow = Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Flat array in a shared-memory block, as workers find it."""
+
+    name: str
+    size: int
+    dtype: str
+
+    def view(self, block: SharedMemory) -> NDArray[Any]:
+        """The array, on the memory of the block."""
+        return ndarray((self.size,), dtype=self.dtype, buffer=block.buf)
+
+
+def _share(arrays: Sequence[NDArray[Any]]) -> Tuple[SharedMemory, SharedArray]:
+    """New shared-memory block holding the arrays one after another."""
+    array_dtype = arrays[0].dtype if arrays else dtype("float64")
+    size = sum(len(array) for array in arrays)
+    block = SharedMemory(create=True, size=max(1, size * array_dtype.itemsize))
+    shared = SharedArray(block.name, size, array_dtype.str)
+    if size:
+        concatenate(arrays, out=shared.view(block))
+    return block, shared
+
+
+def _analyse_views(
+    times: NDArray[floating[Any]],
+    amps: NDArray[floating[Any]],
+    sweep_ids: Sequence[int],
+    offsets: Sequence[int],
+    config: Config,
+) -> List[SweepResult]:
+    """Results of the sweeps bounded by offsets in the times and amps."""
+    return [
+        create_sweep(sweep_id, times[start:stop], amps[start:stop], config).to_result()
+        for sweep_id, start, stop in zip(sweep_ids, offsets, offsets[1:])
+    ]
+
+
+def _analyse_range(
+    times: SharedArray,
+    amps: SharedArray,
+    sweep_ids: Sequence[int],
+    offsets: Sequence[int],
+    config: Config,
+) -> List[SweepResult]:
+    """Results of a range of sweeps, bounded by offsets in the shared arrays."""
+    # Workers share the resource tracker of the pool, which unlinks the blocks
+    blocks = SharedMemory(name=times.name), SharedMemory(name=amps.name)
+    try:
+        return _analyse_views(
+            times.view(blocks[0]), amps.view(blocks[1]), sweep_ids, offsets, config
+        )
+    finally:
+        for block in blocks:
+            # Views still alive in a traceback keep the block mapped until freed
+            with suppress(BufferError):
+                block.close()
+
+
+def analyse_shared_sweeps(
+    executor: Executor,
+    windows: Sequence[SweepWindow],
+    sweep_ids: Sequence[int],
+    config: Config,
+    jobs: int,
+) -> List[SweepResult]:
+    """Results of the sweeps whose times and amps windows are given, analysed
+    by the workers of executor and gathered in sweep order.
+    """
+    times_block, times = _share([window_times for window_times, _ in windows])
+    amps_block, amps = _share([window_amps for _, window_amps in windows])
+    try:
+        lengths = [len(window_amps) for _, window_amps in windows]
+        offsets = [0, *cumsum(lengths, dtype=int).tolist()]
+        range_size = max(1, -(-len(windows) // (jobs * _RANGES_PER_WORKER)))
+        starts = range(0, len(windows), range_size)
+        results = executor.map(
+            _analyse_range,
+            [times] * len(starts),
+            [amps] * len(starts),
+            [sweep_ids[start : start + range_size] for start in starts],
+            [offsets[start : start + range_size + 1] for start in starts],
+            [config] * len(starts),
+        )
+        return [result for range_results in results for result in range_results]
+    finally:
+        for block in (times_block, amps_block):
+            block.close()
+            block.unlink()
@@ -0,0 +1,123 @@
+"""Watch mode, analyses the ABF files of a directory as they are recorded."""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Event
+from time import time
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.export.database import run_database
+from dorsal_ronflex.export.writers import append_study_rows
+
+WATCH_CSV_FILENAME = "watch.csv"
+WATCH_TXT_FILENAME = "watch.txt"
+_STATE_PATH = Path(".dorsal_ronflex") / "watch.json"
+
+Signature = Tuple[int, int]
+
+
+def file_signature(path: Path) -> Signature:
+    """Size and modification time of a file, changing while it is written."""
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+@dataclass
+class FolderWatcher:
+    """Polls a directory, and analyses each ABF file once it is fully written.
+    A file is fully written when its size and modification time have not
+    changed for settle_seconds. Results are saved like any other study and
+    appended to the running watch.csv and watch.txt of the output directory.
+    Analysed files are remembered in the output, so a restarted watcher only
+    analyses the new or modified ones.
+    """
+
+    directory: Path
+    output: Path
+    config: str | Path | None = None
+    options: StudyOptions = field(default_factory=StudyOptions)
+    settle_seconds: float = 5.0
+    analysed: Dict[str, Signature] = field(default_factory=dict)
+    _pending: Dict[Path, Signature] = field(default_factory=dict)
+
+    @property
+    def state_path(self) -> Path:
+        """Where the analysed files are remembered."""
+        return Path(self.output) / _STATE_PATH
+
+    def load_state(self) -> None:
+        """Reads the files analysed by a previous watcher."""
+        if self.state_path.is_file():
+            state = json.loads(self.state_path.read_text())
+            self.analysed = {path: tuple(sig) for path, sig in state.items()}
+
+    def save_state(self) -> None:
+        """Remembers the analysed files."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self.state_path.write_text(json.dumps(self.analysed))
+
+    def ready_files(self) -> List[Path]:
+        """Files not analysed yet, that stopped changing since the last poll."""
+        ready = []
+        now = time()
+        for path in sorted(Path(self.directory).rglob("*.abf")):
+            try:
+                signature = file_signature(path)
+            except FileNotFoundError:
+                continue
+            if self.analysed.get(str(path)) == signature:
+                continue
+            settled = now - signature[1] / 1e9 >= self.settle_seconds
+            if self._pending.get(path) == signature and settled:
+                ready.append(path)
+            self._pending[path] = signature
+        return ready
+
+    def _append(self, study: AbfStudy) -> None:
+        """Appends the results of the study to the running outputs."""
+        for metadata, sweep_results in study.channel_sweeps():
+            append_study_rows(
+                str(Path(self.output) / WATCH_CSV_FILENAME), metadata, sweep_results
+            )
+        with open(Path(self.output) / WATCH_TXT_FILENAME, "a") as file:
+            file.write(study.to_txt())
+
+    def analyse(self, path: Path) -> str | None:
+        """Analyses and saves a study, and appends it to the running outputs."""
+        signature = self._pending.pop(path)
+        try:
+            study = AbfStudy(path, self.config, self.options)
+            if not self.options.gap_free:
+                study.analyse()
+            output_dir = study.save(self.output)
+            if not self.options.gap_free:
+                self._append(study)
+        except Exception as e:
+            logger.critical(f"Error analysing {path}: {e}")
+            error = str(e) or type(e).__name__
+        else:
+            logger.info(f"{path} analysed, results in {output_dir}")
+            error = None
+        self.analysed[str(path)] = signature
+        self.save_state()
+        return error
+
+    def poll(self) -> None:
+        """Analyses every file that is ready."""
+        for path in self.ready_files():
+            self.analyse(path)
+
+    def run(self, poll_seconds: float = 1.0, stop: Event | None = None) -> None:
+        """Polls the directory until stopped."""
+        stop = stop or Event()
+        Path(self.output).mkdir(parents=True, exist_ok=True)
+        self.load_state()
+        logger.info(f"Watching {self.directory} for ABF files.")
+        with run_database(self.options.database):
+            while not stop.is_set():
+                self.poll()
+                stop.wait(poll_seconds)
@@ -0,0 +1,77 @@
+"""Client of the dorsal-ronflex analysis server.
+
+Only the standard library is imported, so that a request costs the
+connection and the analysis, not the startup of the analysis modules.
+"""
+
+import json
+import socket
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+Address = str | Tuple[str, int]
+
+
+def parse_address(address: str) -> Tuple[int, Address]:
+    """Socket family and address of unix:/path/to/socket or host:port."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address.removeprefix("unix:")
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def request_analysis(
+    address: str, request: Dict[str, Any], timeout: float | None = None
+) -> Dict[str, Any]:
+    """Sends an analysis request to the server and returns its JSON response."""
+    family, socket_address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_address)
+        with connection.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            response: Dict[str, Any] = json.loads(stream.readline())
+    return response
+
+
+def _parse_override(override: str) -> Tuple[str, Any]:
+    """Config key and value of key=value, the value being parsed as JSON."""
+    key, _, value = override.partition("=")
+    return key, json.loads(value)
+
+
+def main() -> None:
+    """Sends the analysis of a study to the server and prints the results."""
+    parser = ArgumentParser(description="Dorsal Ronflex client")
+    parser.add_argument("path", type=Path, help="Path to the ABF file.")
+    parser.add_argument("-a", "--address", default=DEFAULT_ADDRESS)
+    parser.add_argument(
+        "-s",
+        "--set",
+        nargs="+",
+        default=[],
+        help="Config overrides, as key=value.",
+    )
+    parser.add_argument("--channels", nargs="+", default=[], type=int)
+    parser.add_argument("--all-channels", action="store_true")
+    parser.add_argument("--sweeps", default=None, help="Sweeps, such as 0:10.")
+    parser.add_argument("-m", "--matrix", action="store_true")
+    args = parser.parse_args()
+
+    request = {
+        "path": str(args.path.resolve()),
+        "config": dict(map(_parse_override, args.set)),
+        "channels": args.channels,
+        "all_channels": args.all_channels,
+        "matrix": args.matrix,
+        "sweeps": args.sweeps,
+    }
+    print(json.dumps(request_analysis(args.address, request), indent=4))
+
+
+if __name__ == "__main__":
+    main()
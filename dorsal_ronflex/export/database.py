@@ -0,0 +1,208 @@
+"""Results of every study of every run in one indexed SQLite database"""
+
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from types import TracebackType
+from typing import Dict, Iterable, Iterator, List, Tuple, Type, cast
+
+from dorsal_ronflex.export.records import StudyMetadata
+from dorsal_ronflex.export.writers import ChannelSweeps
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    protocol TEXT,
+    abd_start_time TEXT,
+    adc_name TEXT NOT NULL,
+    adc_units TEXT,
+    sweep_count INTEGER,
+    output_dir TEXT,
+    UNIQUE (path, adc_name)
+);
+CREATE TABLE IF NOT EXISTS sweeps (
+    study_id INTEGER NOT NULL REFERENCES studies (id),
+    sweep_index INTEGER NOT NULL,
+    sweep_id INTEGER NOT NULL,
+    stim_time REAL,
+    stim_amp REAL,
+    start_time REAL,
+    end_time REAL,
+    event_duration REAL,
+    area REAL,
+    control_area REAL,
+    ms_delay INTEGER,
+    control_area_increment INTEGER,
+    raw_spike_count INTEGER,
+    abs_spike_count INTEGER,
+    PRIMARY KEY (study_id, sweep_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS spikes (
+    study_id INTEGER NOT NULL REFERENCES studies (id),
+    sweep_index INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    time REAL NOT NULL,
+    amp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS studies_name ON studies (name);
+CREATE INDEX IF NOT EXISTS studies_protocol ON studies (protocol);
+CREATE INDEX IF NOT EXISTS studies_abd_start_time ON studies (abd_start_time);
+CREATE INDEX IF NOT EXISTS sweeps_area ON sweeps (area);
+CREATE INDEX IF NOT EXISTS spikes_sweep ON spikes (study_id, sweep_index);
+"""
+
+# Seconds a writer waits for another process holding the write lock
+_BUSY_TIMEOUT = 60.0
+
+
+class ResultsDatabase:
+    """SQLite database in WAL mode, each study inserted in one transaction,
+    so that readers never wait and parallel writers only queue on commits.
+    The connection is shared by the threads of the process, one insertion at
+    a time.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.lock = Lock()
+        self.connection = sqlite3.connect(
+            self.path, timeout=_BUSY_TIMEOUT, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    def _replace_study(
+        self, study_path: str, metadata: StudyMetadata, output_dir: str | None
+    ) -> int:
+        """Id of the study row of a channel, the previous results being dropped"""
+        cursor = self.connection.cursor()
+        previous = cursor.execute(
+            "SELECT id FROM studies WHERE path = ? AND adc_name = ?",
+            (study_path, metadata.adc_name),
+        ).fetchone()
+        if previous is not None:
+            for table in ("spikes", "sweeps"):
+                cursor.execute(f"DELETE FROM {table} WHERE study_id = ?", previous)
+            cursor.execute("DELETE FROM studies WHERE id = ?", previous)
+        start_time = metadata.abd_start_time
+        cursor.execute(
+            "INSERT INTO studies (path, name, protocol, abd_start_time, adc_name, "
+            "adc_units, sweep_count, output_dir) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                study_path,
+                metadata.name,
+                None if metadata.protocol is None else str(metadata.protocol),
+                None if start_time is None else start_time.isoformat(),
+                metadata.adc_name,
+                metadata.adc_units,
+                metadata.sweep_count,
+                output_dir,
+            ),
+        )
+        return cast(int, cursor.lastrowid)
+
+    def insert_study(
+        self,
+        study_path: str | Path,
+        channels: Iterable[ChannelSweeps],
+        output_dir: str | None = None,
+    ) -> None:
+        """Replaces the results of every channel of a study, in one transaction"""
+        sweep_rows: List[Tuple[object, ...]] = []
+        spike_rows: List[Tuple[object, ...]] = []
+        with self.lock, self.connection:
+            for metadata, sweeps in channels:
+                study_id = self._replace_study(
+                    str(Path(study_path).resolve()), metadata, output_dir
+                )
+                for sweep_index, sweep in enumerate(sweeps):
+                    start, end = sweep.event_bondaries
+                    sweep_rows.append(
+                        (
+                            study_id,
+                            sweep_index,
+                            sweep.id,
+                            sweep.stim.time,
+                            sweep.stim.amp,
+                            start,
+                            end,
+                            sweep.event_duration,
+                            sweep.area,
+                            sweep.control_area,
+                            sweep.ms_delay,
+                            sweep.control_area_increment,
+                            len(sweep.raw_spikes),
+                            len(sweep.abs_spikes),
+                        )
+                    )
+                    for kind, spikes in (
+                        ("raw", sweep.raw_spikes),
+                        ("abs", sweep.abs_spikes),
+                    ):
+                        spike_rows.extend(
+                            (study_id, sweep_index, kind, time, amp)
+                            for time, amp in zip(
+                                spikes.times.tolist(), spikes.amps.tolist()
+                            )
+                        )
+            self.connection.executemany(
+                f"INSERT INTO sweeps VALUES ({', '.join('?' * 14)})", sweep_rows
+            )
+            self.connection.executemany(
+                "INSERT INTO spikes VALUES (?, ?, ?, ?, ?)", spike_rows
+            )
+
+    def close(self) -> None:
+        """Closes the connection"""
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self) -> "ResultsDatabase":
+        """The database, closed on leaving the block"""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Closes the connection"""
+        self.close()
+
+
+# Databases of the runs of this process, by resolved path
+_run_databases: Dict[Path, ResultsDatabase] = {}
+
+
+@contextmanager
+def run_database(path: Path | None) -> Iterator[ResultsDatabase | None]:
+    """Database of a run, opened once for all its studies and closed with it"""
+    if path is None:
+        yield None
+        return
+    resolved = Path(path).resolve()
+    with ResultsDatabase(resolved) as database:
+        _run_databases[resolved] = database
+        try:
+            yield database
+        finally:
+            del _run_databases[resolved]
+
+
+@contextmanager
+def open_database(path: Path) -> Iterator[ResultsDatabase]:
+    """Database of the run of this process, or a connection closed after use
+    when there is none (worker processes, studies saved on their own)
+    """
+    database = _run_databases.get(Path(path).resolve())
+    if database is not None:
+        yield database
+        return
+    with ResultsDatabase(path) as database:
+        yield database
@@ -0,0 +1,172 @@
+"""Headless QC figures of the sweeps and studies"""
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from os.path import join
+from typing import TYPE_CHECKING, Any, Iterable, List, Tuple
+
+from numpy import arange, column_stack, floating, maximum, minimum, repeat
+from numpy.typing import NDArray
+
+from dorsal_ronflex.export.records import StudyMetadata
+from dorsal_ronflex.sweep.result import SweepResult
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+
+    from dorsal_ronflex.analyse.simplified_abf import AbfStudy
+
+_FIGURE_SIZE = (10.0, 4.0)
+_DPI = 100
+_WIDTH_PIXELS = int(_FIGURE_SIZE[0] * _DPI)
+
+
+def decimate_min_max(
+    times: NDArray[floating[Any]], amps: NDArray[floating[Any]], bucket_count: int
+) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+    """Min and max of the amps over bucket_count time buckets, two points per
+    bucket, so that the trace drawn bucket_count pixels wide looks the same
+    """
+    if len(amps) <= 2 * bucket_count:
+        return times, amps
+    starts = arange(bucket_count) * len(amps) // bucket_count
+    extremes = column_stack(
+        (minimum.reduceat(amps, starts), maximum.reduceat(amps, starts))
+    )
+    return repeat(times[starts], 2), extremes.ravel()
+
+
+@dataclass(frozen=True)
+class SweepPlot:
+    """What the figure of a sweep shows, its trace being decimated"""
+
+    title: str
+    ylabel: str
+    times: NDArray[floating[Any]]
+    amps: NDArray[floating[Any]]
+    result: SweepResult
+
+
+def _draw_sweep(axes: "Axes", plot: SweepPlot, **trace: Any) -> None:
+    """Trace of the sweep, with its stim, spikes and event boundaries"""
+    result = plot.result
+    axes.plot(plot.times, plot.amps, linewidth=0.8, **trace)
+    axes.axvspan(*result.event_bondaries, color="tab:orange", alpha=0.15)
+    axes.plot(result.raw_spikes.times, result.raw_spikes.amps, "o", markersize=3)
+    axes.plot(result.stim.time, result.stim.amp, "x", color="tab:red", markersize=8)
+
+
+def render_sweep(plot: SweepPlot, path_stem: str, formats: Iterable[str]) -> None:
+    """Renders the figure of a sweep to {path_stem}.{format}"""
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=_FIGURE_SIZE, dpi=_DPI, layout="tight")
+    axes = figure.add_subplot()
+    _draw_sweep(axes, plot, color="tab:blue")
+    axes.set(title=plot.title, xlabel="Time (ms)", ylabel=plot.ylabel)
+    for plot_format in formats:
+        figure.savefig(f"{path_stem}.{plot_format}")
+
+
+def render_study(
+    plots: List[SweepPlot], title: str, path_stem: str, formats: Iterable[str]
+) -> None:
+    """Renders the sweeps of a channel overlaid, and their areas"""
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(_FIGURE_SIZE[0], 2 * _FIGURE_SIZE[1]), layout="tight")
+    traces, areas = figure.subplots(2, 1)
+    for plot in plots:
+        traces.plot(plot.times, plot.amps, linewidth=0.5, alpha=0.5)
+    traces.set(title=title, xlabel="Time (ms)", ylabel=plots[0].ylabel)
+    sweep_ids = [plot.result.id for plot in plots]
+    areas.plot(sweep_ids, [plot.result.area for plot in plots], "o-", label="Area")
+    areas.plot(
+        sweep_ids,
+        [plot.result.control_area for plot in plots],
+        "s--",
+        label="Control Area",
+    )
+    areas.set(xlabel="Sweep", ylabel="Area")
+    areas.legend()
+    for plot_format in formats:
+        figure.savefig(f"{path_stem}.{plot_format}")
+
+
+def _file_label(text: str) -> str:
+    """Text usable in a file name"""
+    return re.sub(r"[^\w.-]+", "_", text.strip())
+
+
+def _sweep_plots(
+    study: "AbfStudy", channel: int, metadata: StudyMetadata
+) -> List[SweepPlot]:
+    """Decimated analysed window of every sweep of the channel"""
+    plots = []
+    for result in study.channel_results[channel]:
+        plot_times, plot_amps = decimate_min_max(
+            *study.cropped_sweep(result.id, channel), _WIDTH_PIXELS
+        )
+        plots.append(
+            SweepPlot(
+                title=f"{metadata.name} - {metadata.adc_name} - Sweep {result.id}",
+                ylabel=f"{metadata.adc_name} ({metadata.adc_units})",
+                times=plot_times,
+                amps=plot_amps,
+                result=result,
+            )
+        )
+    return plots
+
+
+def _render_channels(
+    study: "AbfStudy", output_dir: str, formats: Tuple[str, ...]
+) -> Tuple[int, List[Tuple[SweepPlot, str]]]:
+    """Renders the figure of every channel, returns their number and the sweep
+    figures to render with their path stems
+    """
+    channel_figures = 0
+    renders: List[Tuple[SweepPlot, str]] = []
+    for channel in study.channels:
+        metadata = study.channel_metadata(channel)
+        plots = _sweep_plots(study, channel, metadata)
+        if not plots:
+            continue
+        stem = join(output_dir, _file_label(f"{metadata.name}_{metadata.adc_name}"))
+        render_study(plots, f"{metadata.name} - {metadata.adc_name}", stem, formats)
+        channel_figures += 1
+        renders.extend((plot, f"{stem}_sweep_{plot.result.id:04d}") for plot in plots)
+    return channel_figures, renders
+
+
+def _render_sweeps(
+    renders: List[Tuple[SweepPlot, str]], formats: Tuple[str, ...], jobs: int
+) -> None:
+    """Renders the figures of the sweeps, on jobs processes"""
+    if jobs <= 1 or not renders:
+        for plot, path_stem in renders:
+            render_sweep(plot, path_stem, formats)
+        return
+    sweep_plots, path_stems = zip(*renders)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for _ in executor.map(
+            render_sweep,
+            sweep_plots,
+            path_stems,
+            [formats] * len(renders),
+            chunksize=8,
+        ):
+            pass
+
+
+def save_study_plots(
+    study: "AbfStudy", output_dir: str, formats: Iterable[str], jobs: int = 1
+) -> int:
+    """Renders a figure per channel and per sweep of the analysed study next to
+    its exports, the sweeps on jobs processes, returns the number of figures
+    """
+    formats = tuple(formats)
+    channel_figures, renders = _render_channels(study, output_dir, formats)
+    _render_sweeps(renders, formats, jobs)
+    return channel_figures + len(renders)
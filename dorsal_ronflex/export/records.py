@@ -0,0 +1,175 @@
+"""Study metadata and per-sweep results as plain records"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from dorsal_ronflex.signals.stream import StreamEvent
+    from dorsal_ronflex.sweep.result import SweepResult
+
+CSV_COLUMNS = (
+    "Study",
+    "Sweep Number",
+    "ABD Start Time",
+    "Protocol",
+    "ADC Name",
+    "ADC Units",
+    "Sweep Count",
+    "Sweep ID",
+    "Sweep ID",
+    "Stim",
+    "Start Time",
+    "End Time",
+    "Event Duration",
+    "Area",
+    "Control Area",
+    "Ms Delay",
+    "Control Area Increment",
+)
+
+EVENT_COLUMNS = (
+    "Study",
+    "ABD Start Time",
+    "Protocol",
+    "ADC Name",
+    "ADC Units",
+    "Event",
+    "Start Time",
+    "End Time",
+    "Event Duration",
+    "Peak Time",
+    "Peak Amp",
+    "Spike Count",
+    "Area",
+)
+
+AGGREGATE_COLUMNS = (
+    "Level",
+    "Study",
+    "Protocol",
+    "ADC Name",
+    "ADC Units",
+    "Metric",
+    "Count",
+    "Mean",
+    "Std",
+    "Min",
+    "Q05",
+    "Q25",
+    "Median",
+    "Q75",
+    "Q95",
+    "Max",
+)
+
+TRACE_COLUMNS = (
+    "Protocol",
+    "ADC Name",
+    "ADC Units",
+    "Sweep Count",
+    "Time",
+    "Mean Abs Amp",
+)
+
+
+@dataclass(frozen=True)
+class StudyMetadata:
+    """What we export about a study besides its sweeps"""
+
+    name: str
+    protocol: str
+    abd_start_time: datetime | None
+    adc_name: str
+    adc_units: str
+    sweep_count: int
+
+    def to_txt(self) -> str:
+        """Header of the text export of the study"""
+        return f"""
+Study: {self.name}
+Protocol: {self.protocol}
+Start time: {self.abd_start_time}
+ADC Name: {self.adc_name}
+ADC Units: {self.adc_units}
+Sweep Count: {self.sweep_count}
+"""
+
+
+def sweep_row(
+    metadata: StudyMetadata, sweep_index: int, sweep: "SweepResult"
+) -> Tuple[Any, ...]:
+    """One row of the table export, in the order of CSV_COLUMNS"""
+    start, end = sweep.event_bondaries
+    return (
+        metadata.name,
+        sweep.id,
+        metadata.abd_start_time,
+        metadata.protocol,
+        metadata.adc_name,
+        metadata.adc_units,
+        metadata.sweep_count,
+        sweep_index,
+        sweep.id,
+        sweep.stim,
+        start,
+        end,
+        sweep.event_duration,
+        sweep.area,
+        sweep.control_area,
+        sweep.ms_delay,
+        sweep.control_area_increment,
+    )
+
+
+def event_row(
+    metadata: StudyMetadata, event_index: int, event: "StreamEvent"
+) -> Tuple[Any, ...]:
+    """One row of the event export, in the order of EVENT_COLUMNS"""
+    return (
+        metadata.name,
+        metadata.abd_start_time,
+        metadata.protocol,
+        metadata.adc_name,
+        metadata.adc_units,
+        event_index,
+        event.start_time,
+        event.end_time,
+        event.duration,
+        event.peak.time,
+        event.peak.amp,
+        event.spike_count,
+        event.area,
+    )
+
+
+@dataclass
+class SweepColumns:
+    """Numeric per-sweep results of a study, stored column by column"""
+
+    columns: Dict[str, List[Any]] = field(default_factory=dict)
+
+    def append(self, sweep_index: int, sweep: "SweepResult") -> None:
+        """Adds the results of a sweep"""
+        start, end = sweep.event_bondaries
+        values = {
+            "Sweep Number": sweep.id,
+            "Sweep ID": sweep_index,
+            "Stim Time": sweep.stim.time,
+            "Stim Amp": sweep.stim.amp,
+            "Start Time": start,
+            "End Time": end,
+            "Event Duration": sweep.event_duration,
+            "Area": sweep.area,
+            "Control Area": sweep.control_area,
+            "Ms Delay": sweep.ms_delay,
+            "Control Area Increment": sweep.control_area_increment,
+            "Raw Spike Count": len(sweep.raw_spikes),
+            "Abs Spike Count": len(sweep.abs_spikes),
+        }
+        for name, value in values.items():
+            self.columns.setdefault(name, []).append(value)
+
+    def __len__(self) -> int:
+        """Number of sweeps"""
+        return len(self.columns.get("Sweep ID", []))
@@ -0,0 +1,230 @@
+"""Pluggable writers exporting a study sweep by sweep"""
+
+import csv
+from abc import ABC, abstractmethod
+from datetime import datetime
+from os.path import getsize, isfile, join
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterable, List, Tuple, Type
+
+from dorsal_ronflex.export.records import (
+    CSV_COLUMNS,
+    StudyMetadata,
+    SweepColumns,
+    sweep_row,
+)
+from dorsal_ronflex.profiling import profiled
+
+if TYPE_CHECKING:
+    from dorsal_ronflex.sweep.result import SweepResult
+
+
+class StudyWriter(ABC):
+    """Writes the export of a study to {directory}/{name}.{extension}"""
+
+    extension: str
+
+    def __init__(self, directory: str, metadata: StudyMetadata) -> None:
+        self.metadata = metadata
+        self.path = join(directory, f"{metadata.name}.{self.extension}")
+
+    def start_channel(self, metadata: StudyMetadata) -> None:
+        """The following sweeps are the results of another channel"""
+        self.metadata = metadata
+
+    @abstractmethod
+    def write(self, sweep_index: int, sweep: "SweepResult") -> None:
+        """Adds the results of a sweep to the export"""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Finishes the export"""
+
+
+class TxtWriter(StudyWriter):
+    """Human readable export, written as the sweeps come"""
+
+    extension = "txt"
+
+    def __init__(self, directory: str, metadata: StudyMetadata) -> None:
+        super().__init__(directory, metadata)
+        self.file: IO[str] = open(self.path, "w")
+        self.file.write(metadata.to_txt())
+
+    def start_channel(self, metadata: StudyMetadata) -> None:
+        """Ends the block of the previous channel and starts a new one"""
+        if metadata is not self.metadata:
+            self.file.write(f"\n{metadata.to_txt()}")
+        super().start_channel(metadata)
+
+    def write(self, sweep_index: int, sweep: "SweepResult") -> None:
+        """Adds the results of a sweep to the export"""
+        if sweep_index:
+            self.file.write("\n")
+        self.file.write(sweep.to_txt())
+
+    def close(self) -> None:
+        """Finishes the export"""
+        self.file.write("\n")
+        self.file.close()
+
+
+def format_csv_value(value: Any) -> Any:
+    """Formats values like pandas does in to_csv"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return str(value)
+    return value
+
+
+class CsvWriter(StudyWriter):
+    """Table export, one row written per sweep, with a pandas-like index"""
+
+    extension = "csv"
+
+    def __init__(self, directory: str, metadata: StudyMetadata) -> None:
+        super().__init__(directory, metadata)
+        self.file: IO[str] = open(self.path, "w", newline="")
+        self.writer = csv.writer(self.file, lineterminator="\n")
+        self.writer.writerow(("", *CSV_COLUMNS))
+        self.row_count = 0
+
+    def write(self, sweep_index: int, sweep: "SweepResult") -> None:
+        """Adds the results of a sweep to the export"""
+        row = sweep_row(self.metadata, sweep_index, sweep)
+        self.writer.writerow((self.row_count, *map(format_csv_value, row)))
+        self.row_count += 1
+
+    def close(self) -> None:
+        """Finishes the export"""
+        self.file.close()
+
+
+class _ColumnarWriter(StudyWriter):
+    """Binary export, built from the numeric columns once all sweeps are in"""
+
+    def __init__(self, directory: str, metadata: StudyMetadata) -> None:
+        super().__init__(directory, metadata)
+        self.sweep_columns = SweepColumns()
+        self.adc_names: List[str] = []
+        self.adc_units: List[str] = []
+
+    def write(self, sweep_index: int, sweep: "SweepResult") -> None:
+        """Adds the results of a sweep to the export"""
+        self.sweep_columns.append(sweep_index, sweep)
+        self.adc_names.append(self.metadata.adc_name)
+        self.adc_units.append(self.metadata.adc_units)
+
+
+class NpzWriter(_ColumnarWriter):
+    """NumPy .npz export, one array per column plus the study metadata"""
+
+    extension = "npz"
+
+    def close(self) -> None:
+        """Finishes the export"""
+        from numpy import asarray, savez
+
+        arrays = {
+            name: asarray(values) for name, values in self.sweep_columns.columns.items()
+        }
+        savez(
+            self.path,
+            **arrays,
+            **{
+                "Study": asarray(self.metadata.name),
+                "Protocol": asarray(str(self.metadata.protocol)),
+                "ABD Start Time": asarray(str(self.metadata.abd_start_time)),
+                "ADC Name": asarray(self.adc_names),
+                "ADC Units": asarray(self.adc_units),
+                "Sweep Count": asarray(self.metadata.sweep_count),
+            },
+        )
+
+
+class ParquetWriter(_ColumnarWriter):
+    """Parquet export, needs pyarrow or fastparquet"""
+
+    extension = "parquet"
+
+    def close(self) -> None:
+        """Finishes the export"""
+        from pandas import DataFrame
+
+        frame = DataFrame(self.sweep_columns.columns)
+        frame.insert(0, "Study", self.metadata.name)
+        frame.insert(1, "ABD Start Time", self.metadata.abd_start_time)
+        frame.insert(2, "Protocol", self.metadata.protocol)
+        frame.insert(3, "ADC Name", self.adc_names)
+        frame.insert(4, "ADC Units", self.adc_units)
+        frame.insert(5, "Sweep Count", self.metadata.sweep_count)
+        frame.to_parquet(self.path)
+
+
+WRITERS: Dict[str, Type[StudyWriter]] = {
+    writer.extension: writer
+    for writer in (TxtWriter, CsvWriter, NpzWriter, ParquetWriter)
+}
+
+DEFAULT_FORMATS = ("txt", "csv")
+
+
+ChannelSweeps = Tuple[StudyMetadata, Iterable["SweepResult"]]
+
+
+def _write_channel(
+    writers: List[StudyWriter], metadata: StudyMetadata, sweeps: Iterable["SweepResult"]
+) -> None:
+    """Streams the sweeps of a channel to every writer"""
+    for writer in writers:
+        writer.start_channel(metadata)
+    for sweep_index, sweep in enumerate(sweeps):
+        for writer in writers:
+            writer.write(sweep_index, sweep)
+
+
+@profiled("write")
+def write_channels(
+    directory: str,
+    channels: Iterable[ChannelSweeps],
+    formats: Iterable[str] = DEFAULT_FORMATS,
+) -> None:
+    """Streams the sweeps of every channel of a study to every requested
+    writer, one combined export per format
+    """
+    writers: List[StudyWriter] = []
+    try:
+        for metadata, sweeps in channels:
+            if not writers:
+                writers = [
+                    WRITERS[export_format](directory, metadata)
+                    for export_format in formats
+                ]
+            _write_channel(writers, metadata, sweeps)
+    finally:
+        for writer in writers:
+            writer.close()
+
+
+def write_study(
+    directory: str,
+    metadata: StudyMetadata,
+    sweeps: Iterable["SweepResult"],
+    formats: Iterable[str] = DEFAULT_FORMATS,
+) -> None:
+    """Streams the sweeps of a study to every requested writer"""
+    write_channels(directory, [(metadata, sweeps)], formats)
+
+
+def append_study_rows(
+    path: str, metadata: StudyMetadata, sweeps: Iterable["SweepResult"]
+) -> None:
+    """Appends the table rows of a study to a running csv export"""
+    new_file = not isfile(path) or getsize(path) == 0
+    with open(path, "a", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        if new_file:
+            writer.writerow(CSV_COLUMNS)
+        for sweep_index, sweep in enumerate(sweeps):
+            row = sweep_row(metadata, sweep_index, sweep)
+            writer.writerow(map(format_csv_value, row))
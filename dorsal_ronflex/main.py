@@ -1,13 +1,32 @@
 """Argument parsing and main function for the dorsal_ronflex package."""
 
-from argparse import ArgumentParser
+import sys
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from dataclasses import replace
 from pathlib import Path
+from typing import TYPE_CHECKING, List
 
-from dorsal_ronflex.analyse.analysis import analyse_and_save
+from dorsal_ronflex.export.writers import DEFAULT_FORMATS, WRITERS
+from dorsal_ronflex.sweep.selection import parse_selection
 
+if TYPE_CHECKING:
+    from dorsal_ronflex.analyse.analysis import RunOptions
+    from dorsal_ronflex.analyse.planner import PlanOptions
+    from dorsal_ronflex.analyse.shards import Shard
+    from dorsal_ronflex.analyse.simplified_abf import StudyOptions
 
-def main() -> None:
-    """Main function for the dorsal_ronflex package."""
+
+def sweep_selection(selection: str) -> str:
+    """Selection of sweeps, checked to be made of indices and slices."""
+    try:
+        parse_selection(selection)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e)) from None
+    return selection
+
+
+def build_parser() -> ArgumentParser:
+    """Argument parser of the dorsal-ronflex command."""
     parser = ArgumentParser(description="Dorsal Ronflex")
 
     parser.add_argument(
@@ -32,12 +51,360 @@ def main() -> None:
         help="Path to the config file.",
     )
 
-    args = parser.parse_args()
-    path = args.path
-    output = args.output
-    config = args.config
+    parser.add_argument(
+        "-m",
+        "--matrix",
+        action="store_true",
+        help="Analyse all the sweeps of a study at once (equal-length sweeps).",
+    )
+
+    parser.add_argument(
+        "--mapped",
+        action="store_true",
+        help="Memory-map the ABF files and only decode the analysed window.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--formats",
+        nargs="+",
+        default=list(DEFAULT_FORMATS),
+        choices=sorted(WRITERS),
+        help="Export formats of the studies.",
+    )
+
+    parser.add_argument(
+        "--db",
+        default=None,
+        type=Path,
+        help="SQLite database the results of every study are also inserted in.",
+    )
+
+    parser.add_argument(
+        "--sweeps",
+        default=None,
+        type=sweep_selection,
+        help="Only analyse these sweeps, as indices and Python slices such as "
+        "0:10, ::5 or 1,4,10:20:2.",
+    )
+
+    parser.add_argument(
+        "--channels",
+        nargs="+",
+        default=[],
+        type=int,
+        help="ADC channels analysed in one pass, instead of the config channel.",
+    )
+
+    parser.add_argument(
+        "--all-channels",
+        action="store_true",
+        help="Analyse every ADC channel of the studies in one pass.",
+    )
+
+    parser.add_argument(
+        "--gap-free",
+        action="store_true",
+        help="Stream long gap-free recordings in chunks, exporting every event.",
+    )
+
+    parser.add_argument(
+        "--chunk-seconds",
+        default=10.0,
+        type=float,
+        help="Seconds of recording analysed at once in --gap-free mode.",
+    )
+
+    parser.add_argument(
+        "--plots",
+        nargs="+",
+        default=[],
+        choices=["pdf", "png", "svg"],
+        help="Render QC figures of every channel and sweep in these formats.",
+    )
+
+    parser.add_argument(
+        "--plot-jobs",
+        default=1,
+        type=int,
+        help="Number of processes rendering the figures of a study.",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of studies analysed in parallel.",
+    )
+
+    parser.add_argument(
+        "--sweep-jobs",
+        default=1,
+        type=int,
+        help="Number of processes analysing the sweeps of each study, for studies "
+        "with many sweeps. Not available with --jobs.",
+    )
+
+    parser.add_argument(
+        "--prefetch",
+        default=0,
+        type=int,
+        help="Number of studies read ahead of the analysis and queued for writing, "
+        "on a single process. 0 (default) handles each study in turn.",
+    )
+
+    parser.add_argument(
+        "--cache",
+        default=None,
+        type=Path,
+        help="Directory of the result cache, unchanged studies are not reanalysed.",
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        default=1024,
+        type=int,
+        help="Size limit of the result cache, in MB.",
+    )
+
+    parser.add_argument(
+        "--aggregate",
+        action="store_true",
+        help="Write summary statistics and mean traces per study and protocol.",
+    )
+
+    parser.add_argument(
+        "--shard",
+        default=None,
+        help="Only analyse the i-th of N size-balanced slices of the directory, "
+        "as i/N, and write its manifest for dorsal-ronflex merge.",
+    )
+
+    parser.add_argument(
+        "--prescan",
+        action="store_true",
+        help="Read the headers of the directory first: leave out the files the "
+        "analysis would fail on, and analyse the largest studies first.",
+    )
+
+    parser.add_argument(
+        "--memory-budget",
+        default=None,
+        type=int,
+        help="Estimated memory, in MB, of the studies analysed together by --jobs "
+        "(implies --prescan).",
+    )
+
+    parser.add_argument(
+        "--protocols",
+        nargs="+",
+        default=[],
+        help="Only analyse the studies recorded with these protocols "
+        "(implies --prescan).",
+    )
+
+    parser.add_argument(
+        "--grid",
+        default=None,
+        type=Path,
+        help="Path to a grid file, mapping config keys to the values to try.",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Keep watching the directory, analysing each ABF file once written.",
+    )
+
+    parser.add_argument(
+        "--settle",
+        default=5.0,
+        type=float,
+        help="Seconds without changes after which a watched file is analysed.",
+    )
+
+    parser.add_argument(
+        "--profile",
+        default=None,
+        type=Path,
+        help="Directory of the JSON timing and memory report of every stage.",
+    )
+
+    return parser
+
+
+def build_merge_parser() -> ArgumentParser:
+    """Argument parser of the dorsal-ronflex merge command."""
+    parser = ArgumentParser(
+        prog="dorsal-ronflex merge",
+        description="Combine the results and failures of the shards of a run.",
+    )
+    parser.add_argument(
+        "shards",
+        nargs="+",
+        type=Path,
+        help="Output directories or manifests of the shards.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=".",
+        type=Path,
+        help="Path to the merged output directory.",
+    )
+    return parser
+
+
+def _study_options(args: Namespace) -> "StudyOptions":
+    """How every study is read and analysed, from the parsed arguments."""
+    from dorsal_ronflex.analyse.simplified_abf import StudyOptions
+
+    return StudyOptions(
+        matrix=args.matrix,
+        mapped=args.mapped,
+        formats=tuple(args.formats),
+        channels=tuple(args.channels),
+        all_channels=args.all_channels,
+        gap_free=args.gap_free,
+        chunk_seconds=args.chunk_seconds,
+        profile_dir=args.profile,
+        plot_formats=tuple(args.plots),
+        plot_jobs=args.plot_jobs,
+        database=args.db,
+        sweeps=args.sweeps,
+        sweep_jobs=args.sweep_jobs,
+    )
+
+
+def _shard(args: Namespace) -> "Shard | None":
+    """Shard of the run, if any, from the parsed arguments."""
+    if args.shard is None:
+        return None
+    from dorsal_ronflex.analyse.shards import parse_shard
+
+    try:
+        return parse_shard(args.shard)
+    except ValueError as e:
+        raise SystemExit(str(e)) from None
+
+
+def _planning(args: Namespace) -> "PlanOptions | None":
+    """Pre-scan of the run, if any, from the parsed arguments."""
+    if not (args.prescan or args.memory_budget is not None or args.protocols):
+        return None
+    from dorsal_ronflex.analyse.planner import PlanOptions
+
+    memory_budget = args.memory_budget
+    return PlanOptions(
+        memory_budget=None if memory_budget is None else memory_budget * 2**20,
+        protocols=tuple(args.protocols),
+    )
+
+
+def _run_options(args: Namespace, options: "StudyOptions") -> "RunOptions":
+    """How the studies of the run are scheduled, from the parsed arguments."""
+    from dorsal_ronflex.analyse.analysis import RunOptions, prefetch_conflict
+    from dorsal_ronflex.analyse.cache import ResultCache
+
+    if args.jobs > 1 and args.sweep_jobs > 1:
+        raise SystemExit("--sweep-jobs spreads one study, it cannot run with --jobs.")
+    conflict = prefetch_conflict(options, args.cache is not None)
+    if args.prefetch > 0 and conflict is not None:
+        raise SystemExit(f"--prefetch cannot run with {conflict}.")
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache, args.cache_size * 1024 * 1024)
+    return RunOptions(
+        jobs=args.jobs,
+        cache=cache,
+        prefetch=args.prefetch,
+        shard=_shard(args),
+        planning=_planning(args),
+    )
+
+
+def _run_grid(args: Namespace, options: "StudyOptions") -> None:
+    """Runs the grid search described by the parsed arguments."""
+    from dorsal_ronflex.analyse.analysis import list_studies
+    from dorsal_ronflex.analyse.grid import analyse_and_save_grid
+
+    if options.gap_free:
+        raise SystemExit("--grid analyses sweeps, it cannot run with --gap-free.")
+    analyse_and_save_grid(
+        list_studies(args.path), args.output, args.config, args.grid, options
+    )
+
+
+def _run_watch(args: Namespace, options: "StudyOptions") -> None:
+    """Watches the folder described by the parsed arguments, until interrupted."""
+    from dorsal_ronflex.analyse.watch import FolderWatcher
+
+    watcher = FolderWatcher(args.path, args.output, args.config, options, args.settle)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def run(args: Namespace) -> None:
+    """Runs the analysis described by the parsed arguments.
+    The analysis modules are imported here, so that parsing the arguments
+    (and --help) does not pay for pandas, pyabf or matplotlib.
+    """
+    from dorsal_ronflex.analyse.analysis import analyse_and_save
+
+    options = _study_options(args)
+    if args.grid is not None:
+        _run_grid(args, options)
+        return
+    if args.watch:
+        _run_watch(args, options)
+        return
+
+    run_options = _run_options(args, options)
+    if not args.aggregate:
+        analyse_and_save(
+            args.path,
+            args.output,
+            args.config,
+            options=options,
+            run_options=run_options,
+        )
+        return
+
+    from dorsal_ronflex.analyse.aggregates import aggregate_run
+
+    with aggregate_run(args.output) as aggregates:
+        analyse_and_save(
+            args.path,
+            args.output,
+            args.config,
+            options=options,
+            run_options=replace(run_options, aggregates=aggregates),
+        )
+
+
+def run_merge(args: Namespace) -> None:
+    """Merges the outputs of the shards described by the parsed arguments."""
+    from dorsal_ronflex.analyse.shards import merge_shards
+
+    try:
+        merge_shards(args.shards, args.output)
+    except ValueError as e:
+        raise SystemExit(str(e)) from None
+
 
-    analyse_and_save(path, output, config)
+def main(argv: List[str] | None = None) -> None:
+    """Main function for the dorsal_ronflex package.
+    dorsal-ronflex merge ... merges the outputs of a sharded run.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["merge"]:
+        run_merge(build_merge_parser().parse_args(argv[1:]))
+        return
+    run(build_parser().parse_args(argv))
 
 
 if __name__ == "__main__":
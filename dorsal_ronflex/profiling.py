@@ -0,0 +1,196 @@
+"""Per-stage timing and memory instrumentation of the hot paths."""
+
+import json
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from hashlib import sha1
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, TypeVar
+
+RUN_REPORT_FILENAME = "run.json"
+_SLOWEST_STUDIES = 20
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class StageStats:
+    """Cumulated measures of a stage."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    peak_bytes: int = 0
+
+    def to_dict(self) -> Dict[str, float]:
+        """JSON-friendly measures."""
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "peak_mib": self.peak_bytes / 2**20,
+        }
+
+
+@dataclass
+class _OpenStage:
+    """A stage being measured."""
+
+    name: str
+    start: float
+    start_bytes: int
+    peak_bytes: int = 0
+
+
+@dataclass
+class Profiler:
+    """Collects wall time, call counts and tracemalloc peaks per stage.
+    Stages can be nested, the peak of a stage includes its children.
+    """
+
+    enabled: bool = False
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    _open: List[_OpenStage] = field(default_factory=list)
+    _started_tracing: bool = False
+
+    def start(self) -> None:
+        """Clears the measures and starts profiling."""
+        self.stages.clear()
+        self._open.clear()
+        self.enabled = True
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def stop(self) -> None:
+        """Stops profiling, keeping the measures. Tracing started by someone
+        else goes on.
+        """
+        self.enabled = False
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
+
+    def _update_parent_peak(self, peak: int) -> None:
+        """Carries the traced peak over to the enclosing stage."""
+        if self._open:
+            self._open[-1].peak_bytes = max(self._open[-1].peak_bytes, peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measures the enclosed code as the stage name."""
+        current, peak = tracemalloc.get_traced_memory()
+        self._update_parent_peak(peak)
+        self._open.append(_OpenStage(name, perf_counter(), current))
+        try:
+            yield
+        finally:
+            open_stage = self._open.pop()
+            _, peak = tracemalloc.get_traced_memory()
+            stats = self.stages.setdefault(name, StageStats())
+            stats.calls += 1
+            stats.seconds += perf_counter() - open_stage.start
+            stage_peak = max(open_stage.peak_bytes, peak) - open_stage.start_bytes
+            stats.peak_bytes = max(stats.peak_bytes, stage_peak)
+            self._update_parent_peak(peak)
+
+
+PROFILER = Profiler()
+
+
+def profiled(name: str) -> Callable[[F], F]:
+    """Measures every call of the decorated function as the stage name.
+    When profiling is disabled the only overhead is a flag check.
+    """
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+@dataclass
+class StudyProfile:
+    """Profile report of the analysis of a study."""
+
+    study: str
+    error: str | None = None
+    wall_seconds: float = 0.0
+    stages: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+
+def study_report_path(profile_dir: Path, study_path: str | Path) -> Path:
+    """Where the report of a study is written, unique per study path."""
+    digest = sha1(str(Path(study_path).resolve()).encode()).hexdigest()[:8]
+    return Path(profile_dir) / f"{Path(study_path).stem}-{digest}.json"
+
+
+@contextmanager
+def profile_study(
+    study_path: str | Path, profile_dir: Path | None
+) -> Iterator[StudyProfile]:
+    """Profiles the enclosed analysis and writes its report to profile_dir.
+    Does nothing but yield an empty profile when profile_dir is None.
+    """
+    study_profile = StudyProfile(str(study_path))
+    if profile_dir is None:
+        yield study_profile
+        return
+    PROFILER.start()
+    start = perf_counter()
+    try:
+        with PROFILER.stage("study"):
+            yield study_profile
+    finally:
+        study_profile.wall_seconds = perf_counter() - start
+        PROFILER.stop()
+        study_profile.stages = {
+            name: stats.to_dict() for name, stats in PROFILER.stages.items()
+        }
+        Path(profile_dir).mkdir(parents=True, exist_ok=True)
+        report_path = study_report_path(profile_dir, study_path)
+        report_path.write_text(json.dumps(asdict(study_profile), indent=4))
+
+
+def write_run_report(profile_dir: Path, study_paths: List[Path]) -> Path:
+    """Aggregates the reports of the studies of a run into run.json."""
+    profiles = []
+    for study_path in study_paths:
+        report_path = study_report_path(profile_dir, study_path)
+        if report_path.is_file():
+            profiles.append(StudyProfile(**json.loads(report_path.read_text())))
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for study_profile in profiles:
+        for name, measures in study_profile.stages.items():
+            total = stages.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "peak_mib": 0.0}
+            )
+            total["calls"] += measures["calls"]
+            total["seconds"] += measures["seconds"]
+            total["peak_mib"] = max(total["peak_mib"], measures["peak_mib"])
+
+    slowest = sorted(profiles, key=lambda profile: -profile.wall_seconds)
+    run_report = {
+        "studies": len(profiles),
+        "failed": sum(profile.error is not None for profile in profiles),
+        "wall_seconds": sum(profile.wall_seconds for profile in profiles),
+        "stages": stages,
+        "slowest_studies": [
+            {"study": profile.study, "wall_seconds": profile.wall_seconds}
+            for profile in slowest[:_SLOWEST_STUDIES]
+        ],
+    }
+    run_report_path = Path(profile_dir) / RUN_REPORT_FILENAME
+    run_report_path.write_text(json.dumps(run_report, indent=4))
+    return run_report_path
@@ -2,7 +2,7 @@
 
 import json
 from pathlib import Path
-from typing import TypedDict
+from typing import Any, Dict, Tuple, TypedDict, cast
 
 SEGMENT_START_STR = "segment_start"
 SEGMENT_END_STR = "segment_end"
@@ -36,33 +36,23 @@ _DEFAULT_CONFIG: Config = {
 }
 
 
-class ConfigLoader:
-    """Singleton class for loading the config file."""
+def load_config(filepath: str | Path | None) -> Config:
+    """Loads the config file, or a copy of the default config if there is none."""
+    if filepath is None:
+        return _DEFAULT_CONFIG.copy()
+    with open(str(filepath)) as file:
+        config: Config = json.load(file)
+    return config
 
-    _instance = None
 
-    def __new__(cls):
-        """Singleton instance."""
-        if not cls._instance:
-            cls._instance = super().__new__(cls)
-            cls._instance.config = _DEFAULT_CONFIG
-        return cls._instance
+def override_config(config: Config, overrides: Dict[str, Any]) -> Config:
+    """The config with some of its values replaced."""
+    unknown_keys = set(overrides) - set(Config.__annotations__)
+    if unknown_keys:
+        raise ValueError(f"Unknown config keys: {sorted(unknown_keys)}")
+    return cast(Config, {**config, **overrides})
 
-    def init(self, filepath: str | Path | None) -> None:
-        """Initializes the config file."""
-        if filepath is None:
-            self.config = _DEFAULT_CONFIG
-            return None
-        filepath = str(filepath)
-        with open(filepath) as file:
-            self.config = json.load(file)
 
-    def get(self) -> Config:
-        """Returns the config."""
-        return self.config
-
-
-_CONFIG_LOADER = ConfigLoader()
-_CONFIG_LOADER.init(None)
-
-CONFIG: Config = _CONFIG_LOADER.get()
+def config_interval(config: Config) -> Tuple[int, int]:
+    """Segment of the sweeps analysed, in ms."""
+    return config[SEGMENT_START_STR], config[SEGMENT_END_STR]
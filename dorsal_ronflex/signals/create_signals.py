@@ -1,27 +1,50 @@
 """Signal treatment and creation"""
 
-from typing import Any, List, Tuple
+from typing import Any, Tuple
 
-from numpy import floating
+from numpy import absolute, asarray, float64, floating, searchsorted
 from numpy.typing import NDArray
 
+from dorsal_ronflex.profiling import profiled
 from dorsal_ronflex.signals.signal import Signal
 
 
+def _readonly(array: NDArray[floating[Any]]) -> NDArray[floating[Any]]:
+    """Flags the array as read-only so views can be shared safely"""
+    array.flags.writeable = False
+    return array
+
+
+def _segment_bound(times: NDArray[floating[Any]], ms_bound: float) -> int:
+    """Index of the first time strictly after ms_bound, times being in seconds"""
+    index = int(searchsorted(times, ms_bound / 1000, side="right"))
+    while index < len(times) and times[index] * 1000 <= ms_bound:
+        index += 1
+    while index > 0 and times[index - 1] * 1000 > ms_bound:
+        index -= 1
+    return index
+
+
+def segment_window(times: NDArray[floating[Any]], interval: Tuple[int, int]) -> slice:
+    """Slice of the samples strictly inside the interval (in ms)"""
+    min_ms_range, max_ms_range = interval
+    start = _segment_bound(times, min_ms_range)
+    stop = _segment_bound(times, max_ms_range)
+    if stop > start and times[stop - 1] * 1000 == max_ms_range:
+        stop -= 1
+    return slice(start, max(start, stop))
+
+
+@profiled("crop_signal")
 def _crop_and_format_signal(
     times: NDArray[floating[Any]],
     amps: NDArray[floating[Any]],
     interval: Tuple[int, int],
-) -> Tuple[List[float], List[float]]:
+) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
     """From raw signals returns the same signals in the designated interval"""
-    min_ms_range, max_ms_range = interval
-    new_times = []
-    new_amps = []
-    for key, value in zip(times, amps):
-        time = key * 1000
-        if min_ms_range < time < max_ms_range:
-            new_times.append(key * 1000)
-            new_amps.append(float(value))
+    window = segment_window(times, interval)
+    new_times = _readonly(times[window] * 1000)
+    new_amps = _readonly(asarray(amps[window], dtype=float64))
     return new_times, new_amps
 
 
@@ -36,13 +59,7 @@ def create_signal(
     return Signal(spike_tolerence, new_amps, new_times)
 
 
-def create_abs_signal(
-    times: NDArray[floating[Any]],
-    amps: NDArray[floating[Any]],
-    interval: Tuple[int, int],
-    spike_tolerence: float,
-) -> Signal:
-    """Applies absolute value to all amps"""
-    signal = create_signal(times, amps, interval, spike_tolerence)
-    new_amps = [abs(amp) for amp in signal.amps]
-    return Signal(signal.spike_tolerence, new_amps, signal.times)
+def create_abs_signal(signal: Signal, spike_tolerence: float) -> Signal:
+    """Applies absolute value to all amps, sharing the crop of the given signal"""
+    new_amps = _readonly(absolute(signal.amps))
+    return Signal(spike_tolerence, new_amps, signal.times)
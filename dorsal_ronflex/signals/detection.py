@@ -0,0 +1,125 @@
+"""Vectorized spike detection"""
+
+from typing import Any, List, Tuple
+
+from numpy import (
+    arange,
+    argmax,
+    argmin,
+    bincount,
+    cumsum,
+    delete,
+    diff,
+    empty,
+    flatnonzero,
+    floating,
+    full,
+    inf,
+    int8,
+    intp,
+    maximum,
+    repeat,
+    split,
+    unique,
+    where,
+)
+from numpy.typing import NDArray
+
+from dorsal_ronflex.profiling import profiled
+from dorsal_ronflex.signals.spike import Spike, Spikes
+
+
+def find_spike_runs(
+    amps: NDArray[floating[Any]], tolerence: float
+) -> Tuple[NDArray[intp], NDArray[intp]]:
+    """Start and stop indices of the runs of samples above tolerence.
+    A run still open at the end of the signal is not a spike.
+    """
+    edges = diff((amps > tolerence).astype(int8), prepend=0)
+    starts = flatnonzero(edges == 1)
+    stops = flatnonzero(edges == -1)
+    return starts[: len(stops)], stops
+
+
+def find_run_peaks(
+    amps: NDArray[floating[Any]], starts: NDArray[intp], stops: NDArray[intp]
+) -> NDArray[intp]:
+    """Index of the first highest sample of every run"""
+    if not len(starts):
+        return empty(0, dtype=intp)
+    lengths = stops - starts
+    offsets = cumsum(lengths) - lengths
+    run_ids = repeat(arange(len(starts)), lengths)
+    indices = arange(int(lengths.sum())) - offsets[run_ids] + starts[run_ids]
+    return indices[_find_group_maxima(amps[indices], run_ids, offsets, lengths)]
+
+
+def _find_group_maxima(
+    values: NDArray[floating[Any]],
+    group_ids: NDArray[intp],
+    offsets: NDArray[intp],
+    lengths: NDArray[intp],
+) -> NDArray[intp]:
+    """Position of the first maximum of every contiguous group of values"""
+    is_max = values == repeat(maximum.reduceat(values, offsets), lengths)
+    candidates = flatnonzero(is_max)
+    _, first = unique(group_ids[candidates], return_index=True)
+    return candidates[first]
+
+
+def _find_max_amp_index(amps: NDArray[floating[Any]]) -> int:
+    """Finds the index of the spike with the highest (positive) amplitude."""
+    index = int(argmax(amps))
+    return index if amps[index] > 0 else 0
+
+
+@profiled("detect_spikes")
+def detect_spikes(
+    times: NDArray[floating[Any]], amps: NDArray[floating[Any]], tolerence: float
+) -> Spikes:
+    """Spikes creation, gets all the spikes then splits the stimulation"""
+    peaks = find_run_peaks(amps, *find_spike_runs(amps, tolerence))
+    if not len(peaks):
+        raise ValueError(f"No spike found above tolerence {tolerence}.")
+    stim_index = _find_max_amp_index(amps[peaks])
+    stim_peak = peaks[stim_index]
+    stim = Spike(amp=float(amps[stim_peak]), time=float(times[stim_peak]))
+    res = delete(peaks, stim_index)
+    return Spikes(stim, times[res], amps[res])
+
+
+@profiled("detect_spikes")
+def detect_spikes_matrix(
+    times: NDArray[floating[Any]], amps: NDArray[floating[Any]], tolerence: float
+) -> List[Spikes]:
+    """detect_spikes over every row of a 2D amps array at once.
+    Rows are separated by a -inf sentinel so runs never span two sweeps.
+    """
+    sweep_count, sample_count = amps.shape
+    width = sample_count + 1
+    padded = full((sweep_count, width), -inf)
+    padded[:, :sample_count] = amps
+    flat = padded.ravel()
+    starts, stops = find_spike_runs(flat, tolerence)
+    closed = stops % width != sample_count
+    peaks = find_run_peaks(flat, starts[closed], stops[closed])
+    rows = peaks // width
+    counts = bincount(rows, minlength=sweep_count)
+    if not counts.all():
+        raise ValueError(
+            f"No spike found above tolerence {tolerence} in sweep {argmin(counts)}."
+        )
+    offsets = cumsum(counts) - counts
+    peak_amps = flat[peaks]
+    first_maxima = _find_group_maxima(peak_amps, rows, offsets, counts)
+    stim_positions = where(peak_amps[first_maxima] > 0, first_maxima, offsets)
+    stims = peaks[stim_positions]
+    res = split(delete(peaks, stim_positions), cumsum(counts - 1)[:-1])
+    return [
+        Spikes(
+            Spike(amp=float(flat[stim]), time=float(times[stim % width])),
+            times[res_peaks % width],
+            flat[res_peaks],
+        )
+        for stim, res_peaks in zip(stims.tolist(), res)
+    ]
@@ -1,10 +1,13 @@
 """Definition of Spike and associated methods"""
 
 from dataclasses import dataclass
-from typing import List
+from typing import Any, List, Tuple
 
+from numpy import floating
+from numpy.typing import NDArray
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Spike:
     """Definition of a spike"""
 
@@ -12,11 +15,31 @@ class Spike:
     time: float
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Spikes:
     """Contains the stimulation spike
-    and the rest of the spikes
+    and the rest of the spikes, as arrays sorted by time
     """
 
     stim: Spike
-    res: List[Spike]
+    times: NDArray[floating[Any]]
+    amps: NDArray[floating[Any]]
+
+    def __len__(self) -> int:
+        """Number of spikes besides the stimulation"""
+        return len(self.times)
+
+    @property
+    def bounds(self) -> Tuple[float, float]:
+        """Times of the first and last spike"""
+        if not len(self):
+            raise ValueError("No spike found besides the stimulation.")
+        return float(self.times[0]), float(self.times[-1])
+
+    @property
+    def res(self) -> List[Spike]:
+        """The rest of the spikes as Spike objects"""
+        return [
+            Spike(amp=amp, time=time)
+            for amp, time in zip(self.amps.tolist(), self.times.tolist())
+        ]
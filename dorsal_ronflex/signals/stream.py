@@ -0,0 +1,252 @@
+"""Threshold events of long recordings, detected chunk by chunk"""
+
+from dataclasses import dataclass, field
+from typing import Any, List
+
+from numpy import (
+    absolute,
+    argmax,
+    argmin,
+    asarray,
+    concatenate,
+    cumsum,
+    empty,
+    float64,
+    floating,
+)
+from numpy.typing import NDArray
+
+from dorsal_ronflex.signals.detection import find_run_peaks, find_spike_runs
+from dorsal_ronflex.signals.spike import Spike
+
+
+@dataclass(frozen=True, slots=True)
+class StreamEvent:
+    """Event of a continuous recording, times in ms from its first sample"""
+
+    start_time: float
+    end_time: float
+    peak: Spike
+    spike_count: int
+    area: float
+
+    @property
+    def duration(self) -> float:
+        """Duration of the event"""
+        return self.end_time - self.start_time
+
+
+@dataclass
+class _Run:
+    """Spike, as the run of samples above tolerence holding its peak, sample
+    indices. The integral ms_delay around the peak is kept as soon as it is
+    fed, so that the samples of a long run need not be.
+    """
+
+    start: int
+    peak: int
+    peak_amp: float
+    start_area: float
+    end_area: float | None = None
+
+
+@dataclass
+class _PendingEvent:
+    """Event whose last spike may still be ahead, sample indices"""
+
+    start: int
+    start_area: float
+    last: _Run
+    peak: int
+    peak_amp: float
+    spike_count: int = 0
+
+
+def _open_run_start(above: NDArray[Any]) -> int:
+    """Index where the run still above tolerence at the end starts"""
+    if not len(above) or not above[-1]:
+        return len(above)
+    if above.all():
+        return 0
+    return len(above) - int(argmin(above[::-1]))
+
+
+def _leading_run_length(above: NDArray[Any]) -> int:
+    """Number of samples above tolerence at the start"""
+    return len(above) if above.all() else int(argmin(above))
+
+
+@dataclass
+class EventStream:
+    """Detects the events of a recording fed chunk by chunk.
+    Spikes are the runs of the abs signal above tolerence, and spikes less
+    than twice ms_delay apart make one event, spanning ms_delay before its
+    first spike to ms_delay after its last, as for a sweep.
+    Only the last ms_delay of samples is kept, the spike still above
+    tolerence being followed by its start, running peak and integrals, so
+    memory does not grow with the length of the recording nor of a spike.
+    """
+
+    ms_per_sample: float
+    tolerence: float
+    ms_delay: float
+    _amps: NDArray[floating[Any]] = field(default_factory=lambda: empty(0))
+    _cumulative: NDArray[floating[Any]] = field(default_factory=lambda: empty(0))
+    _offset: int = 0
+    _run: _Run | None = None
+    _pending: _PendingEvent | None = None
+
+    @property
+    def delay_samples(self) -> int:
+        """ms_delay, in samples"""
+        return int(round(self.ms_delay / self.ms_per_sample))
+
+    @property
+    def sample_count(self) -> int:
+        """Number of samples fed so far"""
+        return self._offset + len(self._amps)
+
+    def _area_at(self, index: int) -> float:
+        """Cumulative trapezoidal integral up to the sample"""
+        return float(self._cumulative[index - self._offset])
+
+    def _append(self, amps: NDArray[floating[Any]]) -> None:
+        """Adds the abs samples and their cumulative integral to the buffer"""
+        joined = concatenate((self._amps[-1:], amps))
+        steps = (joined[1:] + joined[:-1]) * self.ms_per_sample / 2.0
+        if not len(self._amps):
+            steps = concatenate(([0.0], steps))
+        origin = self._cumulative[-1] if len(self._cumulative) else 0.0
+        self._amps = concatenate((self._amps, amps))
+        self._cumulative = concatenate((self._cumulative, origin + cumsum(steps)))
+
+    def _settle(self, run: _Run | None) -> None:
+        """Keeps the integral up to ms_delay after the peak once it is fed"""
+        if run is not None and run.end_area is None:
+            end = run.peak + self.delay_samples - 1
+            if end < self.sample_count:
+                run.end_area = self._area_at(max(0, end))
+
+    def _new_run(self, start: int, peak: int) -> _Run:
+        """Run starting at start, whose highest sample so far is peak"""
+        run = _Run(
+            start=start,
+            peak=peak,
+            peak_amp=float(self._amps[peak - self._offset]),
+            start_area=self._area_at(max(0, peak - self.delay_samples)),
+        )
+        self._settle(run)
+        return run
+
+    def _close_pending(self) -> StreamEvent:
+        """Event of the pending spikes"""
+        pending = self._pending
+        assert pending is not None
+        self._pending = None
+        last_end = pending.last.peak + self.delay_samples
+        end = min(last_end, self.sample_count - 1)
+        area = 0.0
+        if end - 1 > pending.start:
+            end_area = pending.last.end_area
+            if end < last_end or end_area is None:
+                end_area = self._area_at(end - 1)
+            area = end_area - pending.start_area
+        return StreamEvent(
+            start_time=pending.start * self.ms_per_sample,
+            end_time=end * self.ms_per_sample,
+            peak=Spike(amp=pending.peak_amp, time=pending.peak * self.ms_per_sample),
+            spike_count=pending.spike_count,
+            area=area,
+        )
+
+    def _add_spike(self, run: _Run, events: List[StreamEvent]) -> None:
+        """Adds a spike to the pending event, or starts a new one"""
+        pending = self._pending
+        if (
+            pending is not None
+            and run.peak - pending.last.peak >= 2 * self.delay_samples
+        ):
+            events.append(self._close_pending())
+            pending = None
+        if pending is None:
+            start = max(0, run.peak - self.delay_samples)
+            pending = _PendingEvent(start, run.start_area, run, run.peak, -1.0)
+            self._pending = pending
+        if run.peak_amp > pending.peak_amp:
+            pending.peak, pending.peak_amp = run.peak, run.peak_amp
+        pending.last = run
+        pending.spike_count += 1
+
+    def _continue_run(
+        self, amps: NDArray[floating[Any]], base: int, events: List[StreamEvent]
+    ) -> int:
+        """Continues the open run over the first samples above tolerence, from
+        base, adding its spike if it ends. Returns the number of samples taken.
+        """
+        run = self._run
+        if run is None:
+            return 0
+        length = _leading_run_length(amps > self.tolerence)
+        index = int(argmax(amps[:length])) if length else 0
+        if length and amps[index] > run.peak_amp:
+            run = self._new_run(run.start, base + index)
+            self._run = run
+        if length < len(amps):
+            self._add_spike(run, events)
+            self._run = None
+        return length
+
+    def _open_run(self, amps: NDArray[floating[Any]], base: int) -> None:
+        """Starts the run still above tolerence at the end of amps, from base"""
+        start = _open_run_start(amps > self.tolerence)
+        if start < len(amps):
+            peak = start + int(argmax(amps[start:]))
+            self._run = self._new_run(base + start, base + peak)
+
+    def _scan(self, amps: NDArray[floating[Any]], base: int) -> List[StreamEvent]:
+        """Events closed by the samples fed from base"""
+        events: List[StreamEvent] = []
+        continued = self._continue_run(amps, base, events)
+        amps, base = amps[continued:], base + continued
+        starts, stops = find_spike_runs(amps, self.tolerence)
+        peaks = find_run_peaks(amps, starts, stops)
+        for start, peak in zip((starts + base).tolist(), (peaks + base).tolist()):
+            self._add_spike(self._new_run(start, peak), events)
+        self._open_run(amps, base)
+        scanned = self.sample_count if self._run is None else self._run.start
+        pending = self._pending
+        if (
+            pending is not None
+            and scanned - pending.last.peak >= 2 * self.delay_samples
+        ):
+            events.append(self._close_pending())
+        return events
+
+    def _trim(self) -> None:
+        """Drops the samples no pending nor future event can reach"""
+        keep = max(self._offset, self.sample_count - self.delay_samples - 2)
+        self._amps = self._amps[keep - self._offset :]
+        self._cumulative = self._cumulative[keep - self._offset :]
+        self._offset = keep
+
+    def feed(self, amps: NDArray[floating[Any]]) -> List[StreamEvent]:
+        """Adds the next samples of the recording, returns the events closed"""
+        if not len(amps):
+            return []
+        base = self.sample_count
+        amps = absolute(asarray(amps, dtype=float64))
+        self._append(amps)
+        self._settle(self._run)
+        self._settle(self._pending.last if self._pending is not None else None)
+        events = self._scan(amps, base)
+        self._trim()
+        return events
+
+    def close(self) -> List[StreamEvent]:
+        """Ends the recording, returns the last event if any.
+        A spike still above tolerence at the end is not a spike.
+        """
+        self._run = None
+        if self._pending is None:
+            return []
+        return [self._close_pending()]
@@ -0,0 +1,79 @@
+"""Time lookups and cumulative integrals over sorted signals"""
+
+from typing import Any
+
+from numpy import (
+    arange,
+    asarray,
+    concatenate,
+    cumsum,
+    diff,
+    float64,
+    floating,
+    intp,
+    searchsorted,
+    where,
+    zeros,
+)
+from numpy.typing import ArrayLike, NDArray
+
+from dorsal_ronflex.profiling import profiled
+
+# Samples needed to have a neighbour on each side of a target
+_MIN_NEIGHBOUR_SAMPLES = 2
+
+
+def nearest_time_indices(
+    times: NDArray[floating[Any]], targets: ArrayLike
+) -> NDArray[intp]:
+    """Indices of the closest times to the targets, the earliest on ties.
+    times must be sorted.
+    """
+    targets = asarray(targets, dtype=float64)
+    if len(times) < _MIN_NEIGHBOUR_SAMPLES:
+        return zeros(targets.shape, dtype=intp)
+    right = searchsorted(times, targets).clip(1, len(times) - 1)
+    left = right - 1
+    use_right = (times[right] - targets) < (targets - times[left])
+    return where(use_right, right, left)
+
+
+@profiled("cumulative_area")
+def cumulative_trapezoid(
+    times: NDArray[floating[Any]], amps: NDArray[floating[Any]]
+) -> NDArray[floating[Any]]:
+    """Trapezoidal integral of amps from the first sample up to every sample.
+    amps may be 2D (one row per sweep), the integral runs along the last axis.
+    """
+    steps = diff(times) * (amps[..., 1:] + amps[..., :-1]) / 2.0
+    origin = zeros(amps.shape[:-1] + (1,))
+    return concatenate((origin, cumsum(steps, axis=-1)), axis=-1)
+
+
+def window_areas(
+    times: NDArray[floating[Any]],
+    cumulative: NDArray[floating[Any]],
+    start_times: ArrayLike,
+    end_times: ArrayLike,
+) -> NDArray[floating[Any]]:
+    """Areas between the samples closest to each start and end time.
+    As with a slice, the sample closest to the end time is excluded.
+    """
+    start_indices = nearest_time_indices(times, start_times)
+    last_indices = nearest_time_indices(times, end_times) - 1
+    areas = cumulative[last_indices] - cumulative[start_indices]
+    return where(last_indices > start_indices, areas, 0.0)
+
+
+def row_window_areas(
+    times: NDArray[floating[Any]],
+    cumulative: NDArray[floating[Any]],
+    start_times: ArrayLike,
+    end_times: ArrayLike,
+) -> NDArray[floating[Any]]:
+    """Same as window_areas with one window per row of a 2D cumulative"""
+    rows = arange(cumulative.shape[0])
+    start_indices = nearest_time_indices(times, start_times)
+    last_indices = nearest_time_indices(times, end_times) - 1
+    areas = cumulative[rows, last_indices] - cumulative[rows, start_indices]
+    return where(last_indices > start_indices, areas, 0.0)
@@ -1,44 +1,59 @@
 """File Handling sweep creation"""
 
-from typing import Any
+from typing import Any, List, Sequence
 
 from numpy import floating
 from numpy.typing import NDArray
 
 from dorsal_ronflex.settings import (
-    CONFIG,
     DEFAULT_ABS_TOLERANCE_STR,
     DEFAULT_CURVE_CHECK_STR,
     DEFAULT_MS_DELAY_STR,
     DEFAULT_TOLERANCE_STR,
-    SEGMENT_END_STR,
-    SEGMENT_START_STR,
+    Config,
+    config_interval,
 )
 from dorsal_ronflex.signals.create_signals import create_abs_signal, create_signal
+from dorsal_ronflex.sweep.result import SweepResult
 from dorsal_ronflex.sweep.sweep import Sweep
-
-_INTERVAL = CONFIG[SEGMENT_START_STR], CONFIG[SEGMENT_END_STR]
-_DEFAULT_TOLERANCE = CONFIG[DEFAULT_TOLERANCE_STR]
-_DEFAULT_ABS_TOLERANCE = CONFIG[DEFAULT_ABS_TOLERANCE_STR]
-_DEFAULT_CURVE_CHECK = CONFIG[DEFAULT_CURVE_CHECK_STR]
-_DEFAULT_MS_DELAY = CONFIG[DEFAULT_MS_DELAY_STR]
+from dorsal_ronflex.sweep.sweep_matrix import analyse_sweep_matrix
 
 
 def create_sweep(
-    id: int, times: NDArray[floating[Any]], amps: NDArray[floating[Any]]
+    id: int,
+    times: NDArray[floating[Any]],
+    amps: NDArray[floating[Any]],
+    config: Config,
 ) -> Sweep:
     """Creates different signals and starts the sweep"""
-    raw_signals = create_signal(times, amps, _INTERVAL, _DEFAULT_TOLERANCE)
-    abs_signals = create_abs_signal(
-        times,
-        amps,
-        _INTERVAL,
-        _DEFAULT_ABS_TOLERANCE,
+    raw_signals = create_signal(
+        times, amps, config_interval(config), config[DEFAULT_TOLERANCE_STR]
     )
+    abs_signals = create_abs_signal(raw_signals, config[DEFAULT_ABS_TOLERANCE_STR])
     return Sweep(
         id,
         raw_signals,
         abs_signals,
-        _DEFAULT_CURVE_CHECK,
-        _DEFAULT_MS_DELAY,
+        config[DEFAULT_CURVE_CHECK_STR],
+        config[DEFAULT_MS_DELAY_STR],
+    )
+
+
+def create_sweep_results(
+    times: NDArray[floating[Any]],
+    amps: NDArray[floating[Any]],
+    config: Config,
+    sweep_ids: Sequence[int] | None = None,
+) -> List[SweepResult]:
+    """Analyses all the sweeps of a 2D amps array (sweeps x samples) at once,
+    sweep_ids being the ids of its rows
+    """
+    return analyse_sweep_matrix(
+        times,
+        amps,
+        config_interval(config),
+        (config[DEFAULT_TOLERANCE_STR], config[DEFAULT_ABS_TOLERANCE_STR]),
+        config[DEFAULT_CURVE_CHECK_STR],
+        config[DEFAULT_MS_DELAY_STR],
+        sweep_ids,
     )
@@ -0,0 +1,97 @@
+"""Computed results of a sweep"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Tuple
+
+from dorsal_ronflex.signals.spike import Spike, Spikes
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+
+@dataclass(frozen=True)
+class SweepResult:
+    """Everything we export from a Sweep, without its signals"""
+
+    id: int
+    stim: Spike
+    raw_spikes: Spikes
+    abs_spikes: Spikes
+    raw_tolerence: float
+    abs_tolerence: float
+    event_bondaries: Tuple[float, float]
+    area: float
+    control_area: float
+    ms_delay: int
+    control_area_increment: int
+
+    @property
+    def event_duration(self) -> float:
+        """Duration of the event"""
+        start, end = self.event_bondaries
+        return end - start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-friendly representation of the sweep."""
+        return {
+            "id": self.id,
+            "stim": {"amp": self.stim.amp, "time": self.stim.time},
+            "raw_tolerence": self.raw_tolerence,
+            "abs_tolerence": self.abs_tolerence,
+            "start_time": self.event_bondaries[0],
+            "end_time": self.event_bondaries[1],
+            "event_duration": self.event_duration,
+            "area": self.area,
+            "control_area": self.control_area,
+            "ms_delay": self.ms_delay,
+            "control_area_increment": self.control_area_increment,
+            "raw_spikes": {
+                "times": self.raw_spikes.times.tolist(),
+                "amps": self.raw_spikes.amps.tolist(),
+            },
+            "abs_spikes": {
+                "times": self.abs_spikes.times.tolist(),
+                "amps": self.abs_spikes.amps.tolist(),
+            },
+        }
+
+    def to_df(self) -> "DataFrame":
+        """Returns a DataFrame representation of the sweep."""
+        from pandas import DataFrame
+
+        data = {
+            "Sweep ID": [self.id],
+            "Stim": [self.stim],
+            "Start Time": [self.event_bondaries[0]],
+            "End Time": [self.event_bondaries[1]],
+            "Event Duration": [self.event_duration],
+            "Area": [self.area],
+            "Control Area": [self.control_area],
+            "Ms Delay": [self.ms_delay],
+            "Control Area Increment": [self.control_area_increment],
+        }
+        return DataFrame(data)
+
+    def to_txt(self) -> str:
+        """Returns a string representation of the sweep."""
+        raw_spikes = "".join([str(spike) + "\n" for spike in self.raw_spikes.res])
+        abs_spikes = "".join([str(spike) + "\n" for spike in self.abs_spikes.res])
+        return f"""
+----------------------------------------
+Sweep ID: {self.id}
+Stim: {self.stim}
+Raw Tolerence: {self.raw_tolerence}
+Abs Tolerance: {self.abs_tolerence}
+Start Time: {self.event_bondaries[0]}
+End Time: {self.event_bondaries[1]}
+Event Duration: {self.event_duration}
+Area: {self.area}
+Control Area: {self.control_area}
+Ms Delay: {self.ms_delay}
+Control Area Increment: {self.control_area_increment}
+
+Raw Spikes:
+{raw_spikes}
+Abs Spikes:
+{abs_spikes}
+"""
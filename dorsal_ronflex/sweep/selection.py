@@ -0,0 +1,48 @@
+"""Selection of the sweeps of a study, as indices and Python slices."""
+
+from typing import List
+
+# Bounds of a slice, start:stop or start:stop:step
+_MAX_SLICE_BOUNDS = 3
+
+SelectionPart = int | slice
+
+
+def _parse_part(part: str) -> SelectionPart:
+    """Index or slice of a part of a selection."""
+    try:
+        bounds = [int(bound) if bound.strip() else None for bound in part.split(":")]
+    except ValueError:
+        raise ValueError(f"Invalid sweep selection {part!r}.") from None
+    if len(bounds) == 1 and bounds[0] is not None:
+        return bounds[0]
+    if 1 < len(bounds) <= _MAX_SLICE_BOUNDS and bounds[2:] != [0]:
+        return slice(*bounds)
+    raise ValueError(f"Invalid sweep selection {part!r}.")
+
+
+def parse_selection(selection: str) -> List[SelectionPart]:
+    """Indices and slices of a selection such as 0:10, ::5 or 1,4,10:20:2,
+    whatever the number of sweeps.
+    """
+    return [_parse_part(part) for part in selection.split(",")]
+
+
+def select_sweeps(selection: str, sweep_count: int) -> List[int]:
+    """Sweep numbers of a selection of indices and slices, as in Python,
+    such as 0:10, ::5 or 1,4,10:20:2.
+    """
+    sweep_numbers = range(sweep_count)
+    selected = set()
+    for part in parse_selection(selection):
+        if isinstance(part, slice):
+            selected.update(sweep_numbers[part])
+        elif -sweep_count <= part < sweep_count:
+            selected.add(sweep_numbers[part])
+        else:
+            raise ValueError(
+                f"Invalid sweep selection {part} for {sweep_count} sweeps."
+            )
+    if not selected:
+        raise ValueError(f"No sweep selected by {selection!r}.")
+    return sorted(selected)
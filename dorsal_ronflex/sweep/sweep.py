@@ -2,74 +2,62 @@
 
 from dataclasses import dataclass
 from functools import cached_property
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Any, Tuple
 
-from numpy import abs, array, trapz
-from pandas import DataFrame
+from numpy import asarray, float64, floating
+from numpy.typing import ArrayLike, NDArray
 
+from dorsal_ronflex.profiling import profiled
 from dorsal_ronflex.signals.signal import Signal
 from dorsal_ronflex.signals.spike import Spike, Spikes
+from dorsal_ronflex.sweep.area import (
+    cumulative_trapezoid,
+    nearest_time_indices,
+    window_areas,
+)
+from dorsal_ronflex.sweep.result import SweepResult
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
 
-def _get_index_of_time(time: float, times: List[float]) -> int:
-    """Gets the index of the time."""
-    closest_time = _match_time_to_signals(times, time)
-    for index, signal_time in enumerate(times):
-        if signal_time == closest_time:
-            return index
-    raise ValueError("Time not found in signals.")
+
+@profiled("area")
+def calc_areas_under_curve(
+    sweep: "Sweep", start_times: ArrayLike, end_times: ArrayLike
+) -> NDArray[floating[Any]]:
+    """Calculates the areas under the curve for many windows at once."""
+    return window_areas(
+        sweep.abs_signals.times, sweep.cumulative_area, start_times, end_times
+    )
 
 
 def calc_area_under_curve(sweep: "Sweep", start_time: float, end_time: float) -> float:
     """Calculates the area under the curve."""
-    start_index = _get_index_of_time(start_time, sweep.abs_signals.times)
-    stop_index = _get_index_of_time(end_time, sweep.abs_signals.times)
-    y = sweep.abs_signals.amps[start_index:stop_index]
-    x = sweep.abs_signals.times[start_index:stop_index]
-    area = trapz(y, x)
-    return float(area)
-
-
-def _find_earliest_spike(all_spikes: List[Spike]) -> Spike:
-    """Given a list of spikes, returns the spike with the lowest time"""
-    min = all_spikes[0]
-    for spike in all_spikes:
-        if spike.time < min.time:
-            min = spike
-    return min
-
-
-def _find_latest_spike(all_spikes: List[Spike]) -> Spike:
-    """Given a list of spikes, returns the spike with the highest time"""
-    max = all_spikes[0]
-    for spike in all_spikes:
-        if spike.time > max.time:
-            max = spike
-    return max
+    return float(calc_areas_under_curve(sweep, [start_time], [end_time])[0])
 
 
-def _match_time_to_signals(times: List[float], guess: float) -> float:
-    """Finds the closest time to the given guess."""
-    nd_times = array(times)
-    closest_index = abs(nd_times - guess).argmin()
-    closest_time = times[int(closest_index)]
-    return closest_time
+def _match_times_to_signals(
+    times: NDArray[floating[Any]], guesses: ArrayLike
+) -> NDArray[floating[Any]]:
+    """Finds the closest times to the given guesses."""
+    return times[nearest_time_indices(times, guesses)]
 
 
-def _find_bounding_spikes(spikes_res: List[Spike]) -> Tuple[Spike, Spike]:
-    """Returns the first and last spike in the event"""
-    return _find_earliest_spike(spikes_res), _find_latest_spike(spikes_res)
+def infer_events_bondaries(
+    sweep: "Sweep", ms_delays: ArrayLike
+) -> Tuple[NDArray[floating[Any]], NDArray[floating[Any]]]:
+    """Event boundaries for several ms delay candidates"""
+    first_time, last_time = sweep.abs_spikes.bounds
+    delays = asarray(ms_delays, dtype=float64)
+    starts = _match_times_to_signals(sweep.abs_signals.times, first_time - delays)
+    ends = _match_times_to_signals(sweep.abs_signals.times, last_time + delays)
+    return starts, ends
 
 
 def infer_event_bondaries(sweep: "Sweep") -> Tuple[float, float]:
     """Applies ms delay to exterme spikes, and fits them on the curve"""
-    first_spike, last_spike = _find_bounding_spikes(sweep.abs_spikes.res)
-    decremented_time = first_spike.time - sweep.ms_delay
-    incremented_time = last_spike.time + sweep.ms_delay
-    start, end = _match_time_to_signals(
-        sweep.abs_signals.times, decremented_time
-    ), _match_time_to_signals(sweep.abs_signals.times, incremented_time)
-    return start, end
+    starts, ends = infer_events_bondaries(sweep, [sweep.ms_delay])
+    return float(starts[0]), float(ends[0])
 
 
 @dataclass
@@ -85,7 +73,7 @@ class Sweep:
     @cached_property
     def stim(self) -> Spike:
         """Point of stimulation"""
-        return self.raw_signals.spikes.stim
+        return self.raw_spikes.stim
 
     @cached_property
     def raw_spikes(self) -> Spikes:
@@ -102,6 +90,11 @@ class Sweep:
         """Start time and end time of the event"""
         return infer_event_bondaries(self)
 
+    @cached_property
+    def cumulative_area(self) -> NDArray[floating[Any]]:
+        """Cumulative trapezoidal integral of the abs signal"""
+        return cumulative_trapezoid(self.abs_signals.times, self.abs_signals.amps)
+
     @cached_property
     def event_duration(self) -> float:
         """Duration of the event"""
@@ -123,41 +116,42 @@ class Sweep:
         )
         return calc_area_under_curve(self, start, end)
 
-    def to_df(self) -> DataFrame:
+    def areas(
+        self, start_times: ArrayLike, end_times: ArrayLike
+    ) -> NDArray[floating[Any]]:
+        """Areas of many windows, one per start and end time"""
+        return calc_areas_under_curve(self, start_times, end_times)
+
+    def control_areas(self, increments: ArrayLike) -> NDArray[floating[Any]]:
+        """Control areas for several increments from the event start"""
+        start = self.event_bondaries[0]
+        ends = start + asarray(increments, dtype=float64)
+        return self.areas(start, ends)
+
+    def delay_areas(self, ms_delays: ArrayLike) -> NDArray[floating[Any]]:
+        """Event areas for several ms delay candidates"""
+        return self.areas(*infer_events_bondaries(self, ms_delays))
+
+    def to_result(self) -> SweepResult:
+        """Computed results of the sweep, detached from its signals"""
+        return SweepResult(
+            id=self.id,
+            stim=self.stim,
+            raw_spikes=self.raw_spikes,
+            abs_spikes=self.abs_spikes,
+            raw_tolerence=self.raw_signals.spike_tolerence,
+            abs_tolerence=self.abs_signals.spike_tolerence,
+            event_bondaries=self.event_bondaries,
+            area=self.area,
+            control_area=self.control_area,
+            ms_delay=self.ms_delay,
+            control_area_increment=self.control_area_increment,
+        )
+
+    def to_df(self) -> "DataFrame":
         """Returns a DataFrame representation of the sweep."""
-        data = {
-            "Sweep ID": [self.id],
-            "Stim": [self.stim],
-            "Start Time": [self.event_bondaries[0]],
-            "End Time": [self.event_bondaries[1]],
-            "Event Duration": [self.event_duration],
-            "Area": [self.area],
-            "Control Area": [self.control_area],
-            "Ms Delay": [self.ms_delay],
-            "Control Area Increment": [self.control_area_increment],
-        }
-        return DataFrame(data)
+        return self.to_result().to_df()
 
     def to_txt(self) -> str:
         """Returns a string representation of the sweep."""
-        raw_spikes = "".join([str(spike) + "\n" for spike in self.raw_spikes.res])
-        abs_spikes = "".join([str(spike) + "\n" for spike in self.abs_spikes.res])
-        return f"""
-----------------------------------------
-Sweep ID: {self.id}
-Stim: {self.stim}
-Raw Tolerence: {self.raw_signals.spike_tolerence}
-Abs Tolerance: {self.abs_signals.spike_tolerence}
-Start Time: {self.event_bondaries[0]}
-End Time: {self.event_bondaries[1]}
-Event Duration: {self.event_duration}
-Area: {self.area}
-Control Area: {self.control_area}
-Ms Delay: {self.ms_delay}
-Control Area Increment: {self.control_area_increment}
-
-Raw Spikes:
-{raw_spikes}
-Abs Spikes:
-{abs_spikes}
-"""
+        return self.to_result().to_txt()
@@ -0,0 +1,70 @@
+"""Whole-study analysis of equal-length sweeps stacked in a 2D array"""
+
+from typing import Any, List, Sequence, Tuple
+
+from numpy import absolute, array, asarray, float64, floating
+from numpy.typing import NDArray
+
+from dorsal_ronflex.profiling import profiled
+from dorsal_ronflex.signals.create_signals import segment_window
+from dorsal_ronflex.signals.detection import detect_spikes_matrix
+from dorsal_ronflex.sweep.area import (
+    cumulative_trapezoid,
+    nearest_time_indices,
+    row_window_areas,
+)
+from dorsal_ronflex.sweep.result import SweepResult
+
+
+@profiled("sweep_matrix")
+def analyse_sweep_matrix(
+    times: NDArray[floating[Any]],
+    amps: NDArray[floating[Any]],
+    interval: Tuple[int, int],
+    tolerences: Tuple[float, float],
+    control_area_increment: int,
+    ms_delay: int,
+    sweep_ids: Sequence[int] | None = None,
+) -> List[SweepResult]:
+    """Same results as create_sweep for every row of amps (sweeps x samples),
+    times being the shared sweep time axis in seconds.
+    tolerences holds the raw then the abs spike tolerence, sweep_ids the id of
+    every row (its index by default).
+    """
+    if sweep_ids is None:
+        sweep_ids = range(amps.shape[0])
+    tolerence, abs_tolerence = tolerences
+    window = segment_window(times, interval)
+    cropped_times = times[window] * 1000
+    raw_amps = asarray(amps[:, window], dtype=float64)
+    abs_amps = absolute(raw_amps)
+
+    raw_spikes = detect_spikes_matrix(cropped_times, raw_amps, tolerence)
+    abs_spikes = detect_spikes_matrix(cropped_times, abs_amps, abs_tolerence)
+
+    first_times, last_times = array([spikes.bounds for spikes in abs_spikes]).T
+    starts = cropped_times[nearest_time_indices(cropped_times, first_times - ms_delay)]
+    ends = cropped_times[nearest_time_indices(cropped_times, last_times + ms_delay)]
+
+    cumulative = cumulative_trapezoid(cropped_times, abs_amps)
+    areas = row_window_areas(cropped_times, cumulative, starts, ends)
+    control_areas = row_window_areas(
+        cropped_times, cumulative, starts, starts + control_area_increment
+    )
+
+    return [
+        SweepResult(
+            id=sweep_id,
+            stim=raw_spikes[row].stim,
+            raw_spikes=raw_spikes[row],
+            abs_spikes=abs_spikes[row],
+            raw_tolerence=tolerence,
+            abs_tolerence=abs_tolerence,
+            event_bondaries=(float(starts[row]), float(ends[row])),
+            area=float(areas[row]),
+            control_area=float(control_areas[row]),
+            ms_delay=ms_delay,
+            control_area_increment=control_area_increment,
+        )
+        for row, sweep_id in enumerate(sweep_ids)
+    ]
@@ -0,0 +1,27 @@
+"""Synthetic ABF studies shared by the tests"""
+
+from pathlib import Path
+
+import pytest
+
+from benchmarks.synthetic import SyntheticSpec, write_synthetic_abf
+
+STUDY_COUNT = 3
+SWEEP_COUNT = 4
+
+
+@pytest.fixture(scope="session")
+def study_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Directory of small two-channel studies, and a file that is no ABF"""
+    directory = tmp_path_factory.mktemp("studies")
+    for seed in range(STUDY_COUNT):
+        spec = SyntheticSpec(sweep_count=SWEEP_COUNT + seed, seed=seed)
+        write_synthetic_abf(spec, directory / f"study_{seed}.abf")
+    (directory / "broken.abf").write_bytes(b"not an abf file")
+    return directory
+
+
+@pytest.fixture(scope="session")
+def study_path(study_dir: Path) -> Path:
+    """A study of the shared directory"""
+    return study_dir / "study_0.abf"
@@ -0,0 +1,63 @@
+"""Merged running statistics against a single pass over the values"""
+
+from pathlib import Path
+from typing import List
+
+import pytest
+from numpy.random import default_rng
+
+from dorsal_ronflex.analyse.aggregates import QUANTILES, RunningStats, summarise_study
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy
+
+
+def _values(count: int = 1000) -> List[float]:
+    """Values of both signs, with zeros and non-finite values"""
+    rng = default_rng(0)
+    values = rng.normal(0.5, 2.0, count).round(2).tolist()
+    return [*values, float("nan"), float("inf"), 0.0]
+
+
+def _single_pass(values: List[float]) -> RunningStats:
+    """Statistics of the values added one by one"""
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    return stats
+
+
+@pytest.mark.parametrize("parts", [1, 2, 7, 64])
+def test_merge_matches_single_pass(parts: int) -> None:
+    """Statistics merged from any split of the values, empty parts included"""
+    values = _values()
+    merged = RunningStats()
+    for part in range(parts + 1):
+        merged.merge(_single_pass(values[part::parts] if part < parts else []))
+    expected = _single_pass(values)
+    assert merged.count == expected.count
+    assert merged.mean == pytest.approx(expected.mean)
+    assert merged.std == pytest.approx(expected.std)
+    assert (merged.minimum, merged.maximum) == (expected.minimum, expected.maximum)
+    for q in QUANTILES:
+        assert merged.sketch.quantile(q) == expected.sketch.quantile(q)
+
+
+def test_merge_into_empty_stats() -> None:
+    """Merging into empty statistics copies them"""
+    expected = _single_pass(_values())
+    merged = RunningStats()
+    merged.merge(expected)
+    assert merged.row() == expected.row()
+
+
+def test_only_measurements_are_aggregated(study_path: Path) -> None:
+    """Config values, such as the control area increment, are not aggregated"""
+    study = AbfStudy(study_path)
+    study.analyse()
+    (group,) = summarise_study(study).groups.values()
+    assert sorted(group.metrics) == [
+        "Abs Spike Count",
+        "Area",
+        "Control Area",
+        "Event Duration",
+        "Raw Spike Count",
+    ]
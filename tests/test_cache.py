@@ -0,0 +1,105 @@
+"""Result cache hits, invalidation and eviction"""
+
+from os import utime
+from pathlib import Path
+from shutil import copy2
+from typing import Any, Dict
+
+import pytest
+
+from benchmarks.synthetic import SyntheticSpec, write_synthetic_abf
+from dorsal_ronflex.analyse import analysis
+from dorsal_ronflex.analyse import cache as result_cache
+from dorsal_ronflex.analyse.analysis import RunOptions, RunSummary, analyse_and_save
+from dorsal_ronflex.analyse.cache import ResultCache, hash_study
+from dorsal_ronflex.settings import load_config
+
+CACHE_BYTES = 2**30
+ENTRY_BYTES = 1000
+MODIFIED_VERSIONS = 2
+
+
+def _outputs(output_dir: str) -> Dict[str, bytes]:
+    """Contents of the files of a study directory"""
+    return {path.name: path.read_bytes() for path in Path(output_dir).iterdir()}
+
+
+def _run(study: Path, output: Path, cache: ResultCache) -> RunSummary:
+    """Summary of a cached run of the study"""
+    output.mkdir(exist_ok=True)
+    summary = analyse_and_save(
+        str(study), output, None, run_options=RunOptions(cache=cache)
+    )
+    assert not summary.failed
+    return summary
+
+
+@pytest.fixture
+def study(study_path: Path, tmp_path: Path) -> Path:
+    """Copy of a study, free to be modified"""
+    return Path(copy2(study_path, tmp_path / study_path.name))
+
+
+def _key(study: Path, **changes: Any) -> str:
+    """Key of the study with the default config and formats, or changes"""
+    arguments = {"config": load_config(None), "formats": ("txt", "csv")}
+    return hash_study(study, **{**arguments, **changes})
+
+
+def test_key_changes_with_file_config_options_and_code(
+    study: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Each of what the results depend on changes the key"""
+    key = _key(study)
+    assert _key(study) == key
+    config = {**load_config(None), "default_tolerance": 0.3}
+    assert _key(study, config=config) != key
+    assert _key(study, formats=("csv",)) != key
+    assert _key(study, results_key={"sweeps": "0:2"}) != key
+    with monkeypatch.context() as context:
+        context.setattr(result_cache, "code_digest", lambda: "changed code")
+        assert _key(study) != key
+    write_synthetic_abf(SyntheticSpec(sweep_count=4, seed=7), study)
+    assert _key(study) != key
+
+
+def test_cached_study_is_not_analysed_again(
+    study: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Re-runs reuse the output directory, new outputs get the cached copy"""
+    cache = ResultCache(tmp_path / "cache", CACHE_BYTES)
+    first = _run(study, tmp_path / "first", cache)
+    monkeypatch.setattr(analysis, "AbfStudy", None)
+    again = _run(study, tmp_path / "first", cache)
+    assert again.output_dirs == first.output_dirs
+    copied = _run(study, tmp_path / "copied", cache)
+    (first_dir,) = first.output_dirs.values()
+    (copied_dir,) = copied.output_dirs.values()
+    assert _outputs(copied_dir) == _outputs(first_dir)
+
+
+def test_modified_study_is_analysed_again(study: Path, tmp_path: Path) -> None:
+    """A modified file gets new results, cached next to the previous ones"""
+    cache = ResultCache(tmp_path / "cache", CACHE_BYTES)
+    (first_dir,) = _run(study, tmp_path / "first", cache).output_dirs.values()
+    write_synthetic_abf(SyntheticSpec(sweep_count=4, seed=7), study)
+    (second_dir,) = _run(study, tmp_path / "second", cache).output_dirs.values()
+    assert _outputs(second_dir) != _outputs(first_dir)
+    assert len(list((tmp_path / "cache").glob("*/*"))) == MODIFIED_VERSIONS
+
+
+def test_eviction_keeps_the_recently_used_entries(tmp_path: Path) -> None:
+    """Least recently used entries go first, until the cache fits its size"""
+    cache = ResultCache(tmp_path / "cache", 2 * ENTRY_BYTES + ENTRY_BYTES // 2)
+    output_dir = tmp_path / "study"
+    output_dir.mkdir()
+    (output_dir / "study.csv").write_bytes(bytes(ENTRY_BYTES))
+    keys = [f"{index:02d}{'0' * 62}" for index in range(4)]
+    for key in keys:
+        cache.put(key, "study", output_dir)
+    for last_use, key in enumerate([keys[2], keys[1], keys[0], keys[3]]):
+        entry = cache.get(key)
+        assert entry is not None
+        utime(entry, (last_use, last_use))
+    cache.evict()
+    assert [cache.get(key) is not None for key in keys] == [True, False, False, True]
@@ -0,0 +1,68 @@
+"""Results of runs inserted in the SQLite database"""
+
+import sqlite3
+from pathlib import Path
+from typing import Dict
+
+from dorsal_ronflex.analyse.analysis import RunOptions, RunSummary, analyse_and_save
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.export import database
+
+
+def _run(study_dir: Path, output: Path, db: Path, jobs: int = 1) -> RunSummary:
+    """Summary of a run of the directory inserting its results in db"""
+    output.mkdir()
+    return analyse_and_save(
+        str(study_dir),
+        output,
+        None,
+        options=StudyOptions(all_channels=True, database=db),
+        run_options=RunOptions(jobs=jobs),
+    )
+
+
+def _counts(db: Path) -> Dict[str, int]:
+    """Number of rows of every table"""
+    with sqlite3.connect(db) as connection:
+        return {
+            table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("studies", "sweeps", "spikes")
+        }
+
+
+def _expected_counts(summary: RunSummary) -> Dict[str, int]:
+    """Number of channels and sweeps of the studies that succeeded"""
+    studies = [
+        AbfStudy(path, None, StudyOptions(all_channels=True))
+        for path in summary.succeeded
+    ]
+    return {
+        "studies": sum(len(study.channels) for study in studies),
+        "sweeps": sum(len(study.channels) * study.sweep_count for study in studies),
+    }
+
+
+def test_run_inserts_every_channel_and_sweep(study_dir: Path, tmp_path: Path) -> None:
+    """A row per channel of each study, a row per sweep of each channel"""
+    db = tmp_path / "results.db"
+    summary = _run(study_dir, tmp_path / "output", db)
+    counts = _counts(db)
+    assert {table: counts[table] for table in ("studies", "sweeps")} == (
+        _expected_counts(summary)
+    )
+    assert counts["spikes"] > 0
+    assert not database._run_databases
+
+
+def test_rerun_replaces_the_results(study_dir: Path, tmp_path: Path) -> None:
+    """Re-running, on a process or several, replaces the rows of the studies"""
+    db = tmp_path / "results.db"
+    _run(study_dir, tmp_path / "first", db)
+    first_counts = _counts(db)
+    _run(study_dir, tmp_path / "second", db, jobs=2)
+    assert _counts(db) == first_counts
+    with sqlite3.connect(db) as connection:
+        output_dirs = connection.execute("SELECT output_dir FROM studies").fetchall()
+    assert {Path(output_dir).parent for output_dir, in output_dirs} == {
+        tmp_path / "second"
+    }
@@ -0,0 +1,101 @@
+"""Array-based spike detection against the original list-based detection"""
+
+from typing import List, Tuple
+
+import pytest
+from numpy import arange, array, float64, sin
+from numpy.random import default_rng
+
+from dorsal_ronflex.signals.detection import detect_spikes, detect_spikes_matrix
+from dorsal_ronflex.signals.spike import Spike, Spikes
+
+TOLERENCE = 0.1
+
+
+def _reference_successions(
+    times: List[float], amps: List[float], tolerence: float
+) -> List[List[Spike]]:
+    """Closed runs of samples above tolerence, as the list-based detection found"""
+    successions: List[List[Spike]] = []
+    succession: List[Spike] = []
+    for time, amp in zip(times, amps):
+        if amp > tolerence:
+            succession.append(Spike(amp=amp, time=time))
+        elif succession:
+            successions.append(succession)
+            succession = []
+    return successions
+
+
+def _reference_spikes(
+    times: List[float], amps: List[float], tolerence: float
+) -> Tuple[Spike, List[Spike]]:
+    """Detection as the list-based Signal.spikes did it before being vectorized"""
+    spikes = [
+        max(succession, key=lambda spike: spike.amp)
+        for succession in _reference_successions(times, amps, tolerence)
+    ]
+    max_amp, stim_index = 0.0, 0
+    for index, spike in enumerate(spikes):
+        if spike.amp > max_amp:
+            max_amp, stim_index = spike.amp, index
+    stim = spikes.pop(stim_index)
+    return stim, spikes
+
+
+def _signals(count: int, length: int = 500) -> List[Tuple[List[float], List[float]]]:
+    """Noisy oscillating signals, some with plateaus of equal samples"""
+    rng = default_rng(0)
+    times = arange(length) / 20.0
+    signals = []
+    for index in range(count):
+        amps = 0.2 * sin(times * (index + 1)) + rng.normal(0, 0.08, length)
+        if index % 3 == 0:
+            amps[100:110] = 0.5
+        if index % 4 == 0:
+            amps -= 0.1
+        signals.append((times.tolist(), amps.round(3).tolist()))
+    return signals
+
+
+def _assert_same(spikes: Spikes, expected: Tuple[Spike, List[Spike]]) -> None:
+    """Spikes equal to the reference stim and rest"""
+    stim, rest = expected
+    assert spikes.stim == stim
+    assert spikes.res == rest
+
+
+@pytest.mark.parametrize("times, amps", _signals(24))
+def test_detect_spikes_matches_list_detection(
+    times: List[float], amps: List[float]
+) -> None:
+    """Same stim and spikes, ties included, as the list-based detection"""
+    expected = _reference_spikes(times, amps, TOLERENCE)
+    spikes = detect_spikes(array(times), array(amps, dtype=float64), TOLERENCE)
+    _assert_same(spikes, expected)
+
+
+def test_detect_spikes_matrix_matches_list_detection() -> None:
+    """Every row of the matrix detection matches the list-based detection"""
+    signals = _signals(24)
+    times = array(signals[0][0])
+    matrix = array([amps for _, amps in signals], dtype=float64)
+    for spikes, (row_times, amps) in zip(
+        detect_spikes_matrix(times, matrix, TOLERENCE), signals
+    ):
+        _assert_same(spikes, _reference_spikes(row_times, amps, TOLERENCE))
+
+
+def test_run_open_at_the_end_is_not_a_spike() -> None:
+    """Samples still above tolerence at the end of the signal are left out"""
+    times = arange(6, dtype=float64)
+    amps = array([0.0, 0.5, 0.0, 0.2, 0.0, 0.9])
+    spikes = detect_spikes(times, amps, TOLERENCE)
+    assert spikes.stim == Spike(amp=0.5, time=1.0)
+    assert spikes.res == [Spike(amp=0.2, time=3.0)]
+
+
+def test_no_spike_raises() -> None:
+    """A signal never above tolerence has no stim"""
+    with pytest.raises(ValueError):
+        detect_spikes(arange(5, dtype=float64), array([0.0] * 5), TOLERENCE)
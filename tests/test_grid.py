@@ -0,0 +1,55 @@
+"""Grid analysis against a normal analysis of every combination"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from pandas import read_csv
+
+from dorsal_ronflex.analyse.grid import analyse_and_save_grid, load_grid
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+
+GRID: Dict[str, List[Any]] = {
+    "default_tolerance": [0.1, 0.3],
+    "segment_start": [5570, 5575],
+}
+
+
+@pytest.mark.parametrize(
+    "options",
+    [StudyOptions(all_channels=True), StudyOptions(mapped=True, sweeps="1:")],
+)
+def test_grid_rows_match_each_combination(
+    study_path: Path, tmp_path: Path, options: StudyOptions
+) -> None:
+    """The rows of every combination and channel are its normal results"""
+    grid_path = tmp_path / "grid.json"
+    grid_path.write_text(json.dumps(GRID))
+    table = read_csv(
+        analyse_and_save_grid([study_path], tmp_path, None, grid_path, options)
+    )
+    groups = table.groupby([*GRID, "ADC Name"])
+    combinations = len(GRID["default_tolerance"]) * len(GRID["segment_start"])
+    channels = AbfStudy(study_path, None, options).channels
+    assert len(groups) == combinations * len(channels)
+    for (tolerance, segment_start, adc_name), rows in groups:
+        overrides = {"default_tolerance": tolerance, "segment_start": segment_start}
+        study = AbfStudy(study_path, None, options, overrides)
+        channel = list(study.header.adcNames).index(adc_name)
+        expected = study.channel_results[channel]
+        assert rows["Sweep Number"].tolist() == [sweep.id for sweep in expected]
+        assert rows["Area"].tolist() == pytest.approx(
+            [sweep.area for sweep in expected]
+        )
+        assert rows["Start Time"].tolist() == pytest.approx(
+            [sweep.event_bondaries[0] for sweep in expected]
+        )
+
+
+def test_unknown_grid_key_is_refused(tmp_path: Path) -> None:
+    """Grid keys must be config keys"""
+    grid_path = tmp_path / "grid.json"
+    grid_path.write_text(json.dumps({"tolerance": [0.1]}))
+    with pytest.raises(ValueError, match="tolerance"):
+        load_grid(grid_path)
@@ -0,0 +1,58 @@
+"""Memory-mapped reading against the sweeps of pyabf"""
+
+from pathlib import Path
+from typing import Tuple
+
+import pytest
+from numpy.testing import assert_array_equal
+from pyabf import ABF
+
+from dorsal_ronflex.analyse.mapped_abf import MappedAbf
+from dorsal_ronflex.analyse.simplified_abf import sweep_window
+from dorsal_ronflex.signals.create_signals import segment_window
+
+INTERVALS = [(0, 10**6), (5570, 5700)]
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+def test_windows_match_pyabf_sweeps(
+    study_path: Path, interval: Tuple[int, int]
+) -> None:
+    """Times and samples of every sweep of every channel, as setSweep reads them"""
+    abf = ABF(study_path)
+    mapped = MappedAbf(study_path)
+    for channel in range(abf.channelCount):
+        for sweep_number in range(abf.sweepCount):
+            abf.setSweep(sweep_number, channel)
+            window = segment_window(abf.sweepX, interval)
+            times, amps = mapped.read_window(sweep_number, channel, interval)
+            assert_array_equal(times, abf.sweepX[window])
+            assert_array_equal(amps, abf.sweepY[window])
+            assert amps.dtype == abf.sweepY.dtype
+
+
+@pytest.mark.parametrize("interval", INTERVALS)
+def test_window_matrix_matches_pyabf_sweeps(
+    study_path: Path, interval: Tuple[int, int]
+) -> None:
+    """Rows of the matrix of a channel, every sweep or a selection of them"""
+    abf = ABF(study_path)
+    mapped = MappedAbf(study_path)
+    for channel in range(abf.channelCount):
+        _, matrix = mapped.read_window_matrix(channel, interval)
+        _, selected = mapped.read_window_matrix(channel, interval, [2, 0])
+        for sweep_number in range(abf.sweepCount):
+            abf.setSweep(sweep_number, channel)
+            window = segment_window(abf.sweepX, interval)
+            assert_array_equal(matrix[sweep_number], abf.sweepY[window])
+        assert_array_equal(selected, matrix[[2, 0]])
+
+
+def test_sweep_window_matches_set_sweep(study_path: Path) -> None:
+    """The samples of a sweep in the channel data are those of setSweep"""
+    abf = ABF(study_path)
+    for channel in range(abf.channelCount):
+        for sweep_number in range(abf.sweepCount):
+            abf.setSweep(sweep_number, channel)
+            samples = abf.data[channel][sweep_window(abf, sweep_number)]
+            assert_array_equal(samples, abf.sweepY)
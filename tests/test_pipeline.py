@@ -0,0 +1,37 @@
+"""Pipelined run against studies handled in turn"""
+
+from pathlib import Path
+from typing import Dict
+
+from dorsal_ronflex.analyse.analysis import (
+    RunOptions,
+    RunSummary,
+    analyse_files,
+    list_studies,
+)
+
+
+def _outputs(output: Path) -> Dict[str, bytes]:
+    """Contents of the files written to output, by relative path"""
+    return {
+        str(path.relative_to(output)): path.read_bytes()
+        for path in sorted(output.rglob("*"))
+        if path.is_file()
+    }
+
+
+def _run(study_dir: Path, output: Path, prefetch: int) -> RunSummary:
+    """Summary of a run of the directory on a single process"""
+    output.mkdir()
+    files = list_studies(study_dir)
+    return analyse_files(files, output, None, run_options=RunOptions(prefetch=prefetch))
+
+
+def test_pipelined_run_matches_studies_in_turn(study_dir: Path, tmp_path: Path) -> None:
+    """Same outputs, successes and failures, a broken study included"""
+    in_turn = _run(study_dir, tmp_path / "in_turn", 0)
+    pipelined = _run(study_dir, tmp_path / "pipelined", 2)
+    assert in_turn.failed and in_turn.succeeded
+    assert pipelined.succeeded == in_turn.succeeded
+    assert pipelined.failed == in_turn.failed
+    assert _outputs(tmp_path / "pipelined") == _outputs(tmp_path / "in_turn")
@@ -0,0 +1,119 @@
+"""Header pre-scan and memory-aware scheduling of the studies"""
+
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from dorsal_ronflex.analyse.analysis import RunOptions, analyse_planned, list_studies
+from dorsal_ronflex.analyse.planner import (
+    PlannedStudy,
+    PlanOptions,
+    StudyHeader,
+    prescan,
+    read_header,
+    take_fitting,
+)
+from dorsal_ronflex.analyse.simplified_abf import StudyOptions
+
+MIB = 2**20
+JOBS = 2
+
+
+@pytest.fixture
+def header(study_path: Path) -> StudyHeader:
+    """Header of a study, shared by the planned studies"""
+    return read_header(study_path)
+
+
+def _planned(header: StudyHeader, *memory_mib: int) -> List[PlannedStudy]:
+    """Studies needing that much memory each"""
+    return [
+        PlannedStudy(header=header, samples=0, memory_bytes=mib * MIB)
+        for mib in memory_mib
+    ]
+
+
+def test_prescan_skips_bad_files_largest_first(study_dir: Path) -> None:
+    """Unreadable files are left out, the others ordered by memory"""
+    files = list_studies(study_dir)
+    plan = prescan(files, None, StudyOptions())
+    assert list(plan.skipped) == [str(study_dir / "broken.abf")]
+    memory = [study.memory_bytes for study in plan.studies]
+    assert memory == sorted(memory, reverse=True)
+    assert {study.path for study in plan.studies} == set(files) - {
+        study_dir / "broken.abf"
+    }
+
+
+@pytest.mark.parametrize(
+    ("options", "protocols", "reason"),
+    [
+        (StudyOptions(channels=(3,)), (), "Channel 3 not available"),
+        (StudyOptions(sweeps="40:"), (), "No sweep selected"),
+        (StudyOptions(), ("other protocol",), "is not analysed"),
+    ],
+)
+def test_prescan_skips_incompatible_studies(
+    study_path: Path, options: StudyOptions, protocols: List[str], reason: str
+) -> None:
+    """Studies the analysis would fail on, or not wanted, are left out"""
+    plan = prescan([study_path], None, options, protocols)
+    assert not plan.studies
+    assert reason in plan.skipped[str(study_path)]
+
+
+def test_estimate_grows_with_the_sweeps(study_dir: Path) -> None:
+    """Memory and samples follow the sweeps analysed at once"""
+    path = study_dir / "study_2.abf"
+    (one_by_one,) = prescan([path], None, StudyOptions(mapped=True)).studies
+    (matrix,) = prescan([path], None, StudyOptions(mapped=True, matrix=True)).studies
+    (selected,) = prescan([path], None, StudyOptions(sweeps="0:2")).studies
+    header = read_header(path)
+    assert matrix.memory_bytes > one_by_one.memory_bytes
+    assert matrix.samples == one_by_one.samples
+    assert selected.samples * header.sweep_count == one_by_one.samples * 2
+
+
+def test_running_studies_stay_within_the_budget(header: StudyHeader) -> None:
+    """Studies start while the budget allows, the others wait for memory"""
+    pending = _planned(header, 600, 300, 200)
+    expected = list(pending)
+    assert take_fitting(pending, 0, 0, 1000 * MIB, 4) == expected[:2]
+    assert not take_fitting(pending, 900 * MIB, 2, 1000 * MIB, 4)
+    assert take_fitting(pending, 0, 0, 1000 * MIB, 4) == expected[2:]
+    assert not pending
+
+
+def test_running_studies_stay_within_the_jobs(header: StudyHeader) -> None:
+    """Without a budget, studies start as jobs get free"""
+    pending = _planned(header, 10, 10, 10, 10)
+    assert len(take_fitting(pending, 10 * MIB, JOBS - 1, None, JOBS)) == 1
+    assert len(take_fitting(pending, 0, 0, None, JOBS)) == JOBS
+    assert len(pending) == 1
+
+
+def test_study_above_the_budget_runs_alone(header: StudyHeader) -> None:
+    """A study needing more than the whole budget only starts on idle jobs"""
+    pending = _planned(header, 2000, 10)
+    huge, small = pending
+    assert take_fitting(pending, 0, 0, 1000 * MIB, 4) == [huge]
+    assert not take_fitting(pending, 2000 * MIB, 1, 1000 * MIB, 4)
+    assert take_fitting(pending, 0, 0, 1000 * MIB, 4) == [small]
+
+
+def test_planned_run_analyses_every_compatible_study(
+    study_dir: Path, tmp_path: Path
+) -> None:
+    """A budgeted run on several jobs analyses the studies the pre-scan kept"""
+    plan = prescan(list_studies(study_dir), None, StudyOptions())
+    planning = PlanOptions(memory_budget=max(s.memory_bytes for s in plan.studies))
+    summary = analyse_planned(
+        plan,
+        tmp_path,
+        None,
+        run_options=RunOptions(jobs=JOBS, planning=planning),
+    )
+    assert sorted(summary.succeeded) == sorted(str(s.path) for s in plan.studies)
+    assert summary.skipped == plan.skipped
+    assert not summary.failed
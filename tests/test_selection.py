@@ -0,0 +1,76 @@
+"""Sweep selections, and studies analysing only the selected sweeps"""
+
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.main import build_parser
+from dorsal_ronflex.sweep.selection import parse_selection, select_sweeps
+
+SWEEP_COUNT = 12
+
+
+@pytest.mark.parametrize(
+    ("selection", "expected"),
+    [
+        ("3", [3]),
+        ("-1", [11]),
+        ("0:3", [0, 1, 2]),
+        ("::5", [0, 5, 10]),
+        ("1,4,10:20:2", [1, 4, 10]),
+        ("::-4", [3, 7, 11]),
+        ("2, 2,1:3", [1, 2]),
+        ("8:", [8, 9, 10, 11]),
+    ],
+)
+def test_selection_is_python_indexing(selection: str, expected: List[int]) -> None:
+    """Indices and slices select like Python, sorted and without repeats"""
+    assert select_sweeps(selection, SWEEP_COUNT) == expected
+
+
+@pytest.mark.parametrize("selection", ["a", "1:2:3:4", "", "1,,2", "::0", "1.5"])
+def test_invalid_syntax_is_refused(selection: str) -> None:
+    """Selections other than indices and slices are refused before any file is
+    opened, by the command line too
+    """
+    with pytest.raises(ValueError, match="Invalid sweep selection"):
+        parse_selection(selection)
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["study.abf", "--sweeps", selection])
+
+
+@pytest.mark.parametrize("selection", ["12", "-13", "0,12"])
+def test_out_of_range_index_is_refused(selection: str) -> None:
+    """Indices beyond the sweeps are errors, slices are clipped like in Python"""
+    with pytest.raises(ValueError, match="for 12 sweeps"):
+        select_sweeps(selection, SWEEP_COUNT)
+    assert select_sweeps("10:100", SWEEP_COUNT) == [10, 11]
+
+
+def test_empty_selection_is_refused() -> None:
+    """A selection of no sweep is an error"""
+    with pytest.raises(ValueError, match="No sweep selected"):
+        select_sweeps("20:", SWEEP_COUNT)
+
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_study_analyses_the_selected_sweeps(study_path: Path, mapped: bool) -> None:
+    """Results of the selected sweeps, as in the analysis of every sweep"""
+    every_sweep = AbfStudy(study_path, None, StudyOptions(mapped=mapped))
+    selected = AbfStudy(study_path, None, StudyOptions(mapped=mapped, sweeps="::-2"))
+    assert [sweep.id for sweep in selected.sweep_results] == [1, 3]
+    assert [sweep.to_dict() for sweep in selected.sweep_results] == [
+        every_sweep.sweep_results[sweep_number].to_dict() for sweep_number in (1, 3)
+    ]
+
+
+def test_exports_stream_the_sweeps_unless_analysed(study_path: Path) -> None:
+    """Exports analyse the sweeps as they go, unless the study is analysed"""
+    study = AbfStudy(study_path)
+    txt = study.to_txt()
+    assert not study.analysed
+    study.analyse()
+    assert study.analysed
+    assert study.to_txt() == txt
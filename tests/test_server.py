@@ -0,0 +1,82 @@
+"""Analysis requests, answered directly and through the server"""
+
+from pathlib import Path
+from threading import Thread
+from typing import Iterator
+
+import pytest
+
+from dorsal_ronflex.analyse.server import AnalysisServer, analyse_request
+from dorsal_ronflex.client import request_analysis
+
+SELECTION = "1:3"
+SELECTED_COUNT = 2
+
+
+@pytest.fixture
+def server_address(tmp_path: Path) -> Iterator[str]:
+    """Address of a server answering on a unix socket"""
+    address = f"unix:{tmp_path / 'server.sock'}"
+    with AnalysisServer(address) as server:
+        thread = Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield address
+        server.shutdown()
+        thread.join()
+
+
+def test_request_results_every_sweep(study_path: Path) -> None:
+    """Results of every sweep of every channel requested"""
+    response = analyse_request(
+        {"path": str(study_path), "channels": [0, 1], "sweeps": SELECTION}
+    )
+    assert response["study"] == study_path.stem
+    assert [channel["adc_name"] for channel in response["channels"]] == [
+        "IN 0",
+        "IN 1",
+    ]
+    for channel in response["channels"]:
+        assert len(channel["sweeps"]) == SELECTED_COUNT
+
+
+def test_request_overrides_the_config(study_path: Path) -> None:
+    """Config overrides change the results"""
+    default = analyse_request({"path": str(study_path)})
+    overridden = analyse_request(
+        {"path": str(study_path), "config": {"default_tolerance": 0.3}}
+    )
+    assert overridden["channels"] != default["channels"]
+
+
+def test_request_cannot_change_the_config_path(
+    study_path: Path, tmp_path: Path
+) -> None:
+    """The config path of a request is ignored, the server's is kept"""
+    config = tmp_path / "config.json"
+    config.write_text('{"default_tolerance": 0.3}')
+    request = {"path": str(study_path)}
+    assert analyse_request({**request, "config_path": str(config)}) == (
+        analyse_request(request)
+    )
+
+
+def test_unknown_config_key_is_an_error(study_path: Path) -> None:
+    """Unknown config keys are refused"""
+    response = analyse_request({"path": str(study_path), "config": {"nope": 1}})
+    assert "nope" in response["error"]
+
+
+def test_missing_file_is_an_error(tmp_path: Path) -> None:
+    """A missing file, or no path at all, gets an error back"""
+    assert "error" in analyse_request({"path": str(tmp_path / "missing.abf")})
+    assert "path" in analyse_request({})["error"]
+
+
+def test_client_gets_the_server_response(server_address: str, study_path: Path) -> None:
+    """The client gets the response of the server, errors included"""
+    request = {"path": str(study_path)}
+    assert request_analysis(server_address, request, timeout=60) == (
+        analyse_request(request)
+    )
+    response = request_analysis(server_address, {"path": "missing.abf"}, timeout=60)
+    assert "error" in response
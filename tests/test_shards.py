@@ -0,0 +1,40 @@
+"""Partition of a tree of studies between shards"""
+
+from pathlib import Path
+from typing import List
+
+import pytest
+from numpy.random import default_rng
+
+from dorsal_ronflex.analyse.shards import Shard, partition, shard_files
+
+
+def _tree(root: Path, count: int = 40) -> List[Path]:
+    """Files of random sizes, some equal, in nested directories"""
+    rng = default_rng(0)
+    files = []
+    for index, size in enumerate(rng.integers(0, 50, count).tolist()):
+        file = root / f"day_{index % 3}" / f"study_{index}.abf"
+        file.parent.mkdir(exist_ok=True)
+        file.write_bytes(bytes(size * 10))
+        files.append(file)
+    return files
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 50])
+def test_shards_are_disjoint_and_cover_the_tree(tmp_path: Path, count: int) -> None:
+    """Every file is in exactly one shard, whatever the number of shards"""
+    files = _tree(tmp_path)
+    shards = partition(files, tmp_path, count)
+    assert len(shards) == count
+    assert sorted(file for shard in shards for file in shard) == sorted(files)
+
+
+def test_shards_do_not_depend_on_the_listing_order(tmp_path: Path) -> None:
+    """Nodes listing the tree in another order process the same shards"""
+    files = _tree(tmp_path)
+    for index in range(1, 4):
+        shard = Shard(index, 3)
+        assert shard_files(files, tmp_path, shard) == shard_files(
+            files[::-1], tmp_path, shard
+        )
@@ -0,0 +1,72 @@
+"""Chunked event streaming against the recording fed in one chunk"""
+
+from typing import Any, List
+
+import pytest
+from numpy import arange, floating, sin
+from numpy.random import default_rng
+from numpy.typing import NDArray
+
+from dorsal_ronflex.signals.stream import EventStream, StreamEvent
+
+MS_PER_SAMPLE = 0.05
+TOLERENCE = 0.2
+MS_DELAY = 2.0
+
+
+def _recording(length: int = 20000) -> NDArray[floating[Any]]:
+    """Noisy oscillating recording, with a plateau above tolerence far longer
+    than ms_delay and a pause of exactly twice ms_delay between two spikes
+    """
+    rng = default_rng(0)
+    amps = 0.3 * sin(arange(length) / 100.0) + rng.normal(0, 0.02, length)
+    amps[5000:9000] = 0.6
+    amps[12000:12200] = 0.0
+    amps[12010], amps[12090] = 0.5, -0.5
+    return amps
+
+
+def _stream(amps: NDArray[floating[Any]], cuts: List[int]) -> List[StreamEvent]:
+    """Events of the recording fed in the chunks between the cuts"""
+    stream = EventStream(MS_PER_SAMPLE, TOLERENCE, MS_DELAY)
+    events = []
+    for start, stop in zip([0, *cuts], [*cuts, len(amps)]):
+        events += stream.feed(amps[start:stop])
+    return events + stream.close()
+
+
+def _assert_same(events: List[StreamEvent], expected: List[StreamEvent]) -> None:
+    """Same events, the areas up to the rounding of the chunked integral"""
+    assert len(events) == len(expected)
+    for event, reference in zip(events, expected):
+        assert event.start_time == reference.start_time
+        assert event.end_time == reference.end_time
+        assert event.peak == reference.peak
+        assert event.spike_count == reference.spike_count
+        assert event.area == pytest.approx(reference.area)
+
+
+@pytest.mark.parametrize(
+    "cuts",
+    [
+        [1, 2, 3],
+        [5000, 5001, 7000, 9000],
+        list(range(100, 20000, 1000)),
+        list(range(37, 20000, 37)),
+    ],
+)
+def test_chunked_stream_matches_single_chunk(cuts: List[int]) -> None:
+    """Chunk boundaries, inside spikes and events included, change no event"""
+    amps = _recording()
+    _assert_same(_stream(amps, cuts), _stream(amps, []))
+
+
+def test_long_spike_keeps_a_bounded_buffer() -> None:
+    """A spike above tolerence over many chunks keeps only ms_delay of samples"""
+    stream = EventStream(MS_PER_SAMPLE, TOLERENCE, MS_DELAY)
+    plateau = _recording()[5000:9000]
+    for _ in range(50):
+        assert not stream.feed(plateau)
+    assert stream.sample_count == 50 * len(plateau)
+    assert len(stream._amps) <= stream.delay_samples + 2
+    assert not stream.close()
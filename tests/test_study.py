@@ -0,0 +1,57 @@
+"""Analysis modes of a study against the per-sweep analysis"""
+
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+
+
+def _results(study_path: Path, options: StudyOptions) -> Dict[int, List[Any]]:
+    """Results of every channel of the study, as exported"""
+    study = AbfStudy(study_path, None, options)
+    return {
+        channel: [sweep.to_dict() for sweep in sweep_results]
+        for channel, sweep_results in study.channel_results.items()
+    }
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        StudyOptions(matrix=True, all_channels=True),
+        StudyOptions(matrix=True, mapped=True, all_channels=True),
+    ],
+)
+def test_matrix_matches_per_sweep(study_path: Path, options: StudyOptions) -> None:
+    """The whole-matrix analysis gives the results of the per-sweep one"""
+    expected = _results(study_path, StudyOptions(all_channels=True))
+    assert _results(study_path, options) == expected
+
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_each_channel_matches_its_own_analysis(study_path: Path, mapped: bool) -> None:
+    """Channels analysed in one pass give the results of each analysed alone"""
+    results = _results(study_path, StudyOptions(mapped=mapped, all_channels=True))
+    assert list(results) == [0, 1]
+    for channel, sweeps in results.items():
+        alone = _results(study_path, StudyOptions(mapped=mapped, channels=(channel,)))
+        assert alone == {channel: sweeps}
+    assert results[0] != results[1]
+
+
+def test_exports_hold_every_channel(study_path: Path) -> None:
+    """One block of the text and rows of the table per channel, in order"""
+    study = AbfStudy(study_path, None, StudyOptions(channels=(1, 0)))
+    table = study.to_df()
+    assert table["ADC Name"].unique().tolist() == ["IN 1", "IN 0"]
+    assert (table["ADC Name"] == "IN 1").sum() == study.sweep_count
+    assert study.to_txt().count("ADC Name: ") == len(study.channels)
+
+
+def test_missing_channel_is_an_error(study_path: Path) -> None:
+    """A channel the file does not have is refused, not read from another"""
+    study = AbfStudy(study_path, None, StudyOptions(channels=(0, 2)))
+    with pytest.raises(ValueError, match="Channel 2 not available"):
+        study.analyse()
@@ -0,0 +1,56 @@
+"""Sweeps analysed on a process pool against the serial analysis"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.analyse.sweep_pool import analyse_shared_sweeps
+from dorsal_ronflex.sweep.create_sweep import create_sweep
+
+JOBS = 2
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        StudyOptions(all_channels=True),
+        StudyOptions(mapped=True, all_channels=True, sweeps="::-1"),
+    ],
+)
+def test_sweep_jobs_match_serial_results(
+    study_dir: Path, options: StudyOptions
+) -> None:
+    """Every channel gives the serial results, in sweep order"""
+    study_path = study_dir / "study_2.abf"
+    serial = AbfStudy(study_path, None, options)
+    parallel = AbfStudy(study_path, None, replace(options, sweep_jobs=JOBS))
+    assert {
+        channel: [sweep.to_dict() for sweep in sweeps]
+        for channel, sweeps in parallel.channel_results.items()
+    } == {
+        channel: [sweep.to_dict() for sweep in sweeps]
+        for channel, sweeps in serial.channel_results.items()
+    }
+
+
+def test_uneven_windows_match_serial_results(study_path: Path) -> None:
+    """Windows of different lengths are split at their own offsets"""
+    study = AbfStudy(study_path)
+    windows = []
+    for sweep_number in study.sweep_numbers:
+        times, amps = study.analysed_window(sweep_number)
+        cut = len(times) - 10 * sweep_number
+        windows.append((times[:cut], amps[:cut]))
+    expected = [
+        create_sweep(sweep_number, times, amps, study.config).to_result().to_dict()
+        for sweep_number, (times, amps) in zip(study.sweep_numbers, windows)
+    ]
+    with ProcessPoolExecutor(max_workers=JOBS) as executor:
+        results = analyse_shared_sweeps(
+            executor, windows, study.sweep_numbers, study.config, JOBS
+        )
+        assert [result.to_dict() for result in results] == expected
+        assert not analyse_shared_sweeps(executor, [], [], study.config, JOBS)
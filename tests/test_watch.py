@@ -0,0 +1,88 @@
+"""Watcher waiting for files to settle and remembering them across restarts"""
+
+from os import utime
+from pathlib import Path
+from shutil import copy2
+from time import time
+
+import pytest
+
+from dorsal_ronflex.analyse.watch import WATCH_CSV_FILENAME, FolderWatcher
+
+SETTLE_SECONDS = 60.0
+
+
+def _age(path: Path, seconds: float = 2 * SETTLE_SECONDS) -> None:
+    """Sets the modification time of the file that many seconds ago"""
+    past = time() - seconds
+    utime(path, (past, past))
+
+
+@pytest.fixture
+def watched(tmp_path: Path) -> Path:
+    """Empty watched directory"""
+    directory = tmp_path / "watched"
+    directory.mkdir()
+    return directory
+
+
+def _watcher(watched: Path) -> FolderWatcher:
+    """Watcher of the directory, its outputs next to it"""
+    output = watched.parent / "output"
+    output.mkdir(exist_ok=True)
+    watcher = FolderWatcher(watched, output, settle_seconds=SETTLE_SECONDS)
+    watcher.load_state()
+    return watcher
+
+
+def test_file_is_ready_once_unchanged_and_settled(
+    study_path: Path, watched: Path
+) -> None:
+    """Ready when seen twice with the same signature, settle_seconds old"""
+    study = Path(copy2(study_path, watched))
+    watcher = _watcher(watched)
+    assert not watcher.ready_files()
+    assert not watcher.ready_files()
+    _age(study)
+    assert not watcher.ready_files()
+    assert watcher.ready_files() == [study]
+
+
+def test_file_still_written_is_not_ready(study_path: Path, watched: Path) -> None:
+    """A file changing between polls waits for two more polls"""
+    study = Path(copy2(study_path, watched))
+    _age(study)
+    watcher = _watcher(watched)
+    assert not watcher.ready_files()
+    with open(study, "ab") as file:
+        file.write(bytes(512))
+    _age(study)
+    assert not watcher.ready_files()
+    assert watcher.ready_files() == [study]
+
+
+def test_restarted_watcher_skips_analysed_files(
+    study_dir: Path, study_path: Path, watched: Path
+) -> None:
+    """Analysed files, failed ones included, are only analysed again once
+    modified, by this watcher or by a restarted one
+    """
+    study = Path(copy2(study_path, watched))
+    broken = Path(copy2(study_dir / "broken.abf", watched))
+    for path in (study, broken):
+        _age(path)
+    watcher = _watcher(watched)
+    watcher.ready_files()
+    watcher.poll()
+    assert set(watcher.analysed) == {str(study), str(broken)}
+    csv = watcher.output / WATCH_CSV_FILENAME
+    rows = csv.read_text().splitlines()
+
+    restarted = _watcher(watched)
+    assert restarted.analysed == watcher.analysed
+    restarted.ready_files()
+    assert not restarted.ready_files()
+    _age(study, SETTLE_SECONDS * 3)
+    restarted.ready_files()
+    restarted.poll()
+    assert csv.read_text().splitlines() == rows + rows[1:]
@@ -0,0 +1,54 @@
+"""Streamed exports against the pandas exports they replaced"""
+
+from pathlib import Path
+
+import pytest
+from numpy import load
+from numpy.testing import assert_array_equal
+from pandas import read_parquet
+
+from dorsal_ronflex.analyse.simplified_abf import AbfStudy, StudyOptions
+from dorsal_ronflex.export.writers import write_channels
+
+PREVIOUS_CSV_HEADER = (
+    ",Study,Sweep Number,ABD Start Time,Protocol,ADC Name,ADC Units,Sweep Count,"
+    "Sweep ID,Sweep ID,Stim,Start Time,End Time,Event Duration,Area,Control Area,"
+    "Ms Delay,Control Area Increment"
+)
+NUMERIC_COLUMNS = ["Sweep Number", "Start Time", "End Time", "Area", "Control Area"]
+
+
+@pytest.fixture
+def study(study_path: Path) -> AbfStudy:
+    """Study analysed on both of its channels"""
+    return AbfStudy(study_path, None, StudyOptions(all_channels=True))
+
+
+def test_txt_and_csv_keep_the_previous_format(study: AbfStudy, tmp_path: Path) -> None:
+    """Same header and rows as the pandas table, same text as to_txt"""
+    write_channels(str(tmp_path), study.iter_channel_sweeps(), ("txt", "csv"))
+    csv = (tmp_path / f"{study.name}.csv").read_text()
+    assert csv.splitlines()[0] == PREVIOUS_CSV_HEADER
+    assert csv == study.to_df().to_csv()
+    assert (tmp_path / f"{study.name}.txt").read_text() == study.to_txt()
+
+
+def test_npz_round_trips(study: AbfStudy, tmp_path: Path) -> None:
+    """The npz arrays hold the values of the table, a row per sweep"""
+    write_channels(str(tmp_path), study.iter_channel_sweeps(), ("npz",))
+    table = study.to_df()
+    with load(tmp_path / f"{study.name}.npz") as arrays:
+        for column in NUMERIC_COLUMNS:
+            assert_array_equal(arrays[column], table[column].to_numpy())
+        assert_array_equal(arrays["ADC Name"], table["ADC Name"].to_numpy())
+        assert arrays["Study"] == study.name
+
+
+def test_parquet_round_trips(study: AbfStudy, tmp_path: Path) -> None:
+    """The parquet table holds the values of the table, a row per sweep"""
+    pytest.importorskip("pyarrow")
+    write_channels(str(tmp_path), study.iter_channel_sweeps(), ("parquet",))
+    table = study.to_df()
+    parquet = read_parquet(tmp_path / f"{study.name}.parquet")
+    for column in [*NUMERIC_COLUMNS, "Study", "ADC Name", "ADC Units"]:
+        assert parquet[column].tolist() == table[column].tolist()